@@ -6,18 +6,465 @@ vibe-coded with Google Gemini
 Simple GUI plotting software with linear fitting.
 """
 
+import time
+_STARTED = time.perf_counter()   # for the time-to-first-interactive metric
+
+import queue
+import sys
+import threading
 import tkinter as tk
-from tkinter import ttk, messagebox, font
-import pandas as pd
-import numpy as np
-import io
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-try:
-    # Scipy is needed for detailed linear regression stats
-    from scipy.stats import linregress
-except ImportError:
-    linregress = None # Set to None if not available
+from tkinter import ttk, messagebox, filedialog, font
+
+import stage_timing
+
+# Matplotlib, pandas and the modules built on them take a second or more to
+# import, so the window is shown first and _import_plotting brings them in
+# afterwards, on a background thread (or right away when something needs them).
+matplotlib = Figure = FigureCanvasTkAgg = NavigationToolbar2Tk = None
+engine = live_stream = smoothing = project_file = derived_columns = columnar_files = None
+
+
+def _import_plotting():
+    """
+    Imports Matplotlib's Tk backend and the plotting, live data, smoothing,
+    project, computed-column and columnar-file modules, once.
+    """
+    global matplotlib, Figure, FigureCanvasTkAgg, NavigationToolbar2Tk, live_stream, smoothing, project_file, \
+        derived_columns, columnar_files, engine
+    if engine is not None:
+        return
+    import matplotlib
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+    import live_stream
+    import smoothing
+    import project_file
+    import derived_columns
+    import columnar_files
+    import plotter_engine
+    # Set last: a module-level engine means everything above is ready.
+    engine = plotter_engine
+
+
+class VirtualColumnList(ttk.Frame):
+    """
+    A scrollable, type-ahead filterable list of column names that only ever
+    creates widgets for `visible_rows` rows, however many columns there are.
+    Scrolling and filtering just point those rows at different columns.
+
+    `make_row(parent)` builds the widgets of one row inside `parent` and
+    returns a function show(col) that re-targets them at column `col`.
+    """
+    def __init__(self, parent, make_row, visible_rows=10, **kwargs):
+        super().__init__(parent, **kwargs)
+        self._columns = []
+        self._lowered = []
+        self._matches = []
+        self._top = 0
+
+        self.filter_var = tk.StringVar()
+        filter_frame = ttk.Frame(self)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(filter_frame, text="Filter:").pack(side='left', padx=(0, 5))
+        ttk.Entry(filter_frame, textvariable=self.filter_var).pack(side='left', fill=tk.X, expand=True)
+        self.filter_var.trace_add('write', lambda *args: self._refilter())
+
+        body = ttk.Frame(self)
+        body.pack(fill=tk.X)
+        self._scrollbar = ttk.Scrollbar(body, orient='vertical', command=self._on_scrollbar, style='Vertical.TScrollbar')
+        self._scrollbar.pack(side='right', fill='y')
+        rows_frame = ttk.Frame(body)
+        rows_frame.pack(side='left', fill=tk.X, expand=True)
+
+        self._rows = []
+        for _ in range(visible_rows):
+            row_frame = ttk.Frame(rows_frame)
+            row_frame.pack(fill=tk.X)
+            self._rows.append((row_frame, make_row(row_frame)))
+        self._packed_rows = visible_rows
+        self._bind_wheel(rows_frame)
+
+        self.count_label = ttk.Label(self, text="")
+        self.count_label.pack(anchor='w')
+
+    def _bind_wheel(self, widget):
+        # The app scrolls the whole control panel on bind_all; returning "break"
+        # from a widget binding keeps the wheel for this list while over it.
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            widget.bind(sequence, self._on_wheel)
+        for child in widget.winfo_children():
+            self._bind_wheel(child)
+
+    def set_columns(self, columns):
+        """Shows a new set of columns, keeping the current filter text."""
+        self._columns = list(columns)
+        self._lowered = [str(col).lower() for col in self._columns]
+        self._refilter()
+
+    def _refilter(self):
+        text = self.filter_var.get().strip().lower()
+        if text:
+            self._matches = [col for col, low in zip(self._columns, self._lowered) if text in low]
+        else:
+            self._matches = self._columns
+        self._top = 0
+        self.refresh()
+
+    def refresh(self):
+        """Re-points every row at the columns currently scrolled into view."""
+        for i, (_, show) in enumerate(self._rows):
+            index = self._top + i
+            show(self._matches[index] if index < len(self._matches) else None)
+
+        # Hide unused rows when there are fewer columns than rows. They are
+        # always at the end, so re-packing them in order keeps the order.
+        wanted = min(len(self._matches), len(self._rows))
+        for row_frame, _ in self._rows[wanted:self._packed_rows]:
+            row_frame.pack_forget()
+        for row_frame, _ in self._rows[self._packed_rows:wanted]:
+            row_frame.pack(fill=tk.X)
+        self._packed_rows = wanted
+        n = max(len(self._matches), 1)
+        self._scrollbar.set(self._top / n, min((self._top + len(self._rows)) / n, 1.0))
+        if len(self._matches) == len(self._columns):
+            self.count_label.config(text=f"{len(self._columns)} columns")
+        else:
+            self.count_label.config(text=f"{len(self._matches)} of {len(self._columns)} columns match")
+
+    def _scroll_to(self, top):
+        top = max(0, min(int(top), len(self._matches) - len(self._rows)))
+        if top != self._top:
+            self._top = top
+            self.refresh()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self._scroll_to(round(float(amount) * len(self._matches)))
+        elif action == 'scroll':
+            step = len(self._rows) if unit == 'pages' else 1
+            self._scroll_to(self._top + int(amount) * step)
+
+    def _on_wheel(self, event):
+        if event.num == 5 or event.delta < 0:
+            self._scroll_to(self._top + 1)
+        elif event.num == 4 or event.delta > 0:
+            self._scroll_to(self._top - 1)
+        return "break"
+
+
+class DataGrid(ttk.Frame):
+    """
+    A spreadsheet-style view of a table that only ever draws the cells in
+    view, so it takes the same time for 10 rows or 10 million. The table is
+    not copied in: set_data gives it the size, the column names and a
+    function get_cells(row_start, row_stop, col_start, col_stop) that
+    returns the text of just those cells, row by row.
+
+    Click or use the arrow keys to move between cells. Double-click, Enter,
+    F2 or typing starts an edit, which is handed to on_edit(row, col, text);
+    Ctrl+C copies a cell and Ctrl+V pastes one, or hands a whole pasted table
+    to on_paste(text).
+    """
+    MIN_COLUMN_WIDTH = 70
+    MAX_COLUMN_WIDTH = 220
+    PAD = 6
+
+    def __init__(self, parent, visible_rows=15, on_paste=None, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.on_paste = on_paste
+        self._font = font.Font(family='Courier New', size=10)
+        self._bold = font.Font(family='Courier New', size=10, weight='bold')
+        self._row_height = self._font.metrics('linespace') + 6
+        self._rows = 0
+        self._columns = []
+        self._widths = {}         # column index -> width in pixels, measured when first shown
+        self._get_cells = None
+        self._on_edit = None
+        self._top = 0             # first row in view
+        self._left = 0            # first column in view
+        self._shown_rows = 0
+        self._shown_columns = 0
+        self._cursor = (0, 0)
+        self._editor = None       # (Entry, row, col) while a cell is being edited
+
+        body = ttk.Frame(self)
+        body.pack(fill=tk.BOTH, expand=True)
+        self.canvas = tk.Canvas(body, height=(visible_rows + 1) * self._row_height, width=50 * self._font.measure('0'),
+                                background='white', highlightthickness=1, takefocus=True)
+        self._vbar = ttk.Scrollbar(body, orient='vertical', style='Vertical.TScrollbar',
+                                   command=lambda *args: self._on_scrollbar('rows', *args))
+        self._hbar = ttk.Scrollbar(self, orient='horizontal',
+                                   command=lambda *args: self._on_scrollbar('columns', *args))
+        self._vbar.pack(side='right', fill='y')
+        self.canvas.pack(side='left', fill=tk.BOTH, expand=True)
+        self._hbar.pack(fill=tk.X)
+        self.count_label = ttk.Label(self, text="")
+        self.count_label.pack(anchor='w')
+
+        self.canvas.bind('<Configure>', lambda event: self.refresh())
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<Double-Button-1>', lambda event: self._on_click(event) or self.start_edit())
+        # Like VirtualColumnList: "break" keeps the wheel (and Enter) from reaching the app-wide bindings.
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(sequence, self._on_wheel)
+        self.canvas.bind('<Key>', self._on_key)
+        for sequence in ('<Control-c>', '<Control-C>', '<Command-c>'):
+            self.canvas.bind(sequence, lambda event: self.copy() or "break")
+        for sequence in ('<Control-v>', '<Control-V>', '<Command-v>'):
+            self.canvas.bind(sequence, lambda event: self.paste() or "break")
+
+    def set_data(self, rows, columns, get_cells, on_edit=None, keep_position=False):
+        """
+        Shows a new table of `rows` rows and `columns`. on_edit=None makes it
+        read-only. keep_position stays at the same place, for a table that
+        has changed rather than been replaced.
+        """
+        self.cancel_edit()
+        if not keep_position or list(columns) != self._columns:
+            self._widths = {}
+        if not keep_position:
+            self._top = self._left = 0
+            self._cursor = (0, 0)
+        self._rows = rows
+        self._columns = list(columns)
+        self._get_cells = get_cells
+        self._on_edit = on_edit
+        self._top = max(0, min(self._top, rows - 1))
+        self._left = max(0, min(self._left, len(self._columns) - 1))
+        self._cursor = (min(self._cursor[0], max(rows - 1, 0)), min(self._cursor[1], max(len(self._columns) - 1, 0)))
+        self.count_label.config(text=f"{rows:,} rows x {len(self._columns):,} columns"
+                                     + ("" if on_edit is not None else " (read-only)"))
+        self.refresh()
+
+    def _width(self, c):
+        if c not in self._widths:
+            width = self._bold.measure(str(self._columns[c])) + 2 * self.PAD
+            self._widths[c] = max(self.MIN_COLUMN_WIDTH, min(width, self.MAX_COLUMN_WIDTH))
+        return self._widths[c]
+
+    def _gutter(self):
+        """Width of the row numbers down the left."""
+        return self._font.measure(f"{self._rows:,}") + 2 * self.PAD
+
+    def _clip(self, text, width):
+        """`text` cut to fit `width` pixels, with an ellipsis if it had to be cut."""
+        if self._font.measure(text) <= width:
+            return text
+        chars = max(1, width // max(self._font.measure('0'), 1) - 1)
+        return text[:chars] + "…"
+
+    def refresh(self):
+        """Redraws the cells in view, fetching only their text."""
+        canvas = self.canvas
+        canvas.delete('grid')
+        if self._get_cells is None:
+            return
+        width = canvas.winfo_width()
+        height = canvas.winfo_height()
+        h = self._row_height
+        gutter = self._gutter()
+
+        self._shown_rows = max(1, height // h - 1)
+        row_stop = min(self._top + self._shown_rows, self._rows)
+        col_stop = self._left
+        x = gutter
+        while col_stop < len(self._columns) and x < width:
+            x += self._width(col_stop)
+            col_stop += 1
+        self._shown_columns = max(1, col_stop - self._left)
+        cells = self._get_cells(self._top, row_stop, self._left, col_stop) if row_stop > self._top else []
+
+        canvas.create_rectangle(0, 0, width, h, fill='#e8e8e8', outline='', tags='grid')
+        canvas.create_rectangle(0, 0, gutter, height, fill='#e8e8e8', outline='', tags='grid')
+        x = gutter
+        lefts = []
+        for c in range(self._left, col_stop):
+            w = self._width(c)
+            lefts.append((x, w))
+            canvas.create_text(x + self.PAD, h / 2, text=self._clip(str(self._columns[c]), w - 2 * self.PAD),
+                               anchor='w', font=self._bold, tags='grid')
+            canvas.create_line(x + w, 0, x + w, height, fill='#d0d0d0', tags='grid')
+            x += w
+        right = x
+        for i, row in enumerate(range(self._top, row_stop)):
+            y = (i + 1) * h
+            canvas.create_text(gutter - self.PAD, y + h / 2, text=f"{row + 1:,}", anchor='e',
+                               font=self._font, fill='#606060', tags='grid')
+            for (x, w), text in zip(lefts, cells[i]):
+                canvas.create_text(x + w - self.PAD, y + h / 2, text=self._clip(text, w - 2 * self.PAD),
+                                   anchor='e', font=self._font, tags='grid')
+            canvas.create_line(0, y + h, right, y + h, fill='#e0e0e0', tags='grid')
+
+        row, col = self._cursor
+        if self._top <= row < row_stop and self._left <= col < col_stop:
+            x, w = lefts[col - self._left]
+            y = (row - self._top + 1) * h
+            canvas.create_rectangle(x, y, x + w, y + h, outline='#1a73e8', width=2, tags='grid')
+
+        rows = max(self._rows, 1)
+        self._vbar.set(self._top / rows, min((self._top + self._shown_rows) / rows, 1.0))
+        columns = max(len(self._columns), 1)
+        self._hbar.set(self._left / columns, min(col_stop / columns, 1.0))
+
+    def _scroll_to(self, top=None, left=None):
+        if top is not None:
+            top = max(0, min(int(top), self._rows - self._shown_rows))
+        if left is not None:
+            left = max(0, min(int(left), len(self._columns) - 1))
+        if (top is not None and top != self._top) or (left is not None and left != self._left):
+            self.cancel_edit()
+            self._top = self._top if top is None else top
+            self._left = self._left if left is None else left
+            self.refresh()
+
+    def _on_scrollbar(self, axis, action, amount, unit=None):
+        total, position, page = ((self._rows, self._top, self._shown_rows) if axis == 'rows'
+                                 else (len(self._columns), self._left, self._shown_columns))
+        if action == 'moveto':
+            position = round(float(amount) * total)
+        elif action == 'scroll':
+            position += int(amount) * (page if unit == 'pages' else 1)
+        self._scroll_to(**{'top' if axis == 'rows' else 'left': position})
+
+    def _on_wheel(self, event):
+        step = 1 if (event.num == 5 or event.delta < 0) else -1
+        if event.state & 0x1:   # Shift: sideways
+            self._scroll_to(left=self._left + step)
+        else:
+            self._scroll_to(top=self._top + 3 * step)
+        return "break"
+
+    def _cell_at(self, x, y):
+        """(row, col) of the cell at canvas coordinates x, y, or None."""
+        row = self._top + int(y // self._row_height) - 1
+        x -= self._gutter()
+        if row < self._top or row >= self._rows or x < 0:
+            return None
+        col = self._left
+        while col < len(self._columns):
+            x -= self._width(col)
+            if x < 0:
+                return row, col
+            col += 1
+        return None
+
+    def _on_click(self, event):
+        self.canvas.focus_set()
+        cell = self._cell_at(event.x, event.y)
+        if cell is not None:
+            self.move_to(*cell)
+
+    def move_to(self, row, col):
+        """Puts the cursor on a cell, scrolling it into view."""
+        self.commit_edit()
+        row = max(0, min(row, self._rows - 1))
+        col = max(0, min(col, len(self._columns) - 1))
+        self._cursor = (row, col)
+        top, left = self._top, self._left
+        if row < top:
+            top = row
+        elif row >= top + self._shown_rows:
+            top = row - self._shown_rows + 1
+        if col < left:
+            left = col
+        elif col >= left + self._shown_columns:
+            left = col - self._shown_columns + 1
+        self._top, self._left = max(top, 0), max(left, 0)
+        self.refresh()
+
+    def _on_key(self, event):
+        row, col = self._cursor
+        moves = {'Up': (row - 1, col), 'Down': (row + 1, col), 'Left': (row, col - 1), 'Right': (row, col + 1),
+                 'Prior': (row - self._shown_rows, col), 'Next': (row + self._shown_rows, col),
+                 'Home': (row, 0), 'End': (row, len(self._columns) - 1), 'Tab': (row, col + 1)}
+        if event.keysym in moves:
+            self.move_to(*moves[event.keysym])
+        elif event.keysym in ('Return', 'KP_Enter', 'F2'):
+            self.start_edit()
+        elif event.keysym in ('Delete', 'BackSpace'):
+            self._edit(row, col, "")
+        elif event.char and event.char.isprintable() and not event.state & 0x4:
+            self.start_edit(event.char)
+        else:
+            return None
+        return "break"
+
+    def _cell_text(self, row, col):
+        return self._get_cells(row, row + 1, col, col + 1)[0][0]
+
+    def start_edit(self, initial=None):
+        """Opens an editor over the cursor's cell, starting from `initial` instead of its text if given."""
+        if self._on_edit is None or not self._rows or not self._columns:
+            return
+        self.cancel_edit()
+        row, col = self._cursor
+        if not (self._top <= row < self._top + self._shown_rows):
+            self.move_to(row, col)
+        x = self._gutter() + sum(self._width(c) for c in range(self._left, col))
+        y = (row - self._top + 1) * self._row_height
+        entry = tk.Entry(self.canvas, font=self._font, relief='solid', borderwidth=1)
+        if initial is None:
+            entry.insert(0, self._cell_text(row, col))
+            entry.select_range(0, tk.END)
+        else:
+            entry.insert(0, initial)
+        self.canvas.create_window(x, y, window=entry, anchor='nw', width=self._width(col),
+                                  height=self._row_height, tags='editor')
+        self._editor = (entry, row, col)
+        entry.focus_set()
+        entry.bind('<Return>', lambda event: self.commit_edit(move=(1, 0)) or "break")
+        entry.bind('<KP_Enter>', lambda event: self.commit_edit(move=(1, 0)) or "break")
+        entry.bind('<Tab>', lambda event: self.commit_edit(move=(0, 1)) or "break")
+        entry.bind('<Escape>', lambda event: self.cancel_edit() or "break")
+        entry.bind('<FocusOut>', lambda event: self.commit_edit())
+
+    def commit_edit(self, move=None):
+        """Hands the text being edited (if any) to on_edit, then moves the cursor by `move`."""
+        if self._editor is None:
+            return
+        entry, row, col = self._editor
+        text = entry.get()
+        self.cancel_edit()
+        self._edit(row, col, text)
+        if move is not None:
+            self.move_to(row + move[0], col + move[1])
+
+    def cancel_edit(self):
+        if self._editor is None:
+            return
+        entry = self._editor[0]
+        self._editor = None
+        self.canvas.delete('editor')
+        entry.destroy()
+        self.canvas.focus_set()
+
+    def _edit(self, row, col, text):
+        if self._on_edit is None or not self._rows:
+            return
+        self._on_edit(row, col, text)
+        self.refresh()
+
+    def copy(self):
+        """Copies the cursor's cell to the clipboard."""
+        if self._rows and self._columns:
+            self.clipboard_clear()
+            self.clipboard_append(self._cell_text(*self._cursor))
+
+    def paste(self):
+        """
+        Pastes the clipboard: a single value goes into the cursor's cell, a
+        table (several lines or columns) goes to on_paste.
+        """
+        try:
+            text = self.clipboard_get()
+        except tk.TclError:
+            return
+        if '\n' in text.strip() or '\t' in text.strip():
+            if self.on_paste is not None:
+                self.on_paste(text)
+        else:
+            self._edit(*self._cursor, text.strip())
+
 
 class DataPlotterApp(tk.Tk):
     """
@@ -25,7 +472,15 @@ class DataPlotterApp(tk.Tk):
     Users can paste data from spreadsheets, select X and Y axes,
     assign uncertainty columns, and generate a plot.
     """
-    def __init__(self):
+    # With more fits than this, fit lines get no legend entries; the results table lists them instead.
+    FIT_LEGEND_LIMIT = 5
+
+    def __init__(self, timing=None, report_startup=False):
+        """
+        timing: False turns stage timing off entirely (default: see
+        stage_timing.ENABLED). report_startup: print the startup times and
+        quit once plotting is ready, for tracking startup time.
+        """
         super().__init__()
         self.title("Hamilton Plotter")
         self.geometry("1200x800")
@@ -39,10 +494,57 @@ class DataPlotterApp(tk.Tk):
 
         # --- Data Storage ---
         self.df = None
+        self.numeric = None   # engine.NumericCache of self.df, rebuilt on every load
+        self._text_table = None   # (separator, rows of cells) of sample or pasted text shown in the grid, not yet loaded
         self.x_axis_var = tk.StringVar()
         self.x_error_var = tk.StringVar()
-        self.y_axis_vars = {}
-        self.y_error_vars = {}
+        self.columns = []
+        self._column_index = {}
+        self.y_selected = set()    # Y columns to plot
+        self.y_error_cols = {}     # Y column -> its uncertainty column, if one was chosen
+        self.derived = None        # derived_columns.DerivedColumns: the computed columns, kept from load to load
+
+        # --- Background loading ---
+        self._load_thread = None
+        self._load_queue = queue.Queue()
+        self._load_cancel = threading.Event()
+
+        # --- Plot state, kept between Generate Plot presses ---
+        self.plot_series = {}      # full-resolution arrays of what is plotted
+        self.errorbars = None      # engine.ErrorbarBatch that draws every plotted series
+        self.series_artists = {}   # legend entry for each plotted Y column
+        self.series_keys = {}      # what each container currently shows
+        self.series_colors = {}
+        self.fit_artists = {}      # y_col -> (x_col, fit line)
+        self.fit_results = None    # (x_col, engine.BatchFit) behind the fit lines, for saving in a project
+        self.smooth_artists = {}   # y_col -> (what it was computed from, smoothed line, full (x, y), view it is thinned for)
+        self._plotted_df = None    # the DataFrame the artists above came from
+        self._labels = None        # (title, x label, y label) last applied
+        self._frame = None         # what the cached background shows
+        self._background = None    # axes without data, for blitting
+        self._lod_limits = None    # axis limits the current decimation was made for
+        self._lod_job = None
+        self._fit_window = None    # the "Linear Fit Results" window, once opened
+
+        # --- Live data ---
+        self._live_source = None   # live_stream.LiveSource being followed, if any
+        self._live_buffer = None   # live_stream.RingBuffer of its newest rows
+        self._live_fit = None      # live_stream.RunningLineFit kept up to date while live
+        self._live_capacity = None
+        self._live_job = None
+
+        # --- Stage timing, for the status bar and trace export ---
+        self.timer = stage_timing.StageTimer(timing)
+        self._load_action = None
+        self.status_bar = None
+
+        # --- Startup: the figure is made once the plotting modules are imported ---
+        self.fig = self.ax = self.canvas = None
+        self._plot_frame = None
+        self._plot_placeholder = None
+        self._report_startup = report_startup
+        self._first_interactive = None   # seconds from start until the window could be used
+        self._import_thread = None
         
         # --- Sample Data Sets ---
         self.sample_data_sets = {
@@ -166,6 +668,7 @@ class DataPlotterApp(tk.Tk):
         self._create_axis_selection_widgets(scrollable_frame)
         self._create_plot_options_widgets(scrollable_frame)
         self._create_action_buttons(scrollable_frame)
+        self._create_live_widgets(scrollable_frame)
 
         # --- Plot Area (Right Side) ---
         plot_frame = ttk.Frame(paned_window, padding="10")
@@ -175,8 +678,11 @@ class DataPlotterApp(tk.Tk):
         # Bind Enter key to generate plot
         self.bind('<Return>', lambda event=None: self.plot_button.invoke())
 
+        # Once the window is up, import the plotting modules in the background and then make the figure.
+        self.after_idle(self._on_first_idle)
+
     def _create_data_input_widgets(self, parent):
-        """Creates the text box for data input."""
+        """Creates the data grid and the ways of getting data into it."""
         ttk.Label(parent, text="1. Paste or Edit Data Below", style='Header.TLabel').pack(anchor='w', pady=(0, 5), fill=tk.X)
         
         # --- Sample Data Dropdown ---
@@ -191,19 +697,59 @@ class DataPlotterApp(tk.Tk):
         sample_combo.set(list(self.sample_data_sets.keys())[0]) # Set default
         sample_combo.bind('<<ComboboxSelected>>', self.on_sample_data_selected)
         
-        # --- Data Text Box ---
-        self.text_data_input = tk.Text(parent, height=15, width=50, undo=True, font=('Courier New', 10))
-        self.text_data_input.pack(fill=tk.X, expand=True)
-        self.on_sample_data_selected() # Load the default sample data
-        
-        ttk.Button(parent, text="Load Data from Text Box", command=self.load_data).pack(pady=10, fill=tk.X)
+        # --- Data Grid ---
+        self.data_grid = DataGrid(parent, visible_rows=15, on_paste=self.paste_data)
+        self.data_grid.pack(fill=tk.X, expand=True)
+        ttk.Label(parent, text="Ctrl+V pastes a table copied from a spreadsheet; double-click a cell to edit it.",
+                  wraplength=380).pack(anchor='w')
+        self.on_sample_data_selected() # Show the default sample data
+
+        load_frame = ttk.Frame(parent)
+        load_frame.pack(fill=tk.X, pady=10)
+        self.load_button = ttk.Button(load_frame, text="Load Data", command=self.load_data)
+        self.load_button.pack(side='left', fill=tk.X, expand=True)
+        self.paste_button = ttk.Button(load_frame, text="Paste", command=self.paste_data)
+        self.paste_button.pack(side='left', padx=(5, 0))
+        self.open_button = ttk.Button(load_frame, text="Open File...", command=self.open_file)
+        self.open_button.pack(side='left', padx=(5, 0))
+
+        project_frame = ttk.Frame(parent)
+        project_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Button(project_frame, text="Open Project...", command=self.open_project).pack(side='left', fill=tk.X, expand=True)
+        ttk.Button(project_frame, text="Save Project...", command=self.save_project).pack(side='left', fill=tk.X, expand=True, padx=(5, 0))
+
+        # --- Loading progress ---
+        progress_frame = ttk.Frame(parent)
+        progress_frame.pack(fill=tk.X, pady=(0, 5))
+        self.load_progress_var = tk.DoubleVar(value=0)
+        ttk.Progressbar(progress_frame, variable=self.load_progress_var, maximum=1.0).pack(side='left', fill=tk.X, expand=True)
+        self.cancel_button = ttk.Button(progress_frame, text="Cancel", command=self.cancel_load, state='disabled')
+        self.cancel_button.pack(side='left', padx=(5, 0))
         
     def on_sample_data_selected(self, event=None):
-        """Loads the selected sample data into the text box."""
+        """Shows the selected sample data in the grid, ready for Load Data."""
         selection = self.sample_data_var.get()
-        data_string = self.sample_data_sets.get(selection, "")
-        self.text_data_input.delete('1.0', tk.END)
-        self.text_data_input.insert('1.0', data_string)
+        self._show_text_table(self.sample_data_sets.get(selection, ""))
+
+    def _show_text_table(self, data_string):
+        """
+        Shows CSV/TSV text in the grid without parsing it (or importing
+        pandas): it is just split into cells, for small tables like the samples.
+        """
+        lines = [line for line in data_string.splitlines() if line.strip() and not line.lstrip().startswith('#')]
+        separator = ',' if any(',' in line for line in lines) else '\t'
+        rows = [line.split(separator) for line in lines] or [[]]
+        self._text_table = (separator, rows)
+        self.data_grid.set_data(len(rows) - 1, rows[0], self._text_table_cells, on_edit=self._edit_text_table)
+
+    def _text_table_cells(self, row_start, row_stop, col_start, col_stop):
+        rows = self._text_table[1][1 + row_start:1 + row_stop]
+        return [[row[c] if c < len(row) else "" for c in range(col_start, col_stop)] for row in rows]
+
+    def _edit_text_table(self, row, col, text):
+        cells = self._text_table[1][1 + row]
+        cells.extend([""] * (col + 1 - len(cells)))
+        cells[col] = text
 
     def _create_axis_selection_widgets(self, parent):
         """Creates frames and widgets for selecting X and Y axes."""
@@ -217,6 +763,35 @@ class DataPlotterApp(tk.Tk):
         self.y_axis_frame.pack(fill=tk.X, pady=5)
         ttk.Label(self.y_axis_frame, text="No data loaded.").pack()
 
+        # The column lists are built on the first load and reused after that.
+        self.x_column_list = None
+        self.y_column_list = None
+
+        # --- Computed columns, worked out from the loaded ones when they are plotted ---
+        computed_frame = ttk.LabelFrame(parent, text="Computed Columns (Optional)", padding="10")
+        computed_frame.pack(fill=tk.X, pady=5)
+        self.computed_name_var = tk.StringVar()
+        self.computed_expression_var = tk.StringVar()
+        ttk.Label(computed_frame, text="Name:").grid(row=0, column=0, sticky='w', padx=5, pady=2)
+        self.computed_combo = ttk.Combobox(computed_frame, textvariable=self.computed_name_var)
+        self.computed_combo.grid(row=0, column=1, sticky='ew', padx=5, pady=2)
+        self.computed_combo.bind('<<ComboboxSelected>>', self._on_computed_selected)
+        ttk.Label(computed_frame, text="Expression:").grid(row=1, column=0, sticky='w', padx=5, pady=2)
+        expression_entry = ttk.Entry(computed_frame, textvariable=self.computed_expression_var)
+        expression_entry.grid(row=1, column=1, sticky='ew', padx=5, pady=2)
+        # Enter adds the column here, rather than generating the plot.
+        expression_entry.bind('<Return>', lambda event: (self.add_computed_column(), "break")[1])
+        buttons = ttk.Frame(computed_frame)
+        buttons.grid(row=2, column=0, columnspan=2, sticky='ew', pady=2)
+        ttk.Button(buttons, text="Add / Update", command=self.add_computed_column).pack(side='left', fill=tk.X, expand=True)
+        ttk.Button(buttons, text="Remove", command=self.remove_computed_column).pack(side='left', padx=(5, 0))
+        ttk.Label(computed_frame, wraplength=380,
+                  text="e.g. diff(`Position (m)`) / diff(`Time (s)`) or log2(`Choices`). Also: + - * / **, "
+                       "log, log10, exp, sqrt, abs, sin, cos, tan, cumsum, shift(x, n), rolling_sum(x, n), "
+                       "rolling_mean(x, n). Uncertainty columns chosen for the columns used are carried "
+                       "into \"<name> uncertainty\".").grid(row=3, column=0, columnspan=2, sticky='w')
+        computed_frame.columnconfigure(1, weight=1)
+
     def _create_plot_options_widgets(self, parent):
         """Creates widgets for plot titles and labels."""
         ttk.Label(parent, text="3. Plot Options (Optional)", style='Header.TLabel').pack(anchor='w', pady=(10, 5), fill=tk.X)
@@ -233,6 +808,25 @@ class DataPlotterApp(tk.Tk):
         ttk.Entry(options_frame, textvariable=self.x_label_var).grid(row=1, column=1, sticky='ew', padx=5, pady=2)
         ttk.Label(options_frame, text="Y-Axis Label:").grid(row=2, column=0, sticky='w', padx=5, pady=2)
         ttk.Entry(options_frame, textvariable=self.y_label_var).grid(row=2, column=1, sticky='ew', padx=5, pady=2)
+
+        self.decimate_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(options_frame, text="Fast drawing for large data (thin to screen resolution)",
+                        variable=self.decimate_var).grid(row=3, column=0, columnspan=2, sticky='w', padx=5, pady=2)
+
+        # --- Smoothed overlay, drawn over each plotted series ---
+        self.smooth_method_var = tk.StringVar(value="None")
+        self.smooth_window_var = tk.IntVar(value=5)
+        ttk.Label(options_frame, text="Smoothing:").grid(row=4, column=0, sticky='w', padx=5, pady=2)
+        smooth_frame = ttk.Frame(options_frame)
+        smooth_frame.grid(row=4, column=1, sticky='ew', padx=5, pady=2)
+        combo = ttk.Combobox(smooth_frame, textvariable=self.smooth_method_var, state='readonly', width=16, values=("None",))
+        # The methods come from the smoothing module, which is imported after startup.
+        combo.config(postcommand=lambda: combo.config(values=("None",) + self._smoothing_methods()))
+        combo.pack(side='left')
+        ttk.Label(smooth_frame, text="Window (points):").pack(side='left', padx=(10, 5))
+        ttk.Spinbox(smooth_frame, textvariable=self.smooth_window_var, from_=1, to=10**6, width=6).pack(side='left')
+        self.smooth_method_var.trace_add('write', lambda *args: self._on_smoothing_changed())
+        self.smooth_window_var.trace_add('write', lambda *args: self._on_smoothing_changed())
         options_frame.columnconfigure(1, weight=1)
 
     def _create_action_buttons(self, parent):
@@ -244,331 +838,1193 @@ class DataPlotterApp(tk.Tk):
         self.fit_button = ttk.Button(parent, text="Perform Linear Fit", command=self.perform_linear_fit)
         self.fit_button.pack(pady=5, fill=tk.X, ipady=10)
 
+        if self.timer.enabled:
+            ttk.Button(parent, text="Export Timing Trace...", command=self.export_timing_trace).pack(pady=5, fill=tk.X)
+
+    def _create_live_widgets(self, parent):
+        """Creates the controls for following a growing file or a socket."""
+        ttk.Label(parent, text="5. Live Data (Optional)", style='Header.TLabel').pack(anchor='w', pady=(20, 5), fill=tk.X)
+        live_frame = ttk.Frame(parent)
+        live_frame.pack(fill=tk.X)
+
+        self.live_source_var = tk.StringVar()
+        self.live_capacity_var = tk.IntVar(value=100000)
+        self.live_fps_var = tk.DoubleVar(value=10)
+
+        ttk.Label(live_frame, text="File or host:port:").grid(row=0, column=0, sticky='w', padx=5, pady=2)
+        ttk.Entry(live_frame, textvariable=self.live_source_var).grid(row=0, column=1, sticky='ew', padx=5, pady=2)
+        ttk.Button(live_frame, text="Browse...", command=self._browse_live_file).grid(row=0, column=2, padx=5, pady=2)
+        ttk.Label(live_frame, text="Keep newest rows:").grid(row=1, column=0, sticky='w', padx=5, pady=2)
+        ttk.Spinbox(live_frame, textvariable=self.live_capacity_var, from_=100, to=10**8, increment=10000).grid(row=1, column=1, sticky='ew', padx=5, pady=2)
+        ttk.Label(live_frame, text="Max frames/s:").grid(row=2, column=0, sticky='w', padx=5, pady=2)
+        ttk.Spinbox(live_frame, textvariable=self.live_fps_var, from_=1, to=60, increment=1).grid(row=2, column=1, sticky='ew', padx=5, pady=2)
+        live_frame.columnconfigure(1, weight=1)
+
+        self.live_button = ttk.Button(parent, text="Start Live", command=self.toggle_live)
+        self.live_button.pack(pady=5, fill=tk.X)
+        self.live_status = ttk.Label(parent, text="")
+        self.live_status.pack(anchor='w')
+
 
     def _create_plot_widgets(self, parent):
-        """Creates the Matplotlib figure and canvas."""
-        self.fig, self.ax = plt.subplots(facecolor='#f0f0f0')
+        """
+        Creates the status bar and a placeholder for the plot; the
+        Matplotlib figure and canvas replace it in _ensure_figure.
+        """
+        self._plot_frame = parent
+        # How long the last action took, stage by stage; also the startup times.
+        self.status_bar = ttk.Label(parent, text="", anchor='w')
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self._plot_placeholder = ttk.Label(parent, text="Plot will appear here", anchor='center')
+        self._plot_placeholder.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+    @staticmethod
+    def _smoothing_methods():
+        """smoothing.SMOOTHING_METHODS, importing the plotting modules if the background import hasn't yet."""
+        _import_plotting()
+        return smoothing.SMOOTHING_METHODS
+
+    def _ensure_figure(self):
+        """Creates the Matplotlib figure, canvas and toolbar the first time they are needed."""
+        if self.fig is not None:
+            return
+        _import_plotting()
+        self.fig = Figure(facecolor='#f0f0f0')
+        self.ax = self.fig.add_subplot()
         self.ax.set_title("Plot will appear here")
         self.ax.grid(True)
-        
-        self.canvas = FigureCanvasTkAgg(self.fig, master=parent)
-        self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-        
-        toolbar = NavigationToolbar2Tk(self.canvas, parent)
+
+        self._plot_placeholder.destroy()
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self._plot_frame)
+        # The toolbar packs itself at the bottom, above the status bar.
+        toolbar = NavigationToolbar2Tk(self.canvas, self._plot_frame)
         toolbar.update()
-        self.canvas._tkcanvas.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-        
+        self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
         self.fig.tight_layout()
 
+    def _on_first_idle(self):
+        """The window is up and responding: note how long that took, and start importing the rest."""
+        self._first_interactive = time.perf_counter() - _STARTED
+        self._show_status(f"Ready in {self._first_interactive:.2f} s")
+        self._import_thread = threading.Thread(target=_import_plotting, daemon=True)
+        self._import_thread.start()
+        self.after(20, self._poll_import)
+
+    def _poll_import(self):
+        """Makes the figure once the background import is done."""
+        if self._import_thread.is_alive():
+            self.after(20, self._poll_import)
+            return
+        self._ensure_figure()
+        self.update_idletasks()
+        plotting_ready = time.perf_counter() - _STARTED
+        # Unless an action finished meanwhile and its timings are showing.
+        if self.status_bar.cget('text').startswith("Ready in"):
+            self._show_status(f"Ready in {self._first_interactive:.2f} s; plotting ready in {plotting_ready:.2f} s")
+        if self._report_startup:
+            print(f"time to first interactive: {self._first_interactive:.3f} s")
+            print(f"time to plotting ready: {plotting_ready:.3f} s")
+            self.destroy()
+
     def load_data(self):
         """
-        Parses the data from the text input using Pandas and updates the UI
-        with column choices for axis selection.
+        Parses the sample or pasted table shown in the grid using Pandas, in
+        the background, and updates the UI with column choices for axis
+        selection once done.
         """
-        data_string = self.text_data_input.get("1.0", tk.END)
+        if self._text_table is None:
+            messagebox.showinfo("Load Data", "The data in the grid is already loaded.\n"
+                                "Paste a table, choose sample data or open a file to load something else.")
+            return
+        separator, rows = self._text_table
+        data_string = "\n".join(separator.join(row) for row in rows)
         if not data_string.strip():
             messagebox.showerror("Error", "Input data is empty.")
             return
-            
-        data_string_no_comments = "\n".join([line for line in data_string.split('\n') if not line.strip().startswith('#')])
 
-        try:
-            data_io = io.StringIO(data_string_no_comments)
-            separator = ',' if ',' in data_string_no_comments else '\t'
-            self.df = pd.read_csv(data_io, sep=separator)
-            self.df = self.df.dropna(how='all')
-            
-            if self.df.empty:
-                raise ValueError("Parsed data is empty.")
-                
-            self.update_axis_selection_ui()
-        except Exception as e:
-            messagebox.showerror("Data Loading Error", f"Could not parse data.\nPlease ensure it is in a valid CSV or tab-separated format with a header row.\n\nError: {e}")
+        self._start_load(lambda **kwargs: engine.parse_data(data_string, **kwargs))
+
+    def paste_data(self, data_string=None):
+        """
+        Loads a table from the clipboard (or `data_string`), e.g. copied from
+        a spreadsheet. It goes straight to the parser in the background, so a
+        paste of any size never has to pass through a widget.
+        """
+        if data_string is None:
+            try:
+                data_string = self.clipboard_get()
+            except tk.TclError:
+                data_string = ""
+        if not data_string.strip():
+            messagebox.showerror("Error", "There is no data on the clipboard.")
+            return
+
+        self._start_load(lambda **kwargs: engine.parse_data(data_string, **kwargs))
+
+    def open_file(self):
+        """
+        Loads a CSV or tab-separated file straight from disk, without pasting
+        it. Parquet, Feather, HDF5, .npz and .npy files are opened with
+        _open_columns instead.
+        """
+        path = filedialog.askopenfilename(
+            parent=self, title="Open Data File",
+            filetypes=[("Data files", "*.csv *.tsv *.txt *.dat"),
+                       ("Columnar files", "*.parquet *.pq *.feather *.arrow *.ipc *.h5 *.hdf5 *.hdf *.npz *.npy"),
+                       ("All files", "*.*")])
+        if not path:
+            return
+        _import_plotting()
+        if columnar_files.is_columnar(path):
+            self._open_columns(path)
+        else:
+            self._start_load(lambda **kwargs: engine.load_file(path, **kwargs))
+
+    def _open_columns(self, path):
+        """
+        Opens a columnar file by reading just its column names and row count;
+        each column is read from the file when it is first plotted, fitted or
+        shown in the grid, so opening takes the same time however big it is.
+        """
+        if self._load_thread is not None:
+            return
+        with self.timer.action("Open Columns") as action:
+            try:
+                with self.timer.stage("read schema"):
+                    source = columnar_files.open_columns(path)
+                    numeric = engine.LazyNumericCache(source)
+            except (OSError, ValueError, ImportError) as e:
+                messagebox.showerror("Data Loading Error", f"Could not open the file.\n\nError: {e}")
+                return
+            self.stop_live()
+            self.df, self.numeric = source.header, numeric
+            self.numeric.attach(self._computed_columns())
+            self._text_table = None
+            with self.timer.stage("column lists"):
+                self.update_axis_selection_ui()
+            with self.timer.stage("data grid"):
+                self._show_data_grid()
+        self._show_timing(action)
+
+    def _start_load(self, parse):
+        """
+        Runs parse(progress=..., cancel_event=...) on a worker thread. The
+        worker never touches Tk; it reports through a queue that the main
+        loop polls in _poll_load.
+        """
+        if self._load_thread is not None:
+            return
+        _import_plotting()
+        self._load_cancel = threading.Event()
+        self._load_queue = queue.Queue()
+        load_queue = self._load_queue
+        action = self._load_action = self.timer.action("Load")
+
+        def work():
+            try:
+                with action.stage("parse"):
+                    df = parse(progress=lambda fraction: load_queue.put(('progress', fraction)),
+                               cancel_event=self._load_cancel)
+                # Coerce every column to numbers here, once, rather than on every plot and fit.
+                with action.stage("numeric coercion"):
+                    numeric = engine.NumericCache(df)
+                load_queue.put(('done', (df, numeric)))
+            except engine.LoadCancelled:
+                load_queue.put(('cancelled', None))
+            except Exception as e:
+                load_queue.put(('error', e))
+
+        self.load_progress_var.set(0)
+        for button in (self.load_button, self.paste_button, self.open_button):
+            button.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        self._load_thread = threading.Thread(target=work, daemon=True)
+        self._load_thread.start()
+        self.after(50, self._poll_load)
+
+    def cancel_load(self):
+        """Asks the running load to stop after its current chunk."""
+        self._load_cancel.set()
+
+    def _poll_load(self):
+        """Shows load progress and, when the worker is finished, the result."""
+        result = None
+        while True:
+            try:
+                kind, value = self._load_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                self.load_progress_var.set(value)
+            else:
+                result = (kind, value)
+
+        if result is None:
+            self.after(50, self._poll_load)
+            return
+
+        self._load_thread = None
+        for button in (self.load_button, self.paste_button, self.open_button):
+            button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+
+        kind, value = result
+        action, self._load_action = self._load_action, None
+        if kind == 'done':
+            self.stop_live()
+            self.load_progress_var.set(1.0)
+            self.df, self.numeric = value
+            self.numeric.attach(self._computed_columns())
+            self._text_table = None
+            with action.stage("column lists"):
+                self.update_axis_selection_ui()
+            with action.stage("data grid"):
+                self._show_data_grid()
+            action.finish()
+            self._show_timing(action)
+        elif kind == 'cancelled':
+            action.finish()
+            self.load_progress_var.set(0)
+        else:
+            action.finish()
+            self.load_progress_var.set(0)
+            messagebox.showerror("Data Loading Error", f"Could not parse data.\nPlease ensure it is in a valid CSV or tab-separated format with a header row.\n\nError: {value}")
             self.df = None
+            self.numeric = None
+
+    def _show_data_grid(self, keep_position=False):
+        """Points the grid at the loaded data. It can be edited unless it is live."""
+        editable = self._live_source is None
+        self.data_grid.set_data(len(self.numeric), self.numeric.columns, self._grid_cells,
+                                on_edit=self._edit_cell if editable else None, keep_position=keep_position)
+
+    def _grid_cells(self, row_start, row_stop, col_start, col_stop):
+        """The grid's text for a block of cells: the parsed DataFrame where there is one, else the numbers."""
+        if len(self.df):
+            return engine.cell_texts(self.df.iloc[row_start:row_stop, col_start:col_stop].to_numpy(dtype=object))
+        columns = self.numeric.columns[col_start:col_stop]
+        return engine.cell_texts(self.numeric.block(columns, slice(row_start, row_stop)).tolist())
+
+    def _edit_cell(self, row, col_index, text):
+        """
+        Puts an edit made in the grid into the data: just that cell of the
+        DataFrame and of the numeric cache, without parsing anything again.
+        Plotted series that use the column, or computed columns built on it,
+        are redrawn; fit lines through them are removed, since they no longer
+        match the data.
+        """
+        col = self.numeric.columns[col_index]
+        with self.timer.action("Edit Cell") as action:
+            try:
+                if len(self.df):
+                    value = engine.set_cell(self.df, row, col_index, text)
+                else:   # a project or live data: only the numbers are kept
+                    value = engine.cell_number(text)
+                changed = self.numeric.set_value(col, row, value)
+            except (ValueError, TypeError) as e:
+                messagebox.showerror("Edit Error", f"Could not change the cell.\n\nError: {e}")
+                return
+            # The computed columns built on `col` changed too.
+            stale = any([self._forget_column(changed_col) for changed_col in changed])
+        if stale:
+            self._replot_forgotten()
+        else:
+            self._show_timing(action)
+
+    def _forget_column(self, col):
+        """
+        Takes the plotted series that use column `col` off the plot, with
+        their smoothed and fit lines, since their data is out of date; the
+        next plot draws them again (see _replot_forgotten). Returns True if
+        any were plotted.
+        """
+        stale = [y_col for y_col, key in self.series_keys.items() if y_col == col or col in key[:3]]
+        for y_col in stale:
+            del self.series_keys[y_col]
+            self.series_artists.pop(y_col, None)
+            self.plot_series.pop(y_col, None)
+            self.errorbars.discard(y_col)
+            if y_col in self.smooth_artists:
+                self.smooth_artists.pop(y_col)[1].remove()
+            if y_col in self.fit_artists:
+                self.fit_artists.pop(y_col)[1].remove()
+                self.fit_results = None
+        return bool(stale)
+
+    def _replot_forgotten(self):
+        """
+        Plots again after _forget_column took series off the plot. If there
+        is nothing to plot, or plotting fails, the plot is shown without them.
+        """
+        if self.x_axis_var.get() and self._selected_y_cols() and self.plot_data():
+            return
+        self.errorbars.update()
+        self._update_legend()
+        self._refresh_canvas()
 
     def update_axis_selection_ui(self):
-        """Clears and repopulates the axis selection widgets based on loaded data."""
+        """
+        Points the axis selection widgets at the loaded columns. Only a
+        screenful of rows is ever built, so this takes the same time for 5
+        columns or 5,000.
+        """
+        if self.df is None:
+            return
+        if self.x_column_list is None:
+            self._build_axis_selection_widgets()
+
+        self.y_selected = set()
+        self.y_error_cols = {}
+        self._set_column_choices()
+
+        self.x_axis_var.set(self.columns[0])
+        self.x_label_var.set(self.columns[0])
+        self.x_error_var.set("None")
+        self.update_y_label()
+
+    def _set_column_choices(self):
+        """
+        Offers the loaded columns followed by the computed ones that can be
+        worked out from them, keeping the choices made for columns still offered.
+        A computed column's propagated uncertainty is its uncertainty column
+        unless another was chosen.
+        """
+        loaded = self.df.columns.tolist()
+        computed = self.derived.columns() if self.derived is not None else []
+        names = set(loaded)
+        self.columns = loaded + [col for col in computed if col not in names]
+        self._column_index = {col: i for i, col in enumerate(self.columns)}
+
+        self.y_selected = {col for col in self.y_selected if col in self._column_index}
+        self.y_error_cols = {col: err for col, err in self.y_error_cols.items() if col in self._column_index}
+        for name in computed:
+            if name + derived_columns.UNCERTAINTY_SUFFIX in self._column_index:
+                self.y_error_cols.setdefault(name, name + derived_columns.UNCERTAINTY_SUFFIX)
+        if self.x_error_var.get() not in self._column_index:
+            self.x_error_var.set("None")
+        if self.columns and self.x_axis_var.get() not in self._column_index:
+            self.x_axis_var.set(self.columns[0])
+        self.x_column_list.set_columns(self.columns)
+        self.y_column_list.set_columns(self.columns)
+
+    def _computed_columns(self):
+        """The session's computed columns (a derived_columns.DerivedColumns), made when first needed."""
+        if self.derived is None:
+            _import_plotting()
+            self.derived = derived_columns.DerivedColumns()
+        return self.derived
+
+    def _uncertainty_of(self, col):
+        """The uncertainty column chosen for `col` as the X or a Y axis, or None."""
+        err = self.x_error_var.get() if col == self.x_axis_var.get() else self.y_error_cols.get(col)
+        return err if err in self._column_index else None
+
+    def _on_computed_selected(self, event=None):
+        """Shows the expression of the computed column picked from the list, for editing."""
+        name = self.computed_name_var.get()
+        if self.derived is not None and name in self.derived.names:
+            self.computed_expression_var.set(self.derived.expression(name).text)
+
+    def add_computed_column(self):
+        """
+        Defines the computed column named in the Computed Columns box, or
+        changes its expression. It is offered with the loaded columns right
+        away but only worked out when it is plotted or fitted. The uncertainty
+        columns now chosen for the columns it uses are propagated into
+        "<name> uncertainty".
+        """
+        derived = self._computed_columns()
+        name = self.computed_name_var.get().strip()
+        try:
+            expression = derived_columns.Expression(self.computed_expression_var.get())
+            errors = {col: self._uncertainty_of(col) for col in expression.columns}
+            changed = derived.define(name, expression, errors)
+        except derived_columns.ExpressionError as e:
+            messagebox.showerror("Computed Column Error", f"Could not add the computed column.\n\nError: {e}")
+            return
+        self.computed_combo['values'] = derived.names
+        if self.numeric is None:
+            return
+
+        missing = [col for col in expression.columns + list(derived.errors(name).values()) if col not in self.numeric]
+        if missing:
+            messagebox.showwarning("Warning", f"{name} is left out until these columns are loaded: " + ", ".join(missing))
+        stale = any([self._forget_column(col) for col in changed])
+        self._set_column_choices()
+        if stale:
+            self._replot_forgotten()
+
+    def remove_computed_column(self):
+        """Removes the computed column named in the Computed Columns box, and takes it off the plot."""
+        name = self.computed_name_var.get().strip()
+        if self.derived is None or name not in self.derived.names:
+            messagebox.showwarning("Warning", f"There is no computed column called {name!r}.")
+            return
+        changed = self.derived.remove(name)
+        self.computed_combo['values'] = self.derived.names
+        self.computed_name_var.set("")
+        self.computed_expression_var.set("")
+        if self.numeric is None:
+            return
+        # Columns built on it are left out too, until it is defined again.
+        stale = any([self._forget_column(col) for col in changed])
+        self._set_column_choices()
+        if stale:
+            self._replot_forgotten()
+
+    def _build_axis_selection_widgets(self):
+        """Replaces the "No data loaded." placeholders with the virtualized column lists."""
+        self._ensure_figure()
         for widget in self.x_axis_frame.winfo_children():
             widget.destroy()
         for widget in self.y_axis_frame.winfo_children():
             widget.destroy()
 
-        if self.df is None:
-            ttk.Label(self.x_axis_frame, text="No data loaded.").pack()
-            ttk.Label(self.y_axis_frame, text="No data loaded.").pack()
-            return
-            
-        columns = self.df.columns.tolist()
-        self.y_axis_vars = {}
-        self.y_error_vars = {}
-
-        # --- Populate X-Axis Frame ---
-        self.x_axis_var.set(columns[0])
-        self.x_label_var.set(columns[0])
-        for col in columns:
-            rb = ttk.Radiobutton(self.x_axis_frame, text=col, variable=self.x_axis_var, value=col, command=lambda c=col: self.x_label_var.set(c))
-            rb.pack(anchor='w')
-            
+        # --- X-Axis Frame ---
+        self.x_column_list = VirtualColumnList(self.x_axis_frame, self._make_x_row, visible_rows=8)
+        self.x_column_list.pack(fill=tk.X)
+
         # Add X Uncertainty Selection
         ttk.Separator(self.x_axis_frame, orient='horizontal').pack(fill='x', pady=10)
         x_err_frame = ttk.Frame(self.x_axis_frame)
         x_err_frame.pack(fill='x', expand=True)
         ttk.Label(x_err_frame, text="Uncertainty Column (Optional):").pack(side='left', padx=(0, 5))
-        
-        self.x_error_var.set("None")
-        error_options = ["None"] + columns
-        x_error_menu = ttk.OptionMenu(x_err_frame, self.x_error_var, *error_options)
-        x_error_menu.pack(side='left', fill='x', expand=True)
-
-        # --- Populate Y-Axis Frame ---
-        y_grid_frame = ttk.Frame(self.y_axis_frame)
-        y_grid_frame.pack(fill=tk.X)
-        ttk.Label(y_grid_frame, text="Plot").grid(row=0, column=0, padx=5)
-        ttk.Label(y_grid_frame, text="Y-Axis Column").grid(row=0, column=1, padx=5, sticky='w')
-        ttk.Label(y_grid_frame, text="Uncertainty Column (Optional)").grid(row=0, column=2, padx=5, sticky='w')
-        
-        for i, col in enumerate(columns):
-            self.y_axis_vars[col] = tk.BooleanVar()
-            
-            def create_toggle_handler(var):
-                def handler(event=None):
-                    var.set(not var.get())
-                    self.update_y_label()
-                return handler
-
-            cb = ttk.Checkbutton(y_grid_frame, variable=self.y_axis_vars[col], command=self.update_y_label)
-            cb.grid(row=i + 1, column=0, padx=5, sticky='w')
-            
-            label = ttk.Label(y_grid_frame, text=col)
-            label.grid(row=i + 1, column=1, sticky='w')
-            label.bind("<Button-1>", create_toggle_handler(self.y_axis_vars[col]))
-
-            self.y_error_vars[col] = tk.StringVar(value="None")
-            error_options = ["None"] + columns
-            error_menu = ttk.OptionMenu(y_grid_frame, self.y_error_vars[col], *error_options)
-            error_menu.grid(row=i + 1, column=2, padx=5, sticky='ew')
-        y_grid_frame.columnconfigure(2, weight=1)
+        self._make_error_picker(x_err_frame, self.x_error_var).pack(side='left', fill='x', expand=True)
+
+        # --- Y-Axis Frame ---
+        header = ttk.Frame(self.y_axis_frame)
+        header.pack(fill=tk.X)
+        ttk.Label(header, text="Plot").pack(side='left', padx=5)
+        ttk.Label(header, text="Y-Axis Column").pack(side='left', padx=5)
+        ttk.Label(header, text="Uncertainty Column (Optional)").pack(side='right', padx=5)
+        self.y_column_list = VirtualColumnList(self.y_axis_frame, self._make_y_row, visible_rows=12)
+        self.y_column_list.pack(fill=tk.X)
+
+    def _make_x_row(self, parent):
+        """One reusable X-axis row: a radio button that is re-pointed at whichever column it shows."""
+        rb = ttk.Radiobutton(parent, variable=self.x_axis_var)
+        rb.pack(anchor='w')
+
+        def show(col):
+            if col is None:
+                rb.config(text="", value="", state='disabled')
+            else:
+                rb.config(text=col, value=col, state='normal',
+                          command=lambda: self.x_label_var.set(col))
+        return show
+
+    def _make_y_row(self, parent):
+        """One reusable Y-axis row: plot checkbox, column name and uncertainty picker."""
+        shown = {'col': None}
+        selected = tk.BooleanVar()
+        error = tk.StringVar(value="None")
+
+        def toggle(event=None):
+            col = shown['col']
+            if col is None:
+                return
+            if event is not None: # clicked the label rather than the checkbox
+                selected.set(not selected.get())
+            if selected.get():
+                self.y_selected.add(col)
+            else:
+                self.y_selected.discard(col)
+            self.update_y_label()
+
+        def error_changed(*args):
+            if shown['col'] is not None:
+                self.y_error_cols[shown['col']] = error.get()
+
+        cb = ttk.Checkbutton(parent, variable=selected, command=toggle)
+        cb.pack(side='left', padx=5)
+        label = ttk.Label(parent, text="", width=24)
+        label.pack(side='left')
+        label.bind("<Button-1>", toggle)
+        picker = self._make_error_picker(parent, error, on_change=error_changed)
+        picker.pack(side='left', fill='x', expand=True, padx=5)
+
+        def show(col):
+            shown['col'] = None # don't write back while re-pointing the row
+            if col is None:
+                selected.set(False)
+                error.set("")
+                label.config(text="")
+                cb.config(state='disabled')
+                picker.config(state='disabled')
+            else:
+                selected.set(col in self.y_selected)
+                error.set(self.y_error_cols.get(col, "None"))
+                label.config(text=col)
+                cb.config(state='normal')
+                picker.config(state='normal')
+            shown['col'] = col
+        return show
+
+    def _make_error_picker(self, parent, variable, on_change=None):
+        """
+        An uncertainty-column combobox whose list is only filled in when it
+        is opened, narrowed to the columns matching what has been typed.
+        Anything typed that is not a column reverts to "None".
+        """
+        combo = ttk.Combobox(parent, textvariable=variable, width=20)
+
+        def populate():
+            text = variable.get().strip().lower()
+            if not text or text == "none" or variable.get() in self._column_index:
+                combo['values'] = ["None"] + self.columns
+            else:
+                combo['values'] = ["None"] + [col for col in self.columns if text in str(col).lower()]
+
+        def commit(event=None):
+            if variable.get() not in self._column_index:
+                variable.set("None")
+            if on_change is not None:
+                on_change()
+
+        combo.config(postcommand=populate)
+        combo.bind('<<ComboboxSelected>>', commit)
+        combo.bind('<FocusOut>', commit)
+        combo.bind('<Return>', commit)
+        return combo
+
+    def _selected_y_cols(self):
+        """The Y columns to plot, in column order."""
+        return sorted(self.y_selected, key=self._column_index.__getitem__)
 
     def update_y_label(self):
         """Automatically updates the Y-axis label based on selected columns."""
-        selected_y = [col for col, var in self.y_axis_vars.items() if var.get()]
-        self.y_label_var.set(", ".join(selected_y))
+        self.y_label_var.set(", ".join(self._selected_y_cols()))
 
     def plot_data(self):
         """
         Retrieves user selections for axes and uncertainties,
-        and generates a plot on the Matplotlib canvas.
+        and generates a plot on the Matplotlib canvas. Returns True if it did.
         """
         if self.df is None:
             messagebox.showwarning("Warning", "Please load data first.")
             return
 
         x_col = self.x_axis_var.get()
-        selected_y_cols = [col for col, var in self.y_axis_vars.items() if var.get()]
+        selected_y_cols = self._selected_y_cols()
 
         if not x_col or not selected_y_cols:
             messagebox.showwarning("Warning", "Please select at least one X and one Y axis.")
             return
 
-        self.ax.clear()
+        if self._plotted_df is not self.df:
+            self._reset_plot()
+
+        x_err_col = self._optional_column(self.x_error_var.get())
+        y_err_cols = {y_col: self._optional_column(self.y_error_cols.get(y_col, "None")) for y_col in selected_y_cols}
+        with self.timer.action("Plot") as action:
+            try:
+                with self.timer.stage("prepare series"):
+                    series = engine.prepare_series(self.numeric, x_col, selected_y_cols, x_err_col, y_err_cols)
+            except Exception as e:
+                messagebox.showerror("Plotting Error", f"An error occurred while preparing the data for plotting.\nCheck that columns are numeric.\n\nError: {e}")
+                return
 
+            with self.timer.stage("artists"):
+                # Drop series that are no longer selected, and fits made against other data.
+                for y_col in [c for c in self.series_artists if c not in series]:
+                    del self.series_artists[y_col]
+                    self.errorbars.discard(y_col)
+                    self.series_keys.pop(y_col, None)   # already gone if its column was forgotten
+                for y_col, (fit_x_col, line) in list(self.fit_artists.items()):
+                    if y_col not in series or fit_x_col != x_col:
+                        line.remove()
+                        del self.fit_artists[y_col]
+
+                # Swap in only the series whose data (or decimation) changed, then redraw
+                # them all as one batch, however many there are.
+                self.plot_series = series
+                view = engine.data_view(self.ax, series) if self.decimate_var.get() else None
+                for y_col, arrays in series.items():
+                    key = (x_col, x_err_col, y_err_cols[y_col],
+                           view if len(arrays[0]) > engine.DECIMATE_THRESHOLD else None)
+                    if self.series_keys.get(y_col) == key:
+                        continue
+                    color = self._series_color(y_col)
+                    self.errorbars.set(y_col, *engine.thin_series(arrays, view), color=color)
+                    self.series_colors[y_col] = color
+                    self.series_keys[y_col] = key
+                self.errorbars.keep(selected_y_cols)
+                self.errorbars.update()
+                self.series_artists = {y_col: self.errorbars.legend_handle(y_col) for y_col in selected_y_cols}
+            with self.timer.stage("smoothing"):
+                self._update_smoothing()
+
+            # Generate Plot always shows all of the data, like a fresh plot would.
+            with self.timer.stage("autoscale"):
+                self.ax.relim()
+                self.ax.set_autoscale_on(True)
+                self.ax.autoscale_view()
+
+            # --- Final Plot Formatting ---
+            labels = (self.plot_title_var.get(), self.x_label_var.get(), self.y_label_var.get())
+            labels_changed = labels != self._labels
+            if labels_changed:
+                self.ax.set_title(labels[0], fontsize=20)
+                self.ax.set_xlabel(labels[1], fontsize=20)
+                self.ax.set_ylabel(labels[2], fontsize=20)
+                self._labels = labels
+            with self.timer.stage("legend"):
+                self._update_legend()
+            self._refresh_canvas(layout_changed=labels_changed)
+            self._lod_limits = (self.ax.get_xlim(), self.ax.get_ylim())
+        self._show_timing(action)
+        return True
+
+    def _reset_plot(self):
+        """Starts an empty plot, e.g. after new data has been loaded."""
+        self.ax.clear()
+        engine.style_axes(self.ax)
+        self.errorbars = engine.ErrorbarBatch(self.ax)
+        self.plot_series = {}
+        self.series_artists = {}
+        self.series_keys = {}
+        self.series_colors = {}
+        self.fit_artists = {}
+        self.fit_results = None
+        self.smooth_artists = {}
+        self._labels = None
+        self._frame = None
+        self._background = None
+        self._plotted_df = self.df
+
+        # ax.clear() drops callbacks, so hook up zoom/pan re-decimation again.
+        self.ax.callbacks.connect('xlim_changed', self._on_view_changed)
+        self.ax.callbacks.connect('ylim_changed', self._on_view_changed)
+
+    def _smoothing_choice(self):
+        """(method, window) of the smoothed overlay, or None when it is off or the window is not valid."""
+        method = self.smooth_method_var.get()
         try:
-            x_data = pd.to_numeric(self.df[x_col], errors='coerce')
-
-            # Get X error data series once
-            x_err_col = self.x_error_var.get()
-            x_err_series = None
-            if x_err_col != "None":
-                x_err_series = pd.to_numeric(self.df[x_err_col], errors='coerce')
-
-            for y_col in selected_y_cols:
-                y_data = pd.to_numeric(self.df[y_col], errors='coerce')
-                
-                valid_indices = x_data.notna() & y_data.notna()
-                x_plot = x_data[valid_indices]
-                y_plot = y_data[valid_indices]
-
-                # Process Y error
-                y_err_col = self.y_error_vars[y_col].get()
-                y_err_data = None
-                if y_err_col != "None":
-                    y_err_data_series = pd.to_numeric(self.df[y_err_col], errors='coerce')
-                    y_err_data = y_err_data_series[valid_indices]
-                
-                # Process X error
-                x_err_data = None
-                if x_err_series is not None:
-                    x_err_data = x_err_series[valid_indices]
-                
-                self.ax.errorbar(x_plot, y_plot, yerr=y_err_data, xerr=x_err_data, fmt='o', 
-                                 capsize=4, label=y_col, alpha=0.8)
-
-        except Exception as e:
-            messagebox.showerror("Plotting Error", f"An error occurred while preparing the data for plotting.\nCheck that columns are numeric.\n\nError: {e}")
-            return
-
-        # --- Final Plot Formatting ---
-        self.ax.set_title(self.plot_title_var.get(), fontsize=20)
-        self.ax.set_xlabel(self.x_label_var.get(), fontsize=20)
-        self.ax.set_ylabel(self.y_label_var.get(), fontsize=20)
-        
-        self.ax.tick_params(axis='both', which='major', labelsize=20)
-        
-        self.ax.legend()
-        self.ax.grid(True, which='both', linestyle='--', linewidth=0.5)
-        
-        self.fig.tight_layout()
-        self.canvas.draw()
-
-    def _get_y_col_for_fit(self, y_cols):
-        """Handles the logic of selecting a Y column for fitting, using a popup if necessary."""
-        if not y_cols:
+            window = int(self.smooth_window_var.get())
+        except (tk.TclError, ValueError):
             return None
-        if len(y_cols) == 1:
-            return y_cols[0]
-
-        # Create a popup window to ask the user
-        popup = tk.Toplevel(self)
-        popup.title("Select Y-Axis for Fit")
-        popup.geometry("300x200")
-        ttk.Label(popup, text="Multiple Y-axes are plotted.\nPlease select one to fit:").pack(pady=10)
-
-        selected_y = tk.StringVar()
-        selected_y.set(y_cols[0])
-
-        for col in y_cols:
-            ttk.Radiobutton(popup, text=col, variable=selected_y, value=col).pack(anchor='w', padx=20)
-        
-        # This function will be called when the user clicks OK
-        def on_ok():
-            popup.result = selected_y.get()
-            popup.destroy()
-        
-        # This function will be called if the user closes the window
-        def on_cancel():
-            popup.result = None
-            popup.destroy()
+        if method not in smoothing.SMOOTHING_METHODS or window < 1:
+            return None
+        return method, window
 
-        ok_button = ttk.Button(popup, text="OK", command=on_ok)
-        ok_button.pack(pady=10)
-        popup.protocol("WM_DELETE_WINDOW", on_cancel)
+    def _update_smoothing(self, changed=()):
+        """
+        Keeps one smoothed line over each plotted series. A line is only
+        recomputed when its series' columns, the method or the window changed,
+        or when its Y column is in `changed` (new live data).
+        """
+        choice = self._smoothing_choice()
+        for y_col in list(self.smooth_artists):
+            if choice is None or y_col not in self.series_artists:
+                self.smooth_artists.pop(y_col)[1].remove()
+        if choice is None:
+            return
 
-        # Wait for the popup to close
-        popup.grab_set()
-        self.wait_window(popup)
+        for y_col in self.series_artists:
+            key = (self.series_keys[y_col][:3], choice)
+            old = self.smooth_artists.get(y_col)
+            if old is not None and old[0] == key and y_col not in changed:
+                if old[3] != self.series_keys[y_col][3]:
+                    self._thin_smoothed(y_col)
+                continue
+            x, y, _, _ = self.plot_series[y_col]
+            try:
+                y_smooth = smoothing.smooth(y, *choice)
+            except ValueError: # e.g. a Savitzky-Golay window longer than the data
+                y_smooth = None
+            if old is not None:
+                old[1].remove()
+                del self.smooth_artists[y_col]
+            if y_smooth is not None:
+                line = engine.plot_smoothed(self.ax, [], [], color=self.series_colors[y_col])
+                self.smooth_artists[y_col] = (key, line, (x, y_smooth), None)
+                self._thin_smoothed(y_col)
+
+    def _thin_smoothed(self, y_col):
+        """
+        Puts the smoothed line of `y_col` on screen thinned for the view its
+        series is decimated for (keeping the same min/max envelope), so a
+        long series' overlay isn't drawn point for point.
+        """
+        key, line, (x, y_smooth), _ = self.smooth_artists[y_col]
+        view = self.series_keys[y_col][3]
+        line.set_data(*engine.thin_line(x, y_smooth, view))
+        self.smooth_artists[y_col] = (key, line, (x, y_smooth), view)
+
+    def _on_smoothing_changed(self):
+        """Redraws the smoothed overlays right away when the method or window changes."""
+        if self.series_artists:
+            self._update_smoothing()
+            self._refresh_canvas()
+
+    def _series_color(self, y_col):
+        """Keeps a series' color stable; new series get the first cycle color not already in use."""
+        if y_col in self.series_colors:
+            return self.series_colors[y_col]
+        cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+        in_use = {self.series_colors[c] for c in self.errorbars if c in self.series_colors}
+        unused = [c for c in cycle if c not in in_use]
+        return unused[0] if unused else cycle[len(self.errorbars) % len(cycle)]
+
+    def _update_legend(self):
+        """Legend with the plotted series in column order, then the fit lines."""
+        handles = list(self.series_artists.values()) + [line for _, line in self.fit_artists.values()]
+        handles = [h for h in handles if not h.get_label().startswith('_')]
+        self.ax.legend(handles, [h.get_label() for h in handles])
+
+    def _dynamic_artists(self):
+        """Everything that changes between redraws: data, error bars, fit lines and the legend."""
+        artists = list(self.ax.lines) + list(self.ax.collections)
+        if self.ax.get_legend() is not None:
+            artists.append(self.ax.get_legend())
+        return sorted(artists, key=lambda a: a.get_zorder())
+
+    def _refresh_canvas(self, layout_changed=False):
+        """
+        Shows the current plot. When the axes, ticks and labels look the same
+        as last time, the cached background is restored and only the data
+        artists are redrawn and blitted; otherwise the background is redrawn
+        (with tight_layout only if the labels changed) and cached again.
+        """
+        frame = (self.ax.get_xlim(), self.ax.get_ylim(), self._labels, self.canvas.get_width_height())
+        dynamic = self._dynamic_artists()
+
+        if layout_changed or frame != self._frame or self._background is None:
+            if layout_changed:
+                with self.timer.stage("tight_layout"):
+                    self.fig.tight_layout()
+                frame = (self.ax.get_xlim(), self.ax.get_ylim(), self._labels, self.canvas.get_width_height())
+            for artist in dynamic:
+                artist.set_visible(False)
+            with self.timer.stage("canvas.draw"):
+                self.canvas.draw()
+                self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+            self._frame = frame
+            for artist in dynamic:
+                artist.set_visible(True)
+        else:
+            self.canvas.restore_region(self._background)
+
+        with self.timer.stage("draw artists", artists=len(dynamic)):
+            for artist in dynamic:
+                self.ax.draw_artist(artist)
+            self.canvas.blit(self.fig.bbox)
+
+    def _is_decimated(self):
+        """True if any plotted series is long enough to be drawn thinned."""
+        return self.decimate_var.get() and any(len(x) > engine.DECIMATE_THRESHOLD
+                                               for x, _, _, _ in self.plot_series.values())
+
+    def _on_view_changed(self, ax):
+        """Zoom or pan happened; re-decimate once things settle rather than on every motion event."""
+        if self._lod_job is None and self._is_decimated():
+            self._lod_job = self.after(100, self._redecimate)
+
+    def _redecimate(self):
+        """Redraws the thinned series from the full-resolution data for the current view."""
+        self._lod_job = None
+        xlim, ylim = self.ax.get_xlim(), self.ax.get_ylim()
+        if (xlim, ylim) == self._lod_limits or not self._is_decimated():
+            return
+        self._lod_limits = (xlim, ylim)
+
+        # Decimate one view-width beyond each side so a short pan has data to show right away.
+        width = xlim[1] - xlim[0]
+        bbox = self.ax.get_window_extent()
+        view = ((xlim[0] - width, xlim[1] + width), ylim, 3 * bbox.width, bbox.height)
+
+        for y_col, arrays in self.plot_series.items():
+            if len(arrays[0]) <= engine.DECIMATE_THRESHOLD:
+                continue
+            thinned = engine.thin_series(arrays, view)
+            self.errorbars.set(y_col, *thinned, color=self.series_colors[y_col])
+            self.series_keys[y_col] = self.series_keys[y_col][:3] + (view,)
+            if y_col in self.smooth_artists:
+                self._thin_smoothed(y_col)
+        self.errorbars.update()
+        self.canvas.draw_idle()
 
-        return getattr(popup, 'result', None)
-    
     def _format_fit_parameter(self, value, uncertainty):
         """
         Formats a value and its uncertainty according to scientific best practices.
-        - The uncertainty is rounded to two significant figures.
-        - The value is rounded to the same decimal place as the uncertainty.
-        - Switches to scientific notation for very large or small numbers.
-        """
-        if uncertainty is None or uncertainty <= 0 or not np.isfinite(uncertainty):
-            return f"{value:.4g} ± {uncertainty:.2g}"
-
-        # Determine the number of decimal places from the uncertainty
-        exponent = np.floor(np.log10(np.abs(uncertainty)))
-        decimal_places = int(-exponent + 1) # For 2 significant figures in uncertainty
-
-        # Use scientific notation if the value is very large or small
-        value_exponent = np.floor(np.log10(np.abs(value))) if value != 0 else 0
-        if value_exponent < -3 or value_exponent > 4:
-            # Format in scientific notation
-            norm_value = value / (10**value_exponent)
-            norm_uncertainty = uncertainty / (10**value_exponent)
-            
-            norm_exponent = np.floor(np.log10(np.abs(norm_uncertainty)))
-            norm_decimal_places = int(-norm_exponent + 1)
-            
-            val_str = f"{norm_value:.{norm_decimal_places}f}"
-            err_str = f"{norm_uncertainty:.{norm_decimal_places}f}"
-            
-            return f"({val_str} ± {err_str})e{int(value_exponent)}"
-
-        # Use fixed-point notation for "normal" sized numbers
-        if decimal_places >= 0:
-            return f"{value:.{decimal_places}f} ± {uncertainty:.{decimal_places}f}"
-        else: # Handle rounding for numbers > 10 (decimal_places is negative)
-            rounded_value = round(value, decimal_places)
-            rounded_uncertainty = round(uncertainty, decimal_places)
-            return f"{rounded_value:.0f} ± {rounded_uncertainty:.0f}"
+        See plotter_engine.format_fit_parameter.
+        """
+        return engine.format_fit_parameter(value, uncertainty)
 
+    @staticmethod
+    def _optional_column(choice):
+        """Maps the "None" entry of an uncertainty menu to None."""
+        return None if choice == "None" else choice
 
     def perform_linear_fit(self):
-        """Performs a linear regression on the plotted data and displays it."""
-        if linregress is None:
-            messagebox.showerror("Dependency Missing", "The 'scipy' library is required for detailed linear fitting.\nPlease install it by running:\n\npip install scipy")
-            return
-
+        """
+        Fits every plotted Y column at once, each weighted by the uncertainty
+        columns it was plotted with, and draws the fit lines.
+        """
         if self.df is None:
             messagebox.showwarning("Warning", "Please load and plot data first.")
             return
 
-        if not self.ax.lines and not self.ax.collections:
+        if not self.series_artists:
             messagebox.showwarning("Warning", "Please generate a plot before fitting.")
             return
-            
-        x_col = self.x_axis_var.get()
-        selected_y_cols = [col for col, var in self.y_axis_vars.items() if var.get()]
-        
-        y_col_to_fit = self._get_y_col_for_fit(selected_y_cols)
 
-        if not y_col_to_fit:
-            # User cancelled the popup or there were no y-cols
-            if len(selected_y_cols) > 1:
-                messagebox.showinfo("Fit Cancelled", "Linear fit was cancelled.")
-            elif not selected_y_cols:
-                 messagebox.showwarning("Warning", "No Y-axis selected to fit.")
-            return
+        # Fit exactly what is plotted, with the uncertainty columns it was plotted with.
+        y_cols = list(self.series_artists)
+        x_col, x_err_col = self.series_keys[y_cols[0]][:2]
+        y_err_cols = {y_col: self.series_keys[y_col][2] for y_col in y_cols}
+
+        with self.timer.action("Fit") as action:
+            try:
+                with self.timer.stage("fit", columns=len(y_cols)):
+                    fits = engine.batch_linear_fit(self.numeric, x_col, y_cols, x_err_col, y_err_cols)
+
+                # Replace earlier fit lines with the new ones, then redraw canvas
+                with self.timer.stage("fit lines"):
+                    self._draw_fit_lines(x_col, fits)
+                self._live_fit = None
+                used = {x_col, *y_cols, *y_err_cols.values()} - {None}
+                if (self._live_buffer is not None and used <= set(self._live_buffer.columns)
+                        and live_stream.RunningLineFit.follows(y_cols, y_err_cols, x_err_col)):
+                    # While live, keep these fits up to date as rows arrive and leave the buffer.
+                    # (Not for computed columns or X uncertainties, which the running sums can't follow.)
+                    with self.timer.stage("running fit"):
+                        self._live_fit = live_stream.RunningLineFit(self._live_buffer.columns, x_col, y_cols,
+                                                                    y_err_cols, x_err_col)
+                        self._live_fit.add(self._live_buffer.view())
+                with self.timer.stage("legend"):
+                    self._update_legend()
+                self._refresh_canvas()
+            except Exception as e:
+                messagebox.showerror("Fit Error", f"An error occurred during the linear fit.\n\nError: {e}")
+                return
 
+            if len(y_cols) > 1:
+                with self.timer.stage("results table"):
+                    self._show_fit_table(fits)
+        self._show_timing(action)
+        too_few = [y_col for y_col, n in zip(y_cols, fits.n) if n < 2]
+        if too_few:
+            messagebox.showerror("Fit Error", "Need at least two data points to perform a linear fit.\n\nNot fitted: " + ", ".join(too_few))
+
+    def _draw_fit_lines(self, x_col, fits):
+        """Replaces the fit lines with those of `fits` (a BatchFit against `x_col`), for its plotted columns."""
+        for _, line in self.fit_artists.values():
+            line.remove()
+        self.fit_artists = {}
+        self.fit_results = (x_col, fits)
+        show_labels = len(fits.y_cols) <= self.FIT_LEGEND_LIMIT
+        for y_col, n in zip(fits.y_cols, fits.n):
+            if n < 2 or y_col not in self.series_artists:
+                continue
+            color = 'red' if len(fits.y_cols) == 1 else self.series_colors[y_col]
+            line = engine.plot_fit(self.ax, y_col, fits.fit(y_col), legend=False, color=color, label=show_labels)
+            self.fit_artists[y_col] = (x_col, line)
+
+    def _show_fit_table(self, fits):
+        """Lists all fit results in one window, reusing it if it is already open."""
+        if self._fit_window is None or not self._fit_window.winfo_exists():
+            self._fit_window = tk.Toplevel(self)
+            self._fit_window.title("Linear Fit Results")
+            self._fit_window.geometry("800x400")
+            columns = ("slope", "intercept", "r2", "chi2", "n", "note")
+            tree = ttk.Treeview(self._fit_window, columns=columns, show='tree headings')
+            tree.heading('#0', text="Y column")
+            for col, text in zip(columns, ("Slope", "Intercept", "R²", "Reduced χ²", "N", "Note")):
+                tree.heading(col, text=text)
+                tree.column(col, width=120, anchor='w' if col == "note" else 'e')
+            scrollbar = ttk.Scrollbar(self._fit_window, orient='vertical', command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side='right', fill='y')
+            tree.pack(fill=tk.BOTH, expand=True)
+            self._fit_tree = tree
+
+        self._fit_tree.delete(*self._fit_tree.get_children())
+        for i, y_col in enumerate(fits.y_cols):
+            if fits.n[i] < 2:
+                values = ("", "", "", "", fits.n[i], "")
+            else:
+                chi2 = f"{fits.reduced_chi2[i]:.3g}" if fits.weighted[i] else "—"
+                note = fits.note[i] if fits.note is not None else ""
+                values = (self._format_fit_parameter(fits.slope[i], fits.slope_stderr[i]),
+                          self._format_fit_parameter(fits.intercept[i], fits.intercept_stderr[i]),
+                          f"{fits.r_squared[i]:.4f}", chi2, fits.n[i], f"Unweighted: {note}" if note else "")
+            self._fit_tree.insert('', 'end', text=y_col, values=values)
+        self._fit_window.lift()
+
+    def _plot_state(self):
+        """The axis choices, labels and options, as saved in a project file."""
         try:
-            x_data = pd.to_numeric(self.df[x_col], errors='coerce')
-            y_data = pd.to_numeric(self.df[y_col_to_fit], errors='coerce')
-
-            valid_indices = x_data.notna() & y_data.notna()
-            x_clean = x_data[valid_indices]
-            y_clean = y_data[valid_indices]
+            window = int(self.smooth_window_var.get())
+        except (tk.TclError, ValueError):
+            window = 5
+        return {'computed': self.derived.definitions() if self.derived is not None else [],
+                'x_col': self.x_axis_var.get(), 'x_err_col': self.x_error_var.get(),
+                'y_cols': self._selected_y_cols(),
+                'y_err_cols': {col: err for col, err in self.y_error_cols.items() if err in self._column_index},
+                'title': self.plot_title_var.get(), 'x_label': self.x_label_var.get(),
+                'y_label': self.y_label_var.get(), 'decimate': bool(self.decimate_var.get()),
+                'smoothing': [self.smooth_method_var.get(), window], 'plotted': bool(self.series_artists)}
+
+    def _apply_plot_state(self, state):
+        """Restores what _plot_state saved, for the columns that exist."""
+        columns = self._column_index
+        if state.get('x_col') in columns:
+            self.x_axis_var.set(state['x_col'])
+        self.x_error_var.set(state['x_err_col'] if state.get('x_err_col') in columns else "None")
+        self.y_selected = {col for col in state.get('y_cols', []) if col in columns}
+        self.y_error_cols = {col: err for col, err in state.get('y_err_cols', {}).items()
+                             if col in columns and err in columns}
+        self.x_column_list.refresh()
+        self.y_column_list.refresh()
+        self.plot_title_var.set(state.get('title', ""))
+        self.x_label_var.set(state.get('x_label', self.x_axis_var.get()))
+        self.y_label_var.set(state.get('y_label', ""))
+        self.decimate_var.set(state.get('decimate', True))
+        method, window = state.get('smoothing', ["None", 5])
+        self.smooth_window_var.set(window)
+        self.smooth_method_var.set(method)
+
+    def save_project(self):
+        """
+        Saves the loaded data (as numbers), the axis choices, labels and
+        options, and the fits on the plot to a project file.
+        """
+        if self.numeric is None:
+            messagebox.showwarning("Warning", "Please load data first.")
+            return
+        path = filedialog.asksaveasfilename(
+            parent=self, title="Save Project", defaultextension=project_file.PROJECT_SUFFIX,
+            filetypes=[("HamiltonPlotter project", "*" + project_file.PROJECT_SUFFIX), ("All files", "*.*")])
+        if not path:
+            return
+        columns = self.numeric.columns
+        fits = self.fit_results if self.fit_artists else None
+        try:
+            with self.timer.action("Save Project") as action:
+                project_file.save_project(path, columns, self.numeric.iter_columns(columns), self._plot_state(), fits)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Project Error", f"Could not save the project.\n\nError: {e}")
+            return
+        self._show_timing(action)
 
-            if len(x_clean) < 2:
-                messagebox.showerror("Fit Error", "Need at least two data points to perform a linear fit.")
+    def open_project(self):
+        """
+        Reopens a project file: the data is memory-mapped rather than parsed,
+        and the plot and its fits come back as they were saved.
+        """
+        if self._load_thread is not None:
+            return
+        _import_plotting()
+        path = filedialog.askopenfilename(
+            parent=self, title="Open Project",
+            filetypes=[("HamiltonPlotter project", "*" + project_file.PROJECT_SUFFIX), ("All files", "*.*")])
+        if not path:
+            return
+        with self.timer.action("Open Project") as action:
+            try:
+                with self.timer.stage("map data"):
+                    project = project_file.open_project(path)
+                    numeric = engine.NumericCache.from_block(project.columns, project.values)
+            except (OSError, ValueError, KeyError) as e:
+                messagebox.showerror("Project Error", f"Could not open the project.\n\nError: {e}")
                 return
-
-            # Perform linear regression using scipy to get detailed stats
-            res = linregress(x_clean, y_clean)
-            slope = res.slope
-            intercept = res.intercept
-            r_squared = res.rvalue**2
-            slope_stderr = res.stderr
-            intercept_stderr = res.intercept_stderr
-
-            x_fit = np.linspace(x_clean.min(), x_clean.max(), 100)
-            y_fit = slope * x_fit + intercept
-            
-            # Format the parameters using the new method
-            slope_str = self._format_fit_parameter(slope, slope_stderr)
-            intercept_str = self._format_fit_parameter(intercept, intercept_stderr)
-
-            # Create the detailed label for the legend
-            fit_label = (
-                f"Fit for '{y_col_to_fit}'\n"
-                f"y = ({slope_str})x + ({intercept_str})\n"
-                f"$R^2$ = {r_squared:.4f}"
-            )
-            
-            # Plot the fit line with the new detailed label
-            self.ax.plot(x_fit, y_fit, color='red', label=fit_label)
-            
-            # Update legend and redraw canvas
-            self.ax.legend()
-            self.canvas.draw()
-            
+            self.stop_live()
+            self.df, self.numeric = project.header, numeric
+            self.numeric.attach(self._computed_columns())
+            self._text_table = None
+            with self.timer.stage("column lists"):
+                if 'computed' in project.state:
+                    self.derived.load(project.state['computed'])
+                    self.computed_combo['values'] = self.derived.names
+                self.update_axis_selection_ui()
+                self._apply_plot_state(project.state)
+            with self.timer.stage("data grid"):
+                self._show_data_grid()
+        self._show_timing(action)
+
+        if project.state.get('plotted') and self.y_selected:
+            self.plot_data()
+            if project.fits is not None and self.series_artists:
+                x_col, fits = project.fits
+                if x_col == self.x_axis_var.get():
+                    self._draw_fit_lines(x_col, fits)
+                    self._update_legend()
+                    self._refresh_canvas()
+
+    def _show_status(self, text):
+        self.status_bar.config(text=text)
+
+    def _show_timing(self, action):
+        """Puts how long `action` took, stage by stage, in the status bar."""
+        if self.timer.enabled:
+            self._show_status(action.summary())
+
+    def export_timing_trace(self):
+        """Saves every timed action and stage of this session as a Chrome trace (chrome://tracing, Perfetto)."""
+        path = filedialog.asksaveasfilename(
+            parent=self, title="Export Timing Trace", defaultextension=".json",
+            filetypes=[("Chrome trace", "*.json"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            self.timer.save_trace(path)
+        except OSError as e:
+            messagebox.showerror("Export Error", f"Could not save the timing trace.\n\nError: {e}")
+
+    def _browse_live_file(self):
+        """Picks a file to follow in live mode."""
+        path = filedialog.askopenfilename(
+            parent=self, title="Follow Data File",
+            filetypes=[("Data files", "*.csv *.tsv *.txt *.dat"), ("All files", "*.*")])
+        if path:
+            self.live_source_var.set(path)
+
+    def toggle_live(self):
+        if self._live_source is None:
+            self.start_live()
+        else:
+            self.stop_live()
+
+    def start_live(self):
+        """
+        Starts following the file or socket named in the Live Data box. Rows
+        are shown as they arrive, redrawing at most "Max frames/s" times a
+        second and keeping only the newest "Keep newest rows" rows.
+        """
+        spec = self.live_source_var.get().strip()
+        if not spec:
+            messagebox.showwarning("Warning", "Please enter a file to follow, or a host:port or unix:/path socket.")
+            return
+        try:
+            capacity = int(self.live_capacity_var.get())
+            if capacity < 1:
+                raise ValueError("Keep at least one row.")
+            _import_plotting()
+            source = live_stream.open_source(spec)
         except Exception as e:
-            messagebox.showerror("Fit Error", f"An error occurred during the linear fit.\n\nError: {e}")
+            messagebox.showerror("Live Data Error", f"Could not start live data.\n\nError: {e}")
+            return
+
+        self._live_source = source
+        self._live_capacity = capacity
+        self._live_buffer = None
+        source.start()
+        self.live_button.config(text="Stop Live")
+        self.live_status.config(text="Waiting for the header row...")
+        self._live_tick()
+
+    def stop_live(self):
+        """Stops following the live source. The rows received so far stay loaded."""
+        if self._live_source is None:
+            return
+        self._live_source.stop()
+        if self._live_job is not None:
+            self.after_cancel(self._live_job)
+        self._live_source = None
+        self._live_buffer = None
+        self._live_fit = None
+        self._live_job = None
+        self.live_button.config(text="Start Live")
+        if self.numeric is not None and self._text_table is None:
+            self._show_data_grid(keep_position=True)   # editable again
+
+    def _live_tick(self):
+        """
+        One live frame: takes in every block of rows that arrived since the
+        last frame, redraws once if anything did, and schedules the next frame.
+        """
+        self._live_job = None
+        source = self._live_source
+        if source.error is not None:
+            self.stop_live()
+            messagebox.showerror("Live Data Error", f"Reading live data failed.\n\nError: {source.error}")
+            return
+
+        if self._live_buffer is None and source.header is not None:
+            # The header arrived: offer its columns like a freshly loaded file.
+            self._live_buffer = live_stream.RingBuffer(source.columns, self._live_capacity)
+            self.df = source.header
+            self.numeric = engine.NumericCache.from_block(source.columns, self._live_buffer.view())
+            self.numeric.attach(self._computed_columns())
+            self._text_table = None
+            self.update_axis_selection_ui()
+            self._show_data_grid()
+
+        arrived = 0
+        while self._live_buffer is not None:
+            try:
+                block = source.blocks.get_nowait()
+            except queue.Empty:
+                break
+            evicted = self._live_buffer.append(block)
+            if self._live_fit is not None:
+                self._live_fit.add(block)
+                self._live_fit.remove(evicted)
+            arrived += len(block)
+
+        if arrived:
+            self.numeric = engine.NumericCache.from_block(source.columns, self._live_buffer.view())
+            self.numeric.attach(self.derived)   # computed columns are worked out again only if plotted
+            self._update_live_plot()
+            self._show_data_grid(keep_position=True)
+            self.live_status.config(text=f"{self._live_buffer.total:,} rows received, newest {len(self._live_buffer):,} shown")
+
+        if not source.is_alive() and source.blocks.empty():
+            self.stop_live()
+            self.live_status.config(text="Live source closed.")
+            return
+        try:
+            fps = max(float(self.live_fps_var.get()), 0.1)
+        except (tk.TclError, ValueError):
+            fps = 10
+        self._live_job = self.after(int(1000 / fps), self._live_tick)
+
+    def _update_live_plot(self):
+        """Points the plotted series and fit lines at the rows now in the live buffer, in place."""
+        if not self.series_artists or self._plotted_df is not self.df:
+            return
+        y_cols = list(self.series_artists)
+        x_col, x_err_col = self.series_keys[y_cols[0]][:2]
+        y_err_cols = {y_col: self.series_keys[y_col][2] for y_col in y_cols}
+        series = engine.prepare_series(self.numeric, x_col, y_cols, x_err_col, y_err_cols)
+
+        # Follow the data unless the user has zoomed or panned, which turns autoscaling off.
+        autoscale = self.ax.get_autoscale_on()
+        view = None
+        if self.decimate_var.get():
+            if autoscale:
+                view = engine.data_view(self.ax, series)
+            else:
+                bbox = self.ax.get_window_extent()
+                view = (self.ax.get_xlim(), self.ax.get_ylim(), bbox.width, bbox.height)
+        for y_col, arrays in series.items():
+            self.errorbars.set(y_col, *engine.thin_series(arrays, view), color=self.series_colors[y_col])
+            self.series_keys[y_col] = self.series_keys[y_col][:3] + (
+                view if len(arrays[0]) > engine.DECIMATE_THRESHOLD else None,)
+        self.errorbars.update()
+        self.plot_series = series
+        self._update_smoothing(changed=series)
+
+        if self._live_fit is not None and self.fit_artists:
+            xs = [x for x, _, _, _ in series.values() if len(x)]
+            if xs:
+                fits = self._live_fit.result(min(x.min() for x in xs), max(x.max() for x in xs))
+                for y_col, (_, line) in self.fit_artists.items():
+                    if y_col in self._live_fit.y_cols and fits.n[fits.y_cols.index(y_col)] >= 2:
+                        engine.update_fit_line(line, y_col, fits.fit(y_col),
+                                               label=not line.get_label().startswith('_'))
+                self._update_legend()
+
+        if autoscale:
+            self.ax.relim()
+            self.ax.autoscale_view()
+        self._lod_limits = (self.ax.get_xlim(), self.ax.get_ylim())
+        self._refresh_canvas()
 
 if __name__ == "__main__":
-    app = DataPlotterApp()
+    # --startup-time prints how long the window and the plotting took to become usable, then quits.
+    app = DataPlotterApp(report_startup='--startup-time' in sys.argv[1:])
     app.mainloop()
 
@@ -0,0 +1,214 @@
+"""
+Command-line batch version of HamiltonPlotter.
+
+Renders an error-bar plot (and optionally a linear fit) for every input file,
+spreading the files over a pool of worker processes. Plots are drawn with the
+Agg backend, so no display is needed. Each plot is named after its file; files
+with the same name keep enough of their path to get an image of their own.
+
+example usage:
+
+python batch_plotter.py nightly/*.txt --out plots --x "Time (s)" \
+    --y "Position (m)" --yerr "Position (m)=Pos Uncertainty (m)" \
+    --xerr "Time Uncertainty (s)" --fit --jobs 8
+"""
+
+import matplotlib
+matplotlib.use('Agg') # must happen before anything imports pyplot
+
+import argparse
+import csv
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import plotter_engine as engine
+
+
+RESULT_FIELDS = ['file', 'image', 'y_column', 'slope', 'slope_stderr', 'intercept',
+                 'intercept_stderr', 'r_squared', 'reduced_chi2', 'weighted', 'note', 'n', 'error']
+
+
+def expand_inputs(inputs, pattern='*'):
+    """Turns a mix of files, directories and glob patterns into a sorted list of files."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(p for p in glob.glob(os.path.join(item, pattern)) if os.path.isfile(p))
+        elif glob.has_magic(item):
+            paths.extend(p for p in glob.glob(item) if os.path.isfile(p))
+        else:
+            paths.append(item)
+    return sorted(set(paths))
+
+
+def parse_error_pairs(pairs):
+    """Turns ["Y col=Err col", ...] into {"Y col": "Err col", ...}."""
+    y_err_cols = {}
+    for pair in pairs or []:
+        y_col, sep, err_col = pair.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"--yerr expects 'Y column=Uncertainty column', got {pair!r}")
+        y_err_cols[y_col] = err_col
+    return y_err_cols
+
+
+def image_paths(paths, out, fmt):
+    """
+    Where the plot of each file in `paths` goes: <out>/<file name>.<fmt>.
+    Files whose names clash (the same name in different directories, or
+    with different extensions) keep as much of their path as tells them
+    apart, so nightly/a/run1.txt and nightly/b/run1.txt go to
+    <out>/a/run1.<fmt> and <out>/b/run1.<fmt>, and run1.txt and run1.csv
+    to run1.txt.<fmt> and run1.csv.<fmt>.
+    """
+    def stem(path):
+        return os.path.normcase(os.path.splitext(os.path.basename(path))[0])
+
+    groups = {}
+    for path in paths:
+        groups.setdefault(stem(path), []).append(path)
+    names = {}
+    for group in groups.values():
+        if len(group) == 1:
+            names[group[0]] = os.path.splitext(os.path.basename(group[0]))[0]
+            continue
+        top = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in group])
+        relative = {path: os.path.relpath(os.path.abspath(path), top) for path in group}
+        without_ext = [os.path.normcase(os.path.splitext(rel)[0]) for rel in relative.values()]
+        for path, rel in relative.items():
+            base = os.path.splitext(rel)[0]
+            names[path] = base if without_ext.count(os.path.normcase(base)) == 1 else rel
+    # Anything still clashing (say run1.txt.csv next to run1.txt and run1.csv) gets a number.
+    images, taken = [], set()
+    for path in paths:
+        name, n = names[path], 1
+        while os.path.normcase(name) in taken:
+            n += 1
+            name = f"{names[path]}-{n}"
+        taken.add(os.path.normcase(name))
+        images.append(os.path.join(out, f"{name}.{fmt}"))
+    return images
+
+
+def process_file(path, options, image_path=None):
+    """
+    Loads, plots and fits one file, saving the plot to `image_path`
+    (default: named after the file, in the output directory). Runs in a
+    worker process, so it never raises: problems are reported in the
+    'error' field of the returned rows.
+    """
+    base = os.path.splitext(os.path.basename(path))[0]
+    if image_path is None:
+        image_path = os.path.join(options['out'], f"{base}.{options['format']}")
+
+    try:
+        df = engine.load_file(path)
+        columns = df.columns.tolist()
+        x_col = options['x'] or columns[0]
+        y_cols = options['y'] or columns[1:2]
+        missing = [c for c in [x_col, options['xerr'], *y_cols, *options['yerr'].values()]
+                   if c is not None and c not in columns]
+        if missing:
+            raise KeyError(f"column(s) not found: {', '.join(missing)}")
+
+        title = options['title'] if options['title'] is not None else base
+        fig, fits = engine.render(df, x_col, y_cols, options['xerr'], options['yerr'],
+                                  title=title, fit=options['fit'])
+        os.makedirs(os.path.dirname(image_path) or '.', exist_ok=True)
+        fig.savefig(image_path, dpi=options['dpi'])
+    except Exception as e:
+        return [{'file': path, 'error': f"{type(e).__name__}: {e}"}]
+
+    rows = []
+    for y_col, fit in fits.items():
+        row = {'file': path, 'image': image_path, 'y_column': y_col}
+        if isinstance(fit, Exception):
+            row['error'] = str(fit)
+        else:
+            row.update(slope=fit.slope, slope_stderr=fit.slope_stderr,
+                       intercept=fit.intercept, intercept_stderr=fit.intercept_stderr,
+                       r_squared=fit.r_squared, reduced_chi2=fit.reduced_chi2,
+                       weighted=fit.weighted, note=fit.note, n=fit.n)
+        rows.append(row)
+    return rows or [{'file': path, 'image': image_path}]
+
+
+def _process_file_star(args):
+    return process_file(*args)
+
+
+def run_batch(paths, options, jobs=None):
+    """
+    Processes every path in parallel and returns all result rows, in input
+    order. Plots are named by image_paths, so no two files share an image.
+    """
+    os.makedirs(options['out'], exist_ok=True)
+    tasks = [(path, options, image_path)
+             for path, image_path in zip(paths, image_paths(paths, options['out'], options['format']))]
+    if jobs == 1:
+        results = map(_process_file_star, tasks)
+        return [row for rows in results for row in rows]
+
+    workers = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Hand files out in chunks so thousands of small files don't each pay
+        # for a round trip to the pool.
+        chunksize = max(1, len(tasks) // (workers * 4))
+        results = executor.map(_process_file_star, tasks, chunksize=chunksize)
+        return [row for rows in results for row in rows]
+
+
+def write_results(rows, path):
+    """Writes the fit-results table as CSV (or tab-separated for .tsv/.txt)."""
+    delimiter = '\t' if os.path.splitext(path)[1].lower() in ('.tsv', '.txt') else ','
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, delimiter=delimiter)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render HamiltonPlotter plots and linear fits for many data files.")
+    parser.add_argument('inputs', nargs='+', help="Data files, directories or glob patterns.")
+    parser.add_argument('--pattern', default='*', help="Glob used inside directories (default: all files).")
+    parser.add_argument('--out', default='plots', help="Directory for the rendered images.")
+    parser.add_argument('--format', default='png', help="Image format, e.g. png, pdf or svg.")
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--x', help="X column (default: the first column).")
+    parser.add_argument('--y', action='append', help="Y column; repeat for several (default: the second column).")
+    parser.add_argument('--xerr', help="X uncertainty column.")
+    parser.add_argument('--yerr', action='append', help="'Y column=Uncertainty column'; repeat as needed.")
+    parser.add_argument('--title', help="Plot title (default: the file name).")
+    parser.add_argument('--fit', action='store_true', help="Add a linear fit for each Y column.")
+    parser.add_argument('--results', help="Fit-results table (default: <out>/fit_results.csv).")
+    parser.add_argument('--jobs', type=int, default=None, help="Worker processes (default: one per CPU).")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs, args.pattern)
+    if not paths:
+        parser.error("no input files found")
+
+    try:
+        y_err_cols = parse_error_pairs(args.yerr)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    options = {'out': args.out, 'format': args.format, 'dpi': args.dpi,
+               'x': args.x, 'y': args.y, 'xerr': args.xerr, 'yerr': y_err_cols,
+               'title': args.title, 'fit': args.fit}
+    rows = run_batch(paths, options, jobs=args.jobs)
+
+    results_path = args.results or os.path.join(args.out, 'fit_results.csv')
+    write_results(rows, results_path)
+
+    failed = sorted({row['file'] for row in rows if row.get('error') and not row.get('image')})
+    print(f"Processed {len(paths)} file(s), {len(failed)} failed. Results in {results_path}")
+    for path in failed:
+        print(f"  failed: {path}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
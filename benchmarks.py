@@ -0,0 +1,453 @@
+"""
+Benchmarks for the hot paths of HamiltonPlotter and the plotting helpers:
+loading (load_data, and open_columns for columnar files), plotting
+(plot_data), batched fitting (perform_linear_fit), listwrap/myheatmap and
+histc/nonlinearhistc.
+
+Everything runs headlessly with the Agg backend on synthetic data of every
+size in --rows (1e3 to 1e7 by default) by every width in --columns (number
+of Y columns, each with an uncertainty column), skipping shapes with more
+than --max-cells values. Each case records its run times and the peak
+memory allocated while it ran, and the results are saved as JSON, so runs
+on different commits can be compared:
+
+python benchmarks.py run --out bench/before.json
+git checkout my-branch
+python benchmarks.py run --out bench/after.json
+python benchmarks.py compare bench/before.json bench/after.json --threshold 0.1
+
+compare exits with status 1 when any case got slower (or used more memory)
+by more than the threshold, so it can gate CI. `run --quick` only goes up
+to 1e5 rows and 100 columns; `--only linear_fit --only histc` picks benchmarks.
+"""
+
+import matplotlib
+matplotlib.use('Agg') # must happen before anything imports pyplot
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import columnar_files
+import histograms
+import plotter_engine as engine
+from myheatmap import draw_heatmap, listwrap
+
+
+DEFAULT_ROWS = (10**3, 10**4, 10**5, 10**6, 10**7)
+DEFAULT_COLUMNS = (1, 10, 1000)
+QUICK_ROWS = (10**3, 10**4, 10**5)
+QUICK_COLUMNS = (1, 10, 100)
+
+# Shapes with more values than this are skipped (1e7 rows x 1 column, 1e4 x 1000, ...).
+MAX_CELLS = 2 * 10**7
+
+# Synthetic data files for the loading benchmark are written here once and reused.
+DEFAULT_DATA_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'hamiltonplotter', 'benchmarks')
+
+# A case stops repeating once it has run for this long in total.
+MAX_SECONDS_PER_CASE = 30.0
+
+# setup(rows, columns, data_dir) does the untimed preparation and returns the
+# function to time. Benchmarks that don't use `columns` run once per row
+# count; `max_cells` tightens MAX_CELLS for the slow ones.
+Benchmark = namedtuple('Benchmark', ['setup', 'uses_columns', 'max_cells'], defaults=[True, None])
+
+
+def y_columns(columns):
+    return [f"y{j}" for j in range(columns)]
+
+
+def synthetic_frame(rows, columns, seed=0):
+    """
+    x, x_err, then `columns` noisy straight lines y0, y1, ... and their
+    uncertainties y0_err, y1_err, ..., like a typical HamiltonPlotter file.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0.0, 100.0, rows)
+    data = {'x': x, 'x_err': np.full(rows, 0.05)}
+    slopes = rng.uniform(-5, 5, columns)
+    y_err = rng.uniform(0.5, 2.0, (rows, columns))
+    y = slopes * x[:, None] + rng.normal(0.0, 1.0, (rows, columns)) * y_err
+    for j, name in enumerate(y_columns(columns)):
+        data[name] = y[:, j]
+    for j, name in enumerate(y_columns(columns)):
+        data[f"{name}_err"] = y_err[:, j]
+    return pd.DataFrame(data)
+
+
+_frames = {}
+
+
+def cached_frame(rows, columns):
+    """synthetic_frame, kept for the next benchmark of the same shape (only the latest shape is kept)."""
+    key = (rows, columns)
+    if key not in _frames:
+        _frames.clear()
+        _frames[key] = synthetic_frame(rows, columns)
+    return _frames[key]
+
+
+def data_file(rows, columns, data_dir):
+    """A tab-separated file of synthetic_frame(rows, columns), written the first time it is asked for."""
+    path = os.path.join(data_dir, f"synthetic_{rows}x{columns}.txt")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp_path = path + '.tmp'
+        df = cached_frame(rows, columns)
+        chunk = max(1, 10**6 // (2 * columns + 2))
+        with open(tmp_path, 'w', newline='') as f:
+            for start in range(0, rows, chunk):
+                df.iloc[start:start + chunk].to_csv(f, sep='\t', index=False, header=start == 0,
+                                                    float_format='%.6g')
+        os.replace(tmp_path, path)
+    return path
+
+
+def npz_file(rows, columns, data_dir):
+    """synthetic_frame(rows, columns) as an uncompressed .npz, one array per column, written the first time."""
+    path = os.path.join(data_dir, f"synthetic_{rows}x{columns}.npz")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        df = cached_frame(rows, columns)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **{col: df[col].to_numpy(dtype=np.float64) for col in df.columns})
+        os.replace(tmp_path, path)
+    return path
+
+
+def _fit_inputs(rows, columns):
+    df = cached_frame(rows, columns)
+    block = np.asfortranarray(df.to_numpy(dtype=np.float64))
+    y_cols = y_columns(columns)
+    return list(df.columns), block, y_cols, {y_col: f"{y_col}_err" for y_col in y_cols}
+
+
+def bench_load_data(rows, columns, data_dir):
+    """Reading a data file and coercing it to numbers, as Load Data does."""
+    path = data_file(rows, columns, data_dir)
+    def run():
+        engine.NumericCache(engine.load_file(path))
+    return run
+
+
+def bench_open_columns(rows, columns, data_dir):
+    """Opening a columnar file and reading the X and one Y column, as opening it and plotting one series does."""
+    path = npz_file(rows, columns, data_dir)
+    y_col = y_columns(columns)[0]
+    def run():
+        with columnar_files.open_columns(path) as source:
+            numeric = engine.LazyNumericCache(source)
+            numeric.pair_mask('x', y_col)
+    return run
+
+
+def bench_plot_data(rows, columns, data_dir):
+    """Generate Plot on freshly loaded data: batched error bars (decimated past 20000 points), labels, legend, drawing."""
+    names, block, y_cols, y_err_cols = _fit_inputs(rows, columns)
+    def run():
+        # A new cache each time, as after a load, so no selection is reused between runs.
+        numeric = engine.NumericCache.from_block(names, block)
+        fig, ax = engine.new_figure()
+        FigureCanvasAgg(fig)
+        series = engine.prepare_series(numeric, 'x', y_cols, 'x_err', y_err_cols)
+        errorbars = engine.draw_series_batched(ax, series, engine.data_view(ax, series))
+        engine.format_axes(ax, "Benchmark", "x", "y", handles=[errorbars.legend_handle(y_col) for y_col in y_cols])
+        fig.canvas.draw()
+    return run
+
+
+def bench_linear_fit(rows, columns, data_dir):
+    """Perform Linear Fit: one batched weighted fit of every Y column."""
+    names, block, y_cols, y_err_cols = _fit_inputs(rows, columns)
+    def run():
+        engine.batch_linear_fit(engine.NumericCache.from_block(names, block), 'x', y_cols, 'x_err', y_err_cols)
+    return run
+
+
+def bench_listwrap(rows, columns, data_dir):
+    """Cell edges for one heatmap axis of `rows` points."""
+    x = np.linspace(0.0, 1.0, rows)
+    return lambda: listwrap(x)
+
+
+def _heatmap_frame(rows, columns, uniform):
+    rng = np.random.default_rng(0)
+    index = np.arange(rows, dtype=float) if uniform else np.logspace(0, 3, rows)
+    return pd.DataFrame(rng.random((rows, columns)), index=index, columns=np.arange(columns, dtype=float))
+
+
+def _draw_heatmap_run(df):
+    def run():
+        fig, ax = engine.new_figure(figsize=(8, 6))
+        FigureCanvasAgg(fig)
+        draw_heatmap(ax, df)
+        fig.canvas.draw()
+    return run
+
+
+def bench_myheatmap(rows, columns, data_dir):
+    """A `rows` x `columns` heatmap on evenly spaced axes (drawn as an image)."""
+    return _draw_heatmap_run(_heatmap_frame(rows, columns, uniform=True))
+
+
+def bench_myheatmap_mesh(rows, columns, data_dir):
+    """A `rows` x `columns` heatmap on a log-spaced axis (drawn as a mesh)."""
+    return _draw_heatmap_run(_heatmap_frame(rows, columns, uniform=False))
+
+
+HISTOGRAM_BINS = np.logspace(-3, 2, 60)
+
+
+def _dwell_times(rows, columns):
+    """`columns` datasets of `rows` exponential dwell times, one dataset per row of the array."""
+    X = np.random.default_rng(0).exponential(1.0, (columns, rows))
+    return X[0] if columns == 1 else X
+
+
+def bench_histc(rows, columns, data_dir):
+    X = _dwell_times(rows, columns)
+    return lambda: histograms.histc(X, HISTOGRAM_BINS)
+
+
+def bench_nonlinearhistc(rows, columns, data_dir):
+    X = _dwell_times(rows, columns)
+    # The far tail is thin by design; don't print the too-many-bins warning on every run.
+    return lambda: histograms.nonlinearhistc(X, HISTOGRAM_BINS, thresh=len(HISTOGRAM_BINS))
+
+
+BENCHMARKS = {
+    'load_data': Benchmark(bench_load_data),
+    'open_columns': Benchmark(bench_open_columns),
+    'plot_data': Benchmark(bench_plot_data, max_cells=10**6),
+    'linear_fit': Benchmark(bench_linear_fit),
+    'listwrap': Benchmark(bench_listwrap, uses_columns=False),
+    'myheatmap': Benchmark(bench_myheatmap),
+    'myheatmap_mesh': Benchmark(bench_myheatmap_mesh, max_cells=2 * 10**6),
+    'histc': Benchmark(bench_histc),
+    'nonlinearhistc': Benchmark(bench_nonlinearhistc),
+}
+
+
+def case_name(name, rows, columns):
+    return f"{name}[{rows}x{columns}]"
+
+
+def measure(run, repeat, max_seconds=MAX_SECONDS_PER_CASE):
+    """
+    Times `repeat` calls of `run` (fewer if they take longer than
+    `max_seconds` in total), then makes one more call under tracemalloc for
+    the peak memory it allocates. Returns (times, peak_bytes).
+    """
+    times = []
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+        if sum(times) > max_seconds:
+            break
+    gc.collect()
+    # Timed separately, since tracing allocations slows everything down.
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return times, peak
+
+
+def run_suite(names=None, rows=DEFAULT_ROWS, columns=DEFAULT_COLUMNS, repeat=3,
+              max_cells=MAX_CELLS, data_dir=DEFAULT_DATA_DIR, progress=None):
+    """
+    Runs the benchmarks in `names` (default: all) at every shape and returns
+    a list of result dicts. A case that fails is recorded with its error.
+    `progress`, if given, is called with each result as it finishes.
+    """
+    results = []
+    for name in names or BENCHMARKS:
+        benchmark = BENCHMARKS[name]
+        limit = min(max_cells, benchmark.max_cells or max_cells)
+        widths = columns if benchmark.uses_columns else (1,)
+        for n_rows in rows:
+            for n_columns in widths:
+                if n_rows * n_columns > limit:
+                    continue
+                result = {'name': case_name(name, n_rows, n_columns), 'benchmark': name,
+                          'rows': n_rows, 'columns': n_columns}
+                try:
+                    times, peak = measure(benchmark.setup(n_rows, n_columns, data_dir), repeat)
+                    result.update(seconds=min(times), median=float(np.median(times)),
+                                  times=times, peak_bytes=peak)
+                except Exception as e:
+                    result['error'] = f"{type(e).__name__}: {e}"
+                results.append(result)
+                if progress:
+                    progress(result)
+        _frames.clear()
+    return results
+
+
+def environment():
+    """What the numbers were measured on: the commit, the libraries and the machine."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=here, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=here,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {'commit': commit, 'dirty': dirty,
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'matplotlib': matplotlib.__version__, 'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(), 'cpu_count': os.cpu_count()}
+
+
+def save_results(results, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=1)
+
+
+def load_results(path):
+    """{case name: result} from a file written by save_results."""
+    with open(path, encoding='utf-8') as f:
+        return {result['name']: result for result in json.load(f)['results']}
+
+
+def compare(old, new, threshold=0.1, memory_threshold=None, min_seconds=1e-3):
+    """
+    Compares two {case name: result} dicts case by case, on the fastest run
+    of each. Returns a list of rows (name, old seconds, new seconds, time
+    ratio, old peak, new peak, memory ratio, flag), where flag is 'SLOWER'
+    or 'MORE MEMORY' for regressions beyond `threshold` (a fraction),
+    'faster' for equally large improvements, and '' otherwise. Cases faster
+    than `min_seconds` both times are too noisy to flag.
+    """
+    memory_threshold = threshold if memory_threshold is None else memory_threshold
+    rows = []
+    for name in list(old) + [name for name in new if name not in old]:
+        a, b = old.get(name), new.get(name)
+        if a is None or b is None or 'error' in a or 'error' in b:
+            status = 'only in new' if a is None else 'only in old' if b is None else 'error'
+            rows.append((name, None, None, None, None, None, None, status))
+            continue
+        time_ratio = b['seconds'] / a['seconds'] if a['seconds'] else np.inf
+        mem_ratio = b['peak_bytes'] / a['peak_bytes'] if a['peak_bytes'] else np.inf
+        timed = max(a['seconds'], b['seconds']) >= min_seconds
+        flags = []
+        if timed and time_ratio > 1 + threshold:
+            flags.append('SLOWER')
+        if mem_ratio > 1 + memory_threshold and b['peak_bytes'] - a['peak_bytes'] > 2**20:
+            flags.append('MORE MEMORY')
+        if not flags and timed and time_ratio < 1 / (1 + threshold):
+            flags.append('faster')
+        rows.append((name, a['seconds'], b['seconds'], time_ratio,
+                     a['peak_bytes'], b['peak_bytes'], mem_ratio, ', '.join(flags)))
+    return rows
+
+
+def format_seconds(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.1f} ms"
+    return f"{seconds * 1e6:.0f} us"
+
+
+def format_bytes(n):
+    for unit in ('B', 'KiB', 'MiB'):
+        if n < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GiB"
+
+
+def print_result(result):
+    if 'error' in result:
+        print(f"{result['name']:<34} {result['error']}", flush=True)
+    else:
+        print(f"{result['name']:<34} {format_seconds(result['seconds']):>10} "
+              f"{format_bytes(result['peak_bytes']):>10}", flush=True)
+
+
+def print_comparison(rows):
+    print(f"{'case':<34} {'old':>10} {'new':>10} {'ratio':>6} {'old mem':>10} {'new mem':>10} {'ratio':>6}")
+    for name, t0, t1, time_ratio, m0, m1, mem_ratio, flag in rows:
+        if t0 is None:
+            print(f"{name:<34} {flag}")
+            continue
+        print(f"{name:<34} {format_seconds(t0):>10} {format_seconds(t1):>10} {time_ratio:>6.2f} "
+              f"{format_bytes(m0):>10} {format_bytes(m1):>10} {mem_ratio:>6.2f}  {flag}")
+
+
+def _size(text):
+    """Row and column counts as integers, allowing 1e6 and the like."""
+    value = float(text)
+    if value < 1 or value != int(value):
+        raise argparse.ArgumentTypeError(f"expected a positive whole number, got {text!r}")
+    return int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark HamiltonPlotter's loading, plotting, fitting, heatmaps and histograms.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="Run the benchmarks and save the results as JSON.")
+    run.add_argument('--out', default='benchmark_results.json', help="Where to save the results.")
+    run.add_argument('--only', action='append', choices=list(BENCHMARKS),
+                     help="Run only this benchmark; repeat for several.")
+    run.add_argument('--rows', type=_size, nargs='+', help="Row counts (default: 1e3 to 1e7).")
+    run.add_argument('--columns', type=_size, nargs='+', help="Y column counts (default: 1 10 1000).")
+    run.add_argument('--quick', action='store_true', help="Up to 1e5 rows and 100 columns.")
+    run.add_argument('--repeat', type=int, default=3, help="Timed runs per case; the fastest counts.")
+    run.add_argument('--max-cells', type=_size, default=MAX_CELLS, help="Skip shapes with more values than this.")
+    run.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="Where the synthetic data files are kept.")
+
+    cmp = commands.add_parser('compare', help="Compare two result files and flag regressions.")
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+    cmp.add_argument('--threshold', type=float, default=0.1,
+                     help="Flag cases more than this fraction slower (default: 0.1).")
+    cmp.add_argument('--memory-threshold', type=float,
+                     help="Flag cases using more than this fraction more memory (default: --threshold).")
+    cmp.add_argument('--min-seconds', type=float, default=1e-3,
+                     help="Don't flag cases faster than this, which are mostly noise.")
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        rows = compare(load_results(args.old), load_results(args.new),
+                       args.threshold, args.memory_threshold, args.min_seconds)
+        print_comparison(rows)
+        regressions = [row for row in rows if 'SLOWER' in row[-1] or 'MORE MEMORY' in row[-1]]
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}.")
+        return 1 if regressions else 0
+
+    rows = args.rows or (QUICK_ROWS if args.quick else DEFAULT_ROWS)
+    columns = args.columns or (QUICK_COLUMNS if args.quick else DEFAULT_COLUMNS)
+    results = run_suite(args.only, rows, columns, args.repeat, args.max_cells, args.data_dir,
+                        progress=print_result)
+    save_results(results, args.out)
+    print(f"Saved {len(results)} result(s) to {args.out}")
+    return 1 if any('error' in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
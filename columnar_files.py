@@ -0,0 +1,413 @@
+"""
+Columnar data files, opened without reading their data: only the column
+names and the number of rows are read up front, and each column is read on
+its own when it is asked for, memory-mapped where the format allows. A file
+of thousands of columns opens in the time it takes to read its schema, and
+takes up memory only for the columns that are read.
+
+Formats, by file suffix:
+
+    .parquet .pq            Parquet (needs pyarrow); only the row groups
+                            covering the rows asked for are read
+    .feather .arrow .ipc    Feather v2 / Arrow IPC files (needs pyarrow),
+                            memory-mapped, so uncompressed columns are never copied
+    .h5 .hdf5 .hdf          HDF5 (needs h5py): each 1D numeric dataset is a
+                            column, a 2D dataset gives one column per column
+                            (named by its 'columns' attribute if it has one) and a
+                            compound dataset one per field. Contiguous,
+                            uncompressed datasets are memory-mapped.
+    .npz                    numpy.savez archives, one column per 1D array;
+                            arrays stored uncompressed (np.savez rather than
+                            savez_compressed) are memory-mapped inside the archive
+    .npy                    one 2D array (columns "Column 1", "Column 2", ...)
+                            or a structured array (a column per field), memory-mapped
+
+pyarrow and h5py are only imported when a file that needs them is opened.
+Every column comes back as float64, NaN where it is not a number, as in
+NumericCache. Memory maps are copy-on-write, so edits never reach the file.
+
+example usage:
+
+source = open_columns("run12.parquet")            # reads the schema only
+source.columns, source.rows
+t = source.read("Time (s)")                       # that column, every row
+first = source.read("Voltage (V)", slice(0, 100))
+numeric = LazyNumericCache(source)                # plotter_engine: reads columns as they are plotted
+"""
+
+import os
+import posixpath
+import struct
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+COLUMNAR_SUFFIXES = {'.parquet': 'parquet', '.pq': 'parquet',
+                     '.feather': 'feather', '.arrow': 'feather', '.ipc': 'feather',
+                     '.h5': 'hdf5', '.hdf5': 'hdf5', '.hdf': 'hdf5',
+                     '.npz': 'npz', '.npy': 'npy'}
+
+_LOCAL_HEADER = struct.Struct('<4s22xHH')   # signature, ..., file name length, extra field length
+
+
+class ColumnarFileError(ValueError):
+    """The file can't be read as the format its name says it is."""
+
+
+def is_columnar(path):
+    """True if `path` has the suffix of one of the formats above."""
+    return os.path.splitext(path)[1].lower() in COLUMNAR_SUFFIXES
+
+
+def open_columns(path):
+    """Opens `path` by its suffix and reads its schema. Returns a ColumnarFile."""
+    kind = COLUMNAR_SUFFIXES.get(os.path.splitext(path)[1].lower())
+    if kind is None:
+        raise ColumnarFileError(f"{path} is not a Parquet, Feather, HDF5, .npz or .npy file")
+    return _FORMATS[kind](path)
+
+
+def _numbers(values):
+    """`values` as float64, NaN where not a number. float64 data is passed on as it is, still memory-mapped."""
+    values = np.asarray(values)
+    if values.dtype == np.float64:
+        return values
+    if values.dtype.kind in 'fiub':
+        return values.astype(np.float64)
+    if values.dtype.kind == 'S':
+        values = values.astype(str)
+    try:
+        return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    except (TypeError, ValueError):
+        return np.full(len(values), np.nan)
+
+
+def _npy_header(f):
+    """Reads a .npy header from `f`, leaving it at the data. Returns (shape, fortran_order, dtype)."""
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    return np.lib.format.read_array_header_2_0(f)
+
+
+class ColumnarFile:
+    """
+    An opened file: `columns` (names, in order), `rows`, and read() for one
+    column at a time. Columns shorter than the file are padded with NaN.
+    """
+    format = None
+
+    def __init__(self, path):
+        self.path = path
+        self._columns = {}   # name -> where the column is, for _read
+        self.rows = 0
+
+    def __repr__(self):
+        return f"<{self.format} file {self.path!r}: {len(self._columns)} columns, {self.rows} rows>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    @property
+    def header(self):
+        """An empty DataFrame with the file's columns, standing in for the data."""
+        return pd.DataFrame(columns=self.columns)
+
+    def read(self, col, rows=slice(None)):
+        """Column `col` over `rows` (a slice) as float64, NaN where it is not a number."""
+        if col not in self._columns:
+            raise KeyError(col)
+        start, stop, step = rows.indices(self.rows)
+        stop = max(start, stop)
+        values = _numbers(self._read(col, start, stop))
+        if len(values) < stop - start:
+            padded = np.full(stop - start, np.nan)
+            padded[:len(values)] = values
+            values = padded
+        return values[::step] if step != 1 else values
+
+    def _read(self, col, start, stop):
+        """Rows start:stop of `col` as stored (it may have fewer, if the column is short)."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class _NpyColumns(ColumnarFile):
+    format = '.npy'
+
+    def __init__(self, path):
+        super().__init__(path)
+        try:
+            array = np.load(path, mmap_mode='c', allow_pickle=False)
+        except ValueError as e:
+            raise ColumnarFileError(f"{path} is not a .npy file of numbers: {e}") from None
+        if array.dtype.names and array.ndim == 1:
+            self._columns = {name: name for name in array.dtype.names}
+        elif array.ndim == 2:
+            self._columns = {f"Column {j + 1}": j for j in range(array.shape[1])}
+        elif array.ndim == 1:
+            self._columns = {"Column 1": None}
+        else:
+            raise ColumnarFileError(f"{path} holds a {array.ndim}D array, not a table")
+        self._array = array
+        self.rows = len(array)
+
+    def _read(self, col, start, stop):
+        key = self._columns[col]
+        if key is None:
+            return self._array[start:stop]
+        if isinstance(key, str):
+            return self._array[key][start:stop]
+        return self._array[start:stop, key]
+
+
+class _NpzColumns(ColumnarFile):
+    format = '.npz'
+    # Compressed arrays can only be read whole; the last few are kept so
+    # showing a few rows of them at a time doesn't decompress them each time.
+    KEEP_DECOMPRESSED = 8
+
+    def __init__(self, path):
+        super().__init__(path)
+        try:
+            self._zip = zipfile.ZipFile(path)
+        except zipfile.BadZipFile as e:
+            raise ColumnarFileError(f"{path} is not an .npz archive: {e}") from None
+        self._decompressed = OrderedDict()
+        with open(path, 'rb') as f:
+            for info in self._zip.infolist():
+                if not info.filename.endswith('.npy'):
+                    continue
+                try:
+                    if info.compress_type == zipfile.ZIP_STORED:
+                        # The data starts after the member's own (local) header.
+                        f.seek(info.header_offset)
+                        signature, name_length, extra_length = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+                        if signature != b'PK\x03\x04':
+                            continue
+                        f.seek(info.header_offset + _LOCAL_HEADER.size + name_length + extra_length)
+                        shape, fortran_order, dtype = _npy_header(f)
+                        offset = f.tell()
+                    else:
+                        with self._zip.open(info) as member:
+                            shape, fortran_order, dtype = _npy_header(member)
+                        offset = None
+                except ValueError:   # not a .npy file after all
+                    continue
+                if len(shape) == 1 and not dtype.hasobject and not dtype.names:
+                    self._columns[info.filename[:-len('.npy')]] = (info, offset, dtype, shape[0])
+        self.rows = max((length for *_, length in self._columns.values()), default=0)
+
+    def _read(self, col, start, stop):
+        info, offset, dtype, length = self._columns[col]
+        stop = min(stop, length)
+        if start >= stop:
+            return np.empty(0)
+        if offset is not None:
+            return np.memmap(self.path, dtype=dtype, mode='c', offset=offset + start * dtype.itemsize,
+                             shape=(stop - start,))
+        values = self._decompressed.pop(col, None)
+        if values is None:
+            with self._zip.open(info) as member:
+                values = np.lib.format.read_array(member, allow_pickle=False)
+        self._decompressed[col] = values
+        while len(self._decompressed) > self.KEEP_DECOMPRESSED:
+            self._decompressed.popitem(last=False)
+        return values[start:stop]
+
+    def close(self):
+        self._decompressed.clear()
+        self._zip.close()
+
+
+class _Hdf5Columns(ColumnarFile):
+    format = 'HDF5'
+
+    def __init__(self, path):
+        super().__init__(path)
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("Reading HDF5 files needs the 'h5py' library (pip install h5py).") from None
+        try:
+            self._file = h5py.File(path, 'r')
+        except OSError as e:
+            raise ColumnarFileError(f"{path} is not an HDF5 file: {e}") from None
+        self._mapped = {}
+
+        datasets = []
+        self._file.visititems(lambda name, obj: datasets.append(obj) if isinstance(obj, h5py.Dataset) else None)
+        found = []   # (full name, dataset, key for _read)
+        for ds in datasets:
+            dtype = ds.dtype
+            if dtype.names and ds.ndim == 1:
+                found += [(f"{ds.name}/{field}", ds, field) for field in dtype.names
+                          if dtype[field].kind in 'fiub' and dtype[field].shape == ()]
+            elif dtype.kind in 'fiub' and ds.ndim == 1:
+                found.append((ds.name, ds, None))
+            elif dtype.kind in 'fiub' and ds.ndim == 2:
+                names = self._column_names(ds)
+                found += [(f"{ds.name}/{name}" if names else f"{ds.name}[{j}]", ds, j)
+                          for j, name in enumerate(names or range(ds.shape[1]))]
+
+        # Names are relative to the group that all the columns are in.
+        prefix = posixpath.commonpath([posixpath.dirname(name) for name, _, _ in found] or ['/']).rstrip('/') + '/'
+        self._columns = {name[len(prefix):] if name.startswith(prefix) else name: (ds, key)
+                         for name, ds, key in found}
+        self.rows = max((ds.shape[0] for ds, _ in self._columns.values()), default=0)
+
+    @staticmethod
+    def _column_names(ds):
+        """The names in a 2D dataset's 'columns' (or 'column_names') attribute, if it has one that fits."""
+        for attribute in ('columns', 'column_names'):
+            names = ds.attrs.get(attribute)
+            if names is not None and np.ndim(names) == 1 and len(names) == ds.shape[1]:
+                return [name.decode('utf-8', 'replace') if isinstance(name, bytes) else str(name) for name in names]
+        return None
+
+    def _map(self, ds):
+        """The dataset memory-mapped if it is stored contiguously and uncompressed, else None."""
+        if ds.name not in self._mapped:
+            offset = None
+            if ds.chunks is None and ds.size and not ds.dtype.hasobject:
+                offset = ds.id.get_offset()
+            self._mapped[ds.name] = None if offset is None else np.memmap(
+                self.path, dtype=ds.dtype, mode='c', offset=offset, shape=ds.shape)
+        return self._mapped[ds.name]
+
+    def _read(self, col, start, stop):
+        ds, key = self._columns[col]
+        stop = min(stop, ds.shape[0])
+        if start >= stop:
+            return np.empty(0)
+        data = self._map(ds)
+        if data is None:   # chunked or compressed: HDF5 reads just this part
+            if key is None:
+                return ds[start:stop]
+            if isinstance(key, str):
+                return ds.fields(key)[start:stop]
+            return ds[start:stop, key]
+        if key is None:
+            return data[start:stop]
+        if isinstance(key, str):
+            return data[key][start:stop]
+        return data[start:stop, key]
+
+    def close(self):
+        self._mapped.clear()
+        self._file.close()
+
+
+def _import_pyarrow(kind):
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(f"Reading {kind} files needs the 'pyarrow' library (pip install pyarrow).") from None
+    return pyarrow
+
+
+def _arrow_numbers(array):
+    """A pyarrow array or chunked array as float64, NaN for nulls and anything not a number."""
+    import pyarrow as pa
+    kind = array.type
+    if pa.types.is_floating(kind) or pa.types.is_integer(kind) or pa.types.is_boolean(kind) or pa.types.is_decimal(kind):
+        # Nulls become NaN; a float64 column without nulls in one chunk is not copied.
+        if kind != pa.float64():
+            array = array.cast(pa.float64())
+        return np.asarray(array.to_numpy())
+    return _numbers(array.to_pandas().to_numpy(dtype=object))
+
+
+class _ArrowColumns(ColumnarFile):
+    """
+    Parquet and Feather files are stored in chunks of rows (row groups,
+    record batches); only the chunks covering the rows asked for are read.
+    """
+    def _set_chunks(self, names, chunk_rows):
+        # pandas stores its index as an extra column, which isn't data.
+        self._columns = {name: j for j, name in enumerate(names) if not name.startswith('__index_level_')}
+        self._bounds = np.concatenate([[0], np.cumsum(chunk_rows, dtype=np.int64)])
+        self.rows = int(self._bounds[-1])
+
+    def _read(self, col, start, stop):
+        if start >= stop:
+            return np.empty(0)
+        first = int(np.searchsorted(self._bounds, start, 'right')) - 1
+        last = int(np.searchsorted(self._bounds, stop, 'left'))
+        values = _arrow_numbers(self._read_chunks(self._columns[col], range(first, last)))
+        offset = start - int(self._bounds[first])
+        return values[offset:offset + stop - start]
+
+    def _read_chunks(self, j, chunks):
+        """Column number `j` over the given chunks, as one pyarrow (chunked) array."""
+        raise NotImplementedError
+
+
+class _ParquetColumns(_ArrowColumns):
+    format = 'Parquet'
+
+    def __init__(self, path):
+        super().__init__(path)
+        pa = _import_pyarrow('Parquet')
+        import pyarrow.parquet as pq
+        try:
+            self._file = pq.ParquetFile(path, memory_map=True)
+            metadata = self._file.metadata
+        except (OSError, ValueError, pa.ArrowException) as e:
+            raise ColumnarFileError(f"{path} is not a Parquet file: {e}") from None
+        self._names = self._file.schema_arrow.names
+        self._set_chunks(self._names, [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+
+    def _read_chunks(self, j, chunks):
+        return self._file.read_row_groups(list(chunks), columns=[self._names[j]], use_threads=True).column(0)
+
+    def close(self):
+        self._file.close()
+
+
+class _FeatherColumns(_ArrowColumns):
+    format = 'Feather'
+
+    def __init__(self, path):
+        super().__init__(path)
+        pa = _import_pyarrow('Feather')
+        import pyarrow.ipc
+        try:
+            self._source = pa.memory_map(path)
+            schema = pa.ipc.open_file(self._source).schema
+            # Counting the rows of each batch decodes (and decompresses) only the first column.
+            reader = self._reader(0) if len(schema) else pa.ipc.open_file(self._source)
+            chunk_rows = [reader.get_batch(i).num_rows for i in range(reader.num_record_batches)]
+        except (OSError, ValueError, pa.ArrowException) as e:
+            raise ColumnarFileError(f"{path} is not a Feather v2 (Arrow IPC) file: {e}") from None
+        self._types = schema.types
+        self._set_chunks(schema.names, chunk_rows)
+
+    def _reader(self, j):
+        """A reader of the memory map that decodes column number `j` only."""
+        import pyarrow as pa
+        return pa.ipc.open_file(self._source, options=pa.ipc.IpcReadOptions(included_fields=[j]))
+
+    def _read_chunks(self, j, chunks):
+        import pyarrow as pa
+        reader = self._reader(j)
+        return pa.chunked_array([reader.get_batch(i).column(0) for i in chunks], type=self._types[j])
+
+    def close(self):
+        self._source.close()
+
+
+_FORMATS = {'parquet': _ParquetColumns, 'feather': _FeatherColumns, 'hdf5': _Hdf5Columns,
+            'npz': _NpzColumns, 'npy': _NpyColumns}
@@ -0,0 +1,536 @@
+"""
+Computed columns: columns defined as expressions over the loaded ones, such
+as diff(`Position (m)`) / diff(`Time (s)`), `Net Worth` / 100,
+log2(`Choices`) or rolling_sum(`Bright` - `Dark`, 5).
+
+Column names go in backticks; names that are plain identifiers can be
+written without them. An expression may use numbers, pi and e, + - * / **,
+the element-wise functions in FUNCTIONS and the row-wise functions in
+ROW_FUNCTIONS, which match pandas: diff(x) is x.diff(), shift(x, n) is
+x.shift(n), cumsum(x) is x.cumsum() and rolling_sum(x, n) /
+rolling_mean(x, n) are x.rolling(n).sum() / .mean(). Expressions are checked
+when they are defined, and nothing else of Python can be reached from them.
+
+A computed column is evaluated, for all rows at once, only when something
+asks for its values (plotting or fitting it), and is then kept until a
+column it depends on changes. invalidate() drops exactly the computed
+columns downstream of a changed column.
+
+Uncertainties are propagated to first order, assuming independent errors:
+each source column given an uncertainty column contributes
+(d expression / d source * uncertainty)**2 to the variance, and the result
+is offered as the column "<name> uncertainty". Derivatives are carried along
+with the values, so a column used twice (x - x / 2) is handled exactly. The
+result of a row-wise function, and another computed column, count as
+independent sources with the uncertainty propagated into them, which leaves
+out correlations such as those between x and diff(x).
+
+example usage:
+
+derived = DerivedColumns()
+derived.define('Velocity (m/s)', 'diff(`Position (m)`) / diff(`Time (s)`)',
+               errors={'Position (m)': 'Pos Uncertainty (m)'})
+numeric.attach(derived)                          # a NumericCache then hands these out like its own
+v = numeric.values('Velocity (m/s)')             # evaluated now, kept afterwards
+dv = numeric.values('Velocity (m/s) uncertainty')
+numeric.set_value('Position (m)', 3, 44.1)       # drops Velocity and anything built on it
+"""
+
+import ast
+import itertools
+import re
+from collections import namedtuple
+
+import numpy as np
+
+UNCERTAINTY_SUFFIX = ' uncertainty'
+
+# Element-wise functions: name -> (function, its derivative).
+FUNCTIONS = {
+    'log': (np.log, lambda x: 1 / x),
+    'log2': (np.log2, lambda x: 1 / (x * np.log(2))),
+    'log10': (np.log10, lambda x: 1 / (x * np.log(10))),
+    'exp': (np.exp, np.exp),
+    'sqrt': (np.sqrt, lambda x: 0.5 / np.sqrt(x)),
+    'abs': (np.abs, np.sign),
+    'sin': (np.sin, np.cos),
+    'cos': (np.cos, lambda x: -np.sin(x)),
+    'tan': (np.tan, lambda x: 1 / np.cos(x)**2),
+    'arcsin': (np.arcsin, lambda x: 1 / np.sqrt(1 - x**2)),
+    'arccos': (np.arccos, lambda x: -1 / np.sqrt(1 - x**2)),
+    'arctan': (np.arctan, lambda x: 1 / (1 + x**2)),
+    'sinh': (np.sinh, np.cosh),
+    'cosh': (np.cosh, np.sinh),
+    'tanh': (np.tanh, lambda x: 1 / np.cosh(x)**2),
+}
+
+CONSTANTS = {'pi': np.pi, 'e': np.e}
+
+
+def _shift(x, n):
+    out = np.full(len(x), np.nan)
+    if 0 <= n < len(x):
+        out[n:] = x[:len(x) - n]
+    elif -len(x) < n < 0:
+        out[:n] = x[-n:]
+    return out
+
+
+def _diff(x, n):
+    return x - _shift(x, n)
+
+
+def _diff_variance(var, n):
+    return var + _shift(var, n)
+
+
+def _cumsum(x, n=None):
+    # Like pandas: missing values stay missing and are skipped by the sum.
+    valid = ~np.isnan(x)
+    return np.where(valid, np.cumsum(np.where(valid, x, 0.0)), np.nan)
+
+
+def _rolling_sum(x, n):
+    # From cumulative sums, so any window takes the same time; relative to the
+    # mean so long sums keep their precision. A window with a NaN in it is NaN.
+    out = np.full(len(x), np.nan)
+    if n > len(x):
+        return out
+    valid = ~np.isnan(x)
+    offset = x[valid].mean() if valid.any() else 0.0
+    sums = np.concatenate([[0.0], np.cumsum(np.where(valid, x - offset, 0.0))])
+    missing = np.concatenate([[0], np.cumsum(~valid)])
+    total = sums[n:] - sums[:-n] + n * offset
+    out[n - 1:] = np.where(missing[n:] == missing[:-n], total, np.nan)
+    return out
+
+
+def _rolling_mean(x, n):
+    return _rolling_sum(x, n) / n
+
+
+def _rolling_mean_variance(var, n):
+    return _rolling_sum(var, n) / n**2
+
+
+# function(x, periods), the same for the variance of x, and the default
+# periods (None: must be given; False: takes no periods argument).
+RowFunction = namedtuple('RowFunction', ['apply', 'variance', 'periods'])
+
+ROW_FUNCTIONS = {
+    'diff': RowFunction(_diff, _diff_variance, 1),
+    'shift': RowFunction(_shift, _shift, 1),
+    'cumsum': RowFunction(_cumsum, _cumsum, False),
+    'rolling_sum': RowFunction(_rolling_sum, _rolling_sum, None),
+    'rolling_mean': RowFunction(_rolling_mean, _rolling_mean_variance, None),
+}
+
+_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow)
+_BACKTICKED = re.compile(r'`([^`]*)`')
+_PLACEHOLDER = '__column{}__'
+
+
+class ExpressionError(ValueError):
+    """An expression that can't be read, or uses something that isn't allowed."""
+
+
+class Expression:
+    """
+    A checked expression. `columns` are the columns it refers to, in the
+    order they first appear; evaluate() works it out for whole columns.
+    """
+    def __init__(self, text):
+        self.text = text.strip()
+        placeholders = {}
+
+        def replace(match):
+            placeholder = _PLACEHOLDER.format(len(placeholders))
+            placeholders[placeholder] = match.group(1)
+            return placeholder
+
+        source = _BACKTICKED.sub(replace, self.text)
+        if '`' in source:
+            raise ExpressionError("a column name is missing its closing backtick")
+        if not source.strip():
+            raise ExpressionError("the expression is empty")
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ExpressionError(f"can't read {self.text!r}: {e.msg}") from None
+        self._placeholders = placeholders
+        self._columns = {}
+        self._check(tree.body)
+        self._tree = tree.body
+        self.columns = list(self._columns)
+
+    def __repr__(self):
+        return f"Expression({self.text!r})"
+
+    def _describe(self, node):
+        """`node` as the user wrote it, for error messages."""
+        text = ast.unparse(node)
+        for placeholder, col in self._placeholders.items():
+            text = text.replace(placeholder, f"`{col}`")
+        return repr(text)
+
+    def _column(self, node):
+        """The column a Name node refers to, or None for pi and e."""
+        if node.id in self._placeholders:
+            return self._placeholders[node.id]
+        if node.id in CONSTANTS:
+            return None
+        if node.id in FUNCTIONS or node.id in ROW_FUNCTIONS:
+            raise ExpressionError(f"{node.id} is a function; call it like {node.id}(...)")
+        return node.id
+
+    def _check(self, node):
+        if isinstance(node, ast.BinOp):
+            if not isinstance(node.op, _OPERATORS):
+                raise ExpressionError(f"{self._describe(node)}: only + - * / ** can be used")
+            self._check(node.left)
+            self._check(node.right)
+        elif isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, (ast.USub, ast.UAdd)):
+                raise ExpressionError(f"{self._describe(node)} is not allowed in an expression")
+            self._check(node.operand)
+        elif isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise ExpressionError(f"{self._describe(node)} is not a number; put column names in `backticks`")
+        elif isinstance(node, ast.Name):
+            col = self._column(node)
+            if col is not None:
+                self._columns[col] = None
+        elif isinstance(node, ast.Call):
+            name = node.func.id if isinstance(node.func, ast.Name) else None
+            if node.keywords or name not in FUNCTIONS and name not in ROW_FUNCTIONS:
+                known = ", ".join([*FUNCTIONS, *ROW_FUNCTIONS])
+                raise ExpressionError(f"{self._describe(node)}: the functions that can be used are {known}")
+            if name in FUNCTIONS:
+                if len(node.args) != 1:
+                    raise ExpressionError(f"{name} takes one argument")
+            else:
+                self._check_periods(name, node.args)
+            self._check(node.args[0])
+        else:
+            raise ExpressionError(f"{self._describe(node)} is not allowed in an expression")
+
+    @staticmethod
+    def _check_periods(name, args):
+        default = ROW_FUNCTIONS[name].periods
+        if default is False:
+            usage, counts = f"{name}(column)", (1,)
+        elif default is None:
+            usage, counts = f"{name}(column, n)", (2,)
+        else:
+            usage, counts = f"{name}(column) or {name}(column, n)", (1, 2)
+        if len(args) not in counts:
+            raise ExpressionError(f"use {usage}")
+        if len(args) == 2:
+            try:
+                n = ast.literal_eval(args[1])
+            except ValueError:
+                n = None
+            if isinstance(n, bool) or not isinstance(n, int) or default is None and n < 1:
+                raise ExpressionError(f"in {usage}, n must be a whole number of rows"
+                                      + (" of at least 1" if default is None else ""))
+
+    def evaluate(self, column, n_rows):
+        """
+        The expression for every row: (values, uncertainty), float64 arrays
+        of length n_rows. `column(name)` returns (values, uncertainty or None)
+        for a column the expression refers to. The uncertainty is None when
+        none of the columns used has one.
+        """
+        evaluation = _Evaluation(self, column, n_rows)
+        with np.errstate(all='ignore'):
+            value, grads = evaluation.run(self._tree)
+            values = np.asarray(value, dtype=np.float64)
+            if values.shape != (n_rows,):   # a constant, or a source column whose length is off
+                values = np.array(np.broadcast_to(values, (n_rows,)))
+            if not evaluation.sigmas:
+                return values, None
+            sigma = np.sqrt(np.broadcast_to(evaluation.variance(grads), (n_rows,))).astype(np.float64)
+        return values, sigma
+
+
+class _Evaluation:
+    """
+    One evaluation of an Expression. Every intermediate result is a value
+    and its derivatives with respect to the sources of uncertainty that went
+    into it: {source: d value / d source}. sigmas holds each source's uncertainty.
+    """
+    def __init__(self, expression, column, n_rows):
+        self.expression = expression
+        self.column = column
+        self.n_rows = n_rows
+        self.sigmas = {}
+        self._values = {}   # the columns read so far
+        self._ids = itertools.count()
+
+    def variance(self, grads):
+        total = 0.0
+        for source, grad in grads.items():
+            total = total + (grad * self.sigmas[source])**2
+        return total
+
+    def _independent(self, value, sigma):
+        """A value with its own uncertainty, unrelated to anything else seen so far."""
+        if sigma is None:
+            return value, {}
+        source = next(self._ids)
+        self.sigmas[source] = sigma
+        return value, {source: 1.0}
+
+    def _source(self, col):
+        """A column the expression uses; its uncertainty makes it a source of its own."""
+        source = ('column', col)
+        if col not in self._values:
+            values, sigma = self.column(col)
+            self._values[col] = values
+            if sigma is not None:
+                self.sigmas[source] = sigma
+        return self._values[col], ({source: 1.0} if source in self.sigmas else {})
+
+    def run(self, node):
+        if isinstance(node, ast.Constant):
+            return float(node.value), {}
+        if isinstance(node, ast.Name):
+            col = self.expression._column(node)
+            if col is None:
+                return CONSTANTS[node.id], {}
+            return self._source(col)
+        if isinstance(node, ast.UnaryOp):
+            value, grads = self.run(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return value, grads
+            return -value, {source: -grad for source, grad in grads.items()}
+        if isinstance(node, ast.BinOp):
+            return self._binary(node.op, self.run(node.left), self.run(node.right))
+        return self._call(node)
+
+    @staticmethod
+    def _combine(*terms):
+        """sum(coefficient * grads) over (coefficient, grads) pairs; coefficients are only worked out if needed."""
+        out = {}
+        for coefficient, grads in terms:
+            if not grads:
+                continue
+            coefficient = coefficient()
+            for source, grad in grads.items():
+                out[source] = out[source] + coefficient * grad if source in out else coefficient * grad
+        return out
+
+    def _binary(self, op, left, right):
+        (a, da), (b, db) = left, right
+        if isinstance(op, ast.Add):
+            return a + b, self._combine((lambda: 1.0, da), (lambda: 1.0, db))
+        if isinstance(op, ast.Sub):
+            return a - b, self._combine((lambda: 1.0, da), (lambda: -1.0, db))
+        if isinstance(op, ast.Mult):
+            return a * b, self._combine((lambda: b, da), (lambda: a, db))
+        if isinstance(op, ast.Div):
+            return a / b, self._combine((lambda: 1 / b, da), (lambda: -a / b**2, db))
+        value = np.power(a, b)
+        return value, self._combine((lambda: b * np.power(a, b - 1), da), (lambda: value * np.log(a), db))
+
+    def _call(self, node):
+        name = node.func.id
+        value, grads = self.run(node.args[0])
+        if name in FUNCTIONS:
+            function, derivative = FUNCTIONS[name]
+            return function(value), self._combine((lambda: derivative(value), grads))
+
+        row_function = ROW_FUNCTIONS[name]
+        periods = row_function.periods
+        if len(node.args) == 2:
+            periods = ast.literal_eval(node.args[1])
+        x = np.broadcast_to(np.asarray(value, dtype=np.float64), (self.n_rows,))
+        result = row_function.apply(x, periods)
+        if not grads:
+            return result, {}
+        variance = np.broadcast_to(self.variance(grads), (self.n_rows,))
+        return self._independent(result, np.sqrt(row_function.variance(variance, periods)))
+
+
+class DerivedColumns:
+    """
+    The computed columns of a session, kept across loads. attach it to a
+    NumericCache (NumericCache.attach) and it works out each computed column
+    from that cache's data the first time it is asked for, then keeps it.
+    """
+    def __init__(self):
+        self.source = None          # the NumericCache the columns are computed from
+        self._definitions = {}      # name -> (Expression, {source column: its uncertainty column})
+        self._results = {}          # name -> (values, uncertainty or None), read-only
+        self._valid = {}
+
+    def __contains__(self, col):
+        name = self._name_of(col)
+        if name is None or not self.available(name):
+            return False
+        return col == name or self.has_uncertainty(name)
+
+    @property
+    def names(self):
+        """The computed columns, in the order they were defined."""
+        return list(self._definitions)
+
+    def columns(self):
+        """The columns that can be worked out from the source: each computed column, then its uncertainty."""
+        columns = []
+        for name in self._definitions:
+            if self.available(name):
+                columns.append(name)
+                if self.has_uncertainty(name):
+                    columns.append(name + UNCERTAINTY_SUFFIX)
+        return columns
+
+    def expression(self, name):
+        return self._definitions[name][0]
+
+    def errors(self, name):
+        """{source column: its uncertainty column} used for `name`."""
+        return dict(self._definitions[name][1])
+
+    def _name_of(self, col):
+        """The computed column that `col` is, or is the uncertainty of; None if neither."""
+        if col in self._definitions:
+            return col
+        if isinstance(col, str) and col.endswith(UNCERTAINTY_SUFFIX) and col[:-len(UNCERTAINTY_SUFFIX)] in self._definitions:
+            return col[:-len(UNCERTAINTY_SUFFIX)]
+        return None
+
+    def _inputs(self, name):
+        expression, errors = self._definitions[name]
+        return expression.columns + list(errors.values())
+
+    def _depends_on(self, name, col):
+        """True if computed column `name` uses `col`, directly or through other computed columns."""
+        for used in self._inputs(name):
+            used_name = self._name_of(used)
+            if used == col or used_name == col or used_name is not None and self._depends_on(used_name, col):
+                return True
+        return False
+
+    def has_uncertainty(self, name):
+        """True if any column `name` is computed from has an uncertainty, so it has one too."""
+        expression, errors = self._definitions[name]
+        return bool(errors) or any(col in self._definitions and self.has_uncertainty(col)
+                                   for col in expression.columns)
+
+    def available(self, name):
+        """True if every column `name` needs is in the source."""
+        return self.source is not None and all(col in self.source for col in self._inputs(name))
+
+    def define(self, name, expression, errors=None):
+        """
+        Adds computed column `name`, or replaces its definition. `expression`
+        is an Expression or its text; `errors` maps the columns it uses to
+        their uncertainty columns. Returns the computed columns whose values
+        change (`name`, if it was defined before, and those built on it).
+        """
+        name = str(name).strip()
+        if not name:
+            raise ExpressionError("the computed column needs a name")
+        if name.endswith(UNCERTAINTY_SUFFIX):
+            raise ExpressionError(f"names ending in {UNCERTAINTY_SUFFIX!r} are kept for uncertainty columns")
+        if self.source is not None and name in self.source and name not in self._definitions:
+            raise ExpressionError(f"there is already a column called {name!r}")
+        if not isinstance(expression, Expression):
+            expression = Expression(expression)
+        errors = {col: err for col, err in (errors or {}).items() if col in expression.columns and err}
+        for col in expression.columns + list(errors.values()):
+            if col in (name, name + UNCERTAINTY_SUFFIX):
+                raise ExpressionError(f"{name!r} can't be computed from itself")
+            used_name = self._name_of(col)
+            if used_name == name or used_name is not None and self._depends_on(used_name, name):
+                raise ExpressionError(f"{name!r} can't be computed from itself")
+
+        changed = self.invalidate(name) if name in self._definitions else []
+        self._definitions[name] = (expression, errors)
+        return changed
+
+    def remove(self, name):
+        """
+        Removes computed column `name`. Columns built on it stay defined but
+        are left out until it is defined again. Returns the columns that go.
+        """
+        changed = self.invalidate(name)
+        del self._definitions[name]
+        return changed
+
+    def invalidate(self, col):
+        """
+        Forgets the values of every computed column that depends on `col`
+        (a loaded column or a computed one), and of `col` itself if it is
+        computed. Returns those columns, uncertainty columns included.
+        """
+        changed = []
+        for name in self._definitions:
+            if name == col or self._depends_on(name, col):
+                self._results.pop(name, None)
+                changed.append(name)
+                if self.has_uncertainty(name):
+                    changed.append(name + UNCERTAINTY_SUFFIX)
+        for changed_col in changed:
+            self._valid.pop(changed_col, None)
+        return changed
+
+    def clear(self):
+        """Forgets every computed value, e.g. because the source has new data."""
+        self._results.clear()
+        self._valid.clear()
+
+    def values(self, col):
+        """Computed column `col` (or its uncertainty) for every row of the source, worked out once."""
+        name = self._name_of(col)
+        if name is None:
+            raise KeyError(col)
+        if name not in self._results:
+            values, sigma = self.expression(name).evaluate(self._column_for(name), len(self.source))
+            for array in (values, sigma):
+                if array is not None:
+                    array.setflags(write=False)
+            self._results[name] = (values, sigma)
+        values, sigma = self._results[name]
+        if col == name:
+            return values
+        if sigma is None:   # every uncertainty used is missing from the source
+            raise KeyError(col)
+        return sigma
+
+    def valid(self, col):
+        """True for the rows where computed column `col` is a number."""
+        if col not in self._valid:
+            valid = ~np.isnan(self.values(col))
+            valid.setflags(write=False)
+            self._valid[col] = valid
+        return self._valid[col]
+
+    def _column_for(self, name):
+        """The column(col) lookup Expression.evaluate needs, for computed column `name`."""
+        errors = self._definitions[name][1]
+
+        def column(col):
+            values = self.source.values(col)
+            if col in errors:
+                return values, self.source.values(errors[col])
+            if col in self._definitions and self.has_uncertainty(col):
+                return values, self.source.values(col + UNCERTAINTY_SUFFIX)
+            return values, None
+        return column
+
+    def definitions(self):
+        """The definitions as JSON-friendly dicts, for saving in a project."""
+        return [{'name': name, 'expression': expression.text, 'errors': dict(errors)}
+                for name, (expression, errors) in self._definitions.items()]
+
+    def load(self, definitions):
+        """Replaces every computed column with those of definitions() (bad ones are skipped)."""
+        self._definitions = {}
+        self.clear()
+        for definition in definitions:
+            try:
+                self.define(definition['name'], definition['expression'], definition.get('errors'))
+            except (ExpressionError, KeyError, TypeError):
+                continue
@@ -0,0 +1,147 @@
+"""
+Small multiples of myheatmap: many heatmaps (one per sample, time step, ...)
+on one color scale, rendered in parallel worker processes with the Agg
+backend and no pyplot state.
+
+heatmap_grid puts all panels in one image with a single shared colorbar;
+save_heatmaps writes each panel to its own file, every one with the same
+colorbar range.
+
+example usage:
+
+frames = [pd.read_csv(path, index_col=0) for path in sorted(glob.glob("scans/*.csv"))]
+heatmap_grid(frames, "scans.png", titles=names, ncols=8, colorbarlabel='counts')
+save_heatmaps(frames, "scan_pngs", names=names, colorbarlabel='counts', jobs=8)
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
+
+from myheatmap import draw_heatmap
+
+
+def shared_norm(dfs, robust=False):
+    """
+    One Normalize covering every DataFrame in `dfs`. With `robust`, the
+    range is the 2nd to 98th percentile of all values (as in
+    seaborn.heatmap) rather than the full range, so a few outliers don't
+    wash out the colors; percentiles need all values pooled into one array.
+    The full range is just the smallest minimum and largest maximum of the
+    panels, so nothing is copied for it.
+    """
+    panels = [np.asarray(df.to_numpy(), dtype=np.float64) for df in dfs]
+    if robust:
+        vmin, vmax = np.nanpercentile(np.concatenate([panel.ravel() for panel in panels]), [2, 98])
+        return Normalize(vmin=vmin, vmax=vmax)
+    vmin, vmax = np.inf, -np.inf
+    for panel in panels:
+        if panel.size and not np.isnan(panel).all():
+            vmin = min(vmin, np.nanmin(panel))
+            vmax = max(vmax, np.nanmax(panel))
+    if vmin > vmax:   # no numbers anywhere
+        vmin = vmax = np.nan
+    return Normalize(vmin=vmin, vmax=vmax)
+
+
+def _render_panel(args):
+    """Draws one panel with Agg in a worker; returns its RGBA pixels, or saves it and returns the path."""
+    df, title, options, path = args
+    fig = Figure(figsize=options['panel_size'], dpi=options['dpi'])
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    mappable = draw_heatmap(ax, df, cmap=options['cmap'], norm=options['norm'], **options['kwargs'])
+    if title is not None:
+        ax.set_title(title)
+    if path is None:
+        fig.tight_layout()
+        fig.canvas.draw()
+        return np.asarray(fig.canvas.buffer_rgba()).copy()
+
+    cbar = fig.colorbar(mappable, ax=ax)
+    cbar.outline.set_visible(False)
+    if options['colorbarlabel']:
+        cbar.set_label(options['colorbarlabel'])
+    fig.tight_layout()
+    fig.savefig(path)
+    return path
+
+
+def _render_all(tasks, jobs):
+    if jobs == 1 or len(tasks) <= 1:
+        return list(map(_render_panel, tasks))
+    workers = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        return list(executor.map(_render_panel, tasks, chunksize=chunksize))
+
+
+def _options(norm, cmap, panel_size, dpi, colorbarlabel, kwargs):
+    return {'norm': norm, 'cmap': cmap, 'panel_size': panel_size, 'dpi': dpi,
+            'colorbarlabel': colorbarlabel, 'kwargs': kwargs}
+
+
+def heatmap_grid(dfs, path=None, titles=None, ncols=None, panel_size=(4, 3), dpi=100,
+                 cmap='magma', colorbarlabel=None, norm=None, robust=False, jobs=None, **kwargs):
+    """
+    Draws every DataFrame in `dfs` as a myheatmap panel, `ncols` to a row
+    (default: roughly square), all on `norm` (default: shared_norm(dfs,
+    robust)), with one colorbar for the lot. Panels are rendered in
+    parallel and pasted into the final figure as pixels, so the result is
+    a raster image even when `path` is a PDF.
+
+    Saves to `path` if given and returns the Figure. `jobs` is the number
+    of worker processes (default: one per CPU; 1 renders serially).
+    kwargs go to draw_heatmap.
+    """
+    dfs = list(dfs)
+    if not dfs:
+        raise ValueError("no heatmaps to draw")
+    norm = norm if norm is not None else shared_norm(dfs, robust)
+    titles = list(titles) if titles is not None else [None] * len(dfs)
+    options = _options(norm, cmap, panel_size, dpi, colorbarlabel, kwargs)
+    panels = _render_all([(df, title, options, None) for df, title in zip(dfs, titles)], jobs)
+
+    ncols = ncols or int(np.ceil(np.sqrt(len(panels))))
+    nrows = int(np.ceil(len(panels) / ncols))
+    panel_h, panel_w = panels[0].shape[:2]
+    cbar_w = max(int(0.9 * dpi), 60)
+    fig = Figure(figsize=((ncols * panel_w + cbar_w) / dpi, nrows * panel_h / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    for i, pixels in enumerate(panels):
+        row, col = divmod(i, ncols)
+        # figimage offsets are in pixels from the bottom left.
+        fig.figimage(pixels, xo=col * panel_w, yo=(nrows - 1 - row) * panel_h, origin='upper')
+
+    width = ncols * panel_w + cbar_w
+    cax = fig.add_axes([(ncols * panel_w + 0.15 * cbar_w) / width, 0.1, 0.2 * cbar_w / width, 0.8])
+    cbar = fig.colorbar(ScalarMappable(norm=norm, cmap=colormaps[cmap] if isinstance(cmap, str) else cmap), cax=cax)
+    cbar.outline.set_visible(False)
+    if colorbarlabel:
+        cbar.set_label(colorbarlabel)
+    if path is not None:
+        fig.savefig(path, dpi=dpi)
+    return fig
+
+
+def save_heatmaps(dfs, out_dir, names=None, fmt='png', titles=None, panel_size=(5, 4), dpi=100,
+                  cmap='magma', colorbarlabel=None, norm=None, robust=False, jobs=None, **kwargs):
+    """
+    Saves each DataFrame in `dfs` as its own myheatmap image in `out_dir`
+    (named after `names`, default panel_000, panel_001, ...), all on the
+    same color scale, rendered in parallel. Returns the file paths.
+    """
+    dfs = list(dfs)
+    os.makedirs(out_dir, exist_ok=True)
+    norm = norm if norm is not None else shared_norm(dfs, robust)
+    names = list(names) if names is not None else [f"panel_{i:03d}" for i in range(len(dfs))]
+    titles = list(titles) if titles is not None else [None] * len(dfs)
+    options = _options(norm, cmap, panel_size, dpi, colorbarlabel, kwargs)
+    tasks = [(df, title, options, os.path.join(out_dir, f"{name}.{fmt}"))
+             for df, title, name in zip(dfs, titles, names)]
+    return _render_all(tasks, jobs)
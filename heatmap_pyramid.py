@@ -0,0 +1,276 @@
+"""
+Heatmaps of 2D arrays that are too big to hold in memory or to draw cell by
+cell, such as scanning-microscope maps stored as .npy files or np.memmap.
+
+HeatmapPyramid builds downsampled copies of the array once, each half the
+size of the one before, and caches them on disk. pyramid_heatmap then only
+ever draws about a screenful of cells: the pyramid level that matches how
+far the plot is zoomed in, and only the tiles of it that are in view. It
+refines as you zoom or pan.
+
+example usage:
+
+data = np.load("scan_40GB.npy", mmap_mode='r')
+ax = pyramid_heatmap(data, extent=(0, 2000, 0, 2000), colorbarlabel='counts',
+                     draw_scalebar=True)
+plt.show()
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import matplotlib.pyplot as plt
+from mpl_toolkits.axes_grid1.anchored_artists import AnchoredSizeBar
+
+# Rows are reduced in bands of about this many elements, so building a level
+# never needs more than a few hundred MB whatever the size of the array.
+BAND_ELEMENTS = 2**24
+
+
+def _downsample(band):
+    """Averages 2x2 blocks of `band`, ignoring NaNs; odd edges are averaged over what is there."""
+    rows, cols = band.shape
+    padded = np.full((rows + rows % 2, cols + cols % 2), np.nan)
+    padded[:rows, :cols] = band
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    valid = ~np.isnan(blocks)
+    total = np.where(valid, blocks, 0.0).sum(axis=(1, 3))
+    count = valid.sum(axis=(1, 3))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+class HeatmapPyramid:
+    """
+    An array and its downsampled copies: level 0 is the data itself and
+    each further level averages 2x2 blocks of the one before, down to a
+    level no bigger than `tile` in either direction. Levels are read back
+    in `tile` x `tile` pieces, of which the most recent are kept in memory,
+    up to `cache_bytes` of them (by default 64 MiB: 32 full tiles, a few
+    screenfuls at any level).
+
+    `data` is a 2D array, np.memmap or path to a .npy file. For memory-mapped
+    data the levels are stored as .npy files in `cache_dir` (by default a
+    ".pyramid" directory next to the data) and reused as long as the data
+    file has the same size and modification time; other arrays get their
+    levels built in memory.
+    """
+    def __init__(self, data, cache_dir=None, tile=512, cache_bytes=64 * 2**20):
+        if isinstance(data, (str, os.PathLike)):
+            data = np.load(data, mmap_mode='r')
+        if data.ndim != 2:
+            raise ValueError(f"expected a 2D array, got shape {data.shape}")
+        self.tile = tile
+        self.cache_bytes = cache_bytes
+        self._tiles = OrderedDict()
+        self._cached = 0   # bytes in _tiles
+        self.levels = [data]
+
+        filename = getattr(data, 'filename', None)
+        if filename is None:
+            self._build(None)
+            return
+        if cache_dir is None:
+            cache_dir = os.path.splitext(filename)[0] + '.pyramid'
+        stat = os.stat(filename)
+        key = {'file': os.path.abspath(filename), 'offset': getattr(data, 'offset', 0),
+               'shape': list(data.shape), 'dtype': str(data.dtype), 'size': stat.st_size,
+               'mtime_ns': stat.st_mtime_ns, 'tile': tile}
+        name = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+        self.cache_path = os.path.join(cache_dir, name)
+        if not self._open_cache(key):
+            os.makedirs(self.cache_path, exist_ok=True)
+            self._build(self.cache_path)
+            # Written last, so a build that was interrupted is redone next time.
+            with open(os.path.join(self.cache_path, 'pyramid.json'), 'w') as f:
+                json.dump({'key': key, 'levels': len(self.levels), 'vmin': self.vmin, 'vmax': self.vmax}, f)
+
+    def _open_cache(self, key):
+        try:
+            with open(os.path.join(self.cache_path, 'pyramid.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get('key') != key:
+            return False
+        for level in range(1, meta['levels']):
+            self.levels.append(np.load(os.path.join(self.cache_path, f'level{level}.npy'), mmap_mode='r'))
+        self.vmin, self.vmax = meta['vmin'], meta['vmax']
+        return True
+
+    def _build(self, path):
+        """Builds each level from the one before, a band of rows at a time, noting the data range on the way."""
+        vmin, vmax = np.inf, -np.inf
+        while max(self.levels[-1].shape) > self.tile:
+            source = self.levels[-1]
+            rows, cols = source.shape
+            shape = ((rows + 1) // 2, (cols + 1) // 2)
+            if path is None:
+                level = np.empty(shape)
+            else:
+                level = np.lib.format.open_memmap(os.path.join(path, f'level{len(self.levels)}.npy'),
+                                                  mode='w+', dtype=np.float64, shape=shape)
+            band = max(2, (BAND_ELEMENTS // max(cols, 1)) // 2 * 2)
+            for start in range(0, rows, band):
+                block = np.asarray(source[start:start + band], dtype=np.float64)
+                if len(self.levels) == 1 and np.isfinite(block).any():
+                    vmin = min(vmin, np.nanmin(block))
+                    vmax = max(vmax, np.nanmax(block))
+                level[start // 2:(start + len(block) + 1) // 2] = _downsample(block)
+            if path is not None:
+                level.flush()
+            self.levels.append(level)
+
+        if len(self.levels) == 1:
+            # Small enough to be its own only level.
+            with np.errstate(invalid='ignore'):
+                vmin, vmax = np.nanmin(self.levels[0]), np.nanmax(self.levels[0])
+        self.vmin, self.vmax = float(vmin), float(vmax)
+
+    @property
+    def shape(self):
+        return self.levels[0].shape
+
+    def choose_level(self, rows, cols, height_px, width_px):
+        """The coarsest level that still has at least one cell per screen pixel for a view of rows x cols cells."""
+        cells_per_pixel = max(rows / max(height_px, 1), cols / max(width_px, 1), 1)
+        return min(int(np.log2(cells_per_pixel)), len(self.levels) - 1)
+
+    def _tile(self, level, ty, tx):
+        key = (level, ty, tx)
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+        t = self.tile
+        data = np.asarray(self.levels[level][ty * t:(ty + 1) * t, tx * t:(tx + 1) * t], dtype=np.float64)
+        self._tiles[key] = data
+        self._cached += data.nbytes
+        while self._cached > self.cache_bytes and len(self._tiles) > 1:
+            self._cached -= self._tiles.popitem(last=False)[1].nbytes
+        return data
+
+    def region(self, level, row0, row1, col0, col1):
+        """
+        Cells [row0:row1, col0:col1] of `level`, widened to whole tiles and
+        assembled from them. Returns the array and the (row, col) of its
+        first cell.
+        """
+        t = self.tile
+        rows, cols = self.levels[level].shape
+        ty0, ty1 = max(row0, 0) // t, (min(row1, rows) - 1) // t + 1
+        tx0, tx1 = max(col0, 0) // t, (min(col1, cols) - 1) // t + 1
+        out = np.empty((min((ty1 - ty0) * t, rows - ty0 * t), min((tx1 - tx0) * t, cols - tx0 * t)))
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                tile = self._tile(level, ty, tx)
+                r, c = (ty - ty0) * t, (tx - tx0) * t
+                out[r:r + tile.shape[0], c:c + tile.shape[1]] = tile
+        return out, (ty0 * t, tx0 * t)
+
+
+class PyramidView:
+    """
+    Keeps one AxesImage showing the part of a HeatmapPyramid that is in
+    view, at the level matching the zoom, by listening to the axes limits
+    and the figure size. `extent` is (left, right, bottom, top) of the
+    whole array in data coordinates; row 0 is at the bottom, as in
+    myheatmap.
+    """
+    def __init__(self, ax, pyramid, extent=None, **imshow_kwargs):
+        self.ax = ax
+        self.pyramid = pyramid
+        rows, cols = pyramid.shape
+        self.extent = extent if extent is not None else (0, cols, 0, rows)
+        self._shown = None
+        left, right, bottom, top = self.extent
+        imshow_kwargs.setdefault('vmin', pyramid.vmin)
+        imshow_kwargs.setdefault('vmax', pyramid.vmax)
+        if 'norm' in imshow_kwargs:
+            del imshow_kwargs['vmin'], imshow_kwargs['vmax']
+        self.image = ax.imshow(np.full((1, 1), np.nan), origin='lower', aspect='auto',
+                               interpolation='nearest', extent=self.extent, **imshow_kwargs)
+        ax.set_xlim(left, right)
+        ax.set_ylim(bottom, top)
+        # Closures rather than bound methods: the callback registry only keeps
+        # weak references to methods, and nothing else would keep this view alive.
+        ax.callbacks.connect('xlim_changed', lambda ax: self.refresh())
+        ax.callbacks.connect('ylim_changed', lambda ax: self.refresh())
+        ax.figure.canvas.mpl_connect('resize_event', lambda event: self.refresh())
+        self.refresh()
+
+    def _cells(self, lo, hi, start, stop, n):
+        """The range of cell indices (out of n) between data coordinates lo..hi along an axis spanning start..stop."""
+        a, b = sorted(((lo - start) / (stop - start) * n, (hi - start) / (stop - start) * n))
+        return max(int(np.floor(a)), 0), min(int(np.ceil(b)), n)
+
+    def refresh(self):
+        left, right, bottom, top = self.extent
+        rows, cols = self.pyramid.shape
+        col0, col1 = self._cells(*self.ax.get_xlim(), left, right, cols)
+        row0, row1 = self._cells(*self.ax.get_ylim(), bottom, top, rows)
+        if col1 <= col0 or row1 <= row0:
+            return
+        bbox = self.ax.get_window_extent()
+        level = self.pyramid.choose_level(row1 - row0, col1 - col0, bbox.height, bbox.width)
+        scale = 2**level
+        data, (r, c) = self.pyramid.region(level, row0 // scale, -(-row1 // scale), col0 // scale, -(-col1 // scale))
+        shown = (level, r, c, data.shape)
+        if shown == self._shown:
+            return
+        self._shown = shown
+
+        # Cell edges of this level in data coordinates (a coarse level's last
+        # cell may stick out a little past the data).
+        dx, dy = (right - left) / cols * scale, (top - bottom) / rows * scale
+        self.image.set_data(data)
+        self.image.set_extent((left + c * dx, left + (c + data.shape[1]) * dx,
+                               bottom + r * dy, bottom + (r + data.shape[0]) * dy))
+        self.ax.figure.canvas.draw_idle()
+
+
+# Draws `data` (see HeatmapPyramid) like myheatmap draws a DataFrame, with
+# the same colorbar and scale bar options, and keeps it refined while zooming.
+# extent=(left, right, bottom, top) places the array in data coordinates
+# (default: one unit per cell). kwargs go to imshow(); by default the colors
+# span the full data range.
+def pyramid_heatmap(data, extent=None, colorbarlabel=None, cmap='magma',
+                    draw_scalebar=False,
+                    scalebarargs={'size': 10,
+                                  'label': '10 μm',
+                                  'loc': 'upper right',
+                                  'pad': .3,
+                                  'color': 'k',
+                                  'frameon': False,
+                                  'size_vertical': 0.6},
+                    return_cbar=False,
+                    draw_cbar=True,
+                    cbarargs={'drawedges': False},
+                    cache_dir=None,
+                    ax=None,
+                    **kwargs):
+    pyramid = data if isinstance(data, HeatmapPyramid) else HeatmapPyramid(data, cache_dir=cache_dir)
+    ax = ax if ax is not None else plt.gca()
+    view = PyramidView(ax, pyramid, extent=extent, cmap=cmap, **kwargs)
+    plt.sci(view.image)
+    ax.set_frame_on(False)
+
+    if draw_scalebar:
+        ax.set_aspect('equal')
+        ax.set_xticks([])
+        ax.set_yticks([])
+        left, right, bottom, top = view.extent
+        scalebar = AnchoredSizeBar(ax.transData,
+                                   bbox_to_anchor=(max(left, right), min(bottom, top)), bbox_transform=ax.transData,
+                                   **scalebarargs)
+        ax.add_artist(scalebar)
+
+    if draw_cbar:
+        cbar = plt.colorbar(view.image, ax=ax, **cbarargs)
+        cbar.outline.set_visible(False)
+        if colorbarlabel:
+            cbar.set_label(colorbarlabel)
+        if return_cbar:
+            return ax, cbar
+    return ax
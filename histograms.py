@@ -1,56 +1,268 @@
-import numpy as np
-
-## https://stackoverflow.com/questions/32765333/how-do-i-replicate-this-matlab-function-in-numpy/32765547#32765547
-def histc(X, bins):
-    map_to_bins = np.digitize(X,bins)
-    r = np.zeros(bins.shape)
-    for i in map_to_bins:
-        r[i-1] += 1
-    return [r, map_to_bins]
-
-
-"""
-cumulative distribution function, the integral of a histogram
-"""
-def CDF(S):
-    M = len(S); # size of array = number of elements
-    sorteddata = sort(S); # ascending sort is CDF, descending sort is 1-CDF
-    cum_prob = [elem/M for elem in range(M)] # probability integrated from 0 to sorteddata.
-    cum_prob2 = [1-p for p in cum_prob] # probability integrated from sorteddata to inf
-    return sorteddata,cum_prob2
-
-"""
-nonlinearhistc allows you to make a histogram with a logarithmic (or other nonlinear) set of bins.
-by Viva Horowitz, 2018
-
-example usage:
-
-onbins=np.logspace(np.log10(min(ontimes)-small),np.log10(max(ontimes)+small), numonbins_log)
-onprobs, _ = nonlinearhistc(ontimes, onbins) 
-"""
-def nonlinearhistc(X,bins, thresh=3, verbose = False):
-    map_to_bins = np.digitize(X,bins)
-    r = np.zeros(bins.shape)
-    for i in map_to_bins:
-        r[i-1] += 1
-    if verbose:
-        print r 
-        #print bins
-    ## normalize by bin width
-    probability = np.zeros(bins.shape)
-    area = 0;
-    thinbincount = 0
-    for i in range(len(bins)-1):
-        if r[i]<=1:
-            thinbincount += 1;
-        thisbinwidth = bins[i+1] - bins[i]
-        probability[i] = r[i]/thisbinwidth
-        area += probability[i]*thisbinwidth;
-        
-    if thinbincount > thresh:
-        print("Warning: too many bins for data, thinbincount=" + str(thinbincount))
-    elif verbose:
-        print("thinbincount=" + str(thinbincount))
-    ## normalize area.
-    normedprobability = [eachprobability / area for eachprobability in probability]
-    return normedprobability, map_to_bins
+import numpy as np
+
+# Samples are binned this many at a time, so the temporary bin-index arrays stay
+# small however large (or memory-mapped) the input is.
+CHUNK_SIZE = 2**22
+
+"""
+Bin counts in the layout histc has always returned: element i counts the
+samples with bins[i] <= x < bins[i+1], and the last element counts both the
+samples at or past the last edge and those below the first edge (digitize
+puts those in bin 0, and r[0-1] is the last element).
+
+map_to_bins is the output of np.digitize. A 2D map_to_bins holds one
+dataset per row and gives one row of counts per dataset.
+"""
+def _bin_counts(map_to_bins, nbins, weights=None):
+    map_to_bins = np.asarray(map_to_bins)
+    index = (map_to_bins - 1) % nbins
+    if map_to_bins.ndim == 2:
+        index = index + nbins * np.arange(len(map_to_bins))[:, None]
+    length = nbins * (len(map_to_bins) if map_to_bins.ndim == 2 else 1)
+    w = None if weights is None else np.asarray(weights, dtype=np.float64).ravel()
+    counts = np.bincount(index.ravel(), weights=w, minlength=length).astype(np.float64)
+    return counts.reshape(map_to_bins.shape[:-1] + (nbins,))
+
+## https://stackoverflow.com/questions/32765333/how-do-i-replicate-this-matlab-function-in-numpy/32765547#32765547
+def histc(X, bins, weights=None):
+    map_to_bins = np.digitize(X,bins)
+    r = _bin_counts(map_to_bins, len(bins), weights)
+    return [r, map_to_bins]
+
+
+"""
+cumulative distribution function, the integral of a histogram
+
+Returns the data sorted ascending and, for each value, the fraction of the
+data at or above it (1-CDF). For data too large to sort in memory, use
+QuantileSketch.
+"""
+def CDF(S):
+    sorteddata = np.sort(np.asarray(S), axis=None) # ascending sort is CDF, descending sort is 1-CDF
+    M = len(sorteddata) # size of array = number of elements
+    cum_prob2 = 1 - np.arange(M) / M # probability integrated from sorteddata to inf
+    return sorteddata,cum_prob2
+
+"""
+Turns bin counts into a probability density: each bin (all but the last
+element, which has no right edge) is divided by its width and the whole is
+normalized to unit area. Also returns how many of those bins hold one sample
+or none, per dataset; `entries` gives the raw sample counts for that when
+`counts` are weighted.
+"""
+def normalize_by_bin_width(counts, bins, entries=None):
+    counts = np.asarray(counts, dtype=np.float64)
+    entries = counts if entries is None else np.asarray(entries)
+    widths = np.diff(np.asarray(bins, dtype=np.float64))
+    probability = np.zeros(counts.shape)
+    probability[..., :-1] = counts[..., :-1] / widths
+    area = (probability[..., :-1] * widths).sum(axis=-1, keepdims=True)
+    thinbincount = (entries[..., :-1] <= 1).sum(axis=-1)
+    return probability / area, thinbincount
+
+def _report_thin_bins(thinbincount, thresh, verbose):
+    if np.any(thinbincount > thresh):
+        print("Warning: too many bins for data, thinbincount=" + str(thinbincount))
+    elif verbose:
+        print("thinbincount=" + str(thinbincount))
+
+"""
+nonlinearhistc allows you to make a histogram with a logarithmic (or other nonlinear) set of bins.
+by Viva Horowitz, 2018
+
+X can also be 2D, one dataset per row, to histogram many datasets in one
+call; then the normalized probabilities come back as one row per dataset.
+Optional weights (same shape as X) are summed instead of counting samples.
+
+example usage:
+
+onbins=np.logspace(np.log10(min(ontimes)-small),np.log10(max(ontimes)+small), numonbins_log)
+onprobs, _ = nonlinearhistc(ontimes, onbins)
+"""
+def nonlinearhistc(X,bins, thresh=3, verbose = False, weights=None):
+    map_to_bins = np.digitize(X,bins)
+    r = _bin_counts(map_to_bins, len(bins), weights)
+    if verbose:
+        print(r)
+    entries = r if weights is None else _bin_counts(map_to_bins, len(bins))
+    ## normalize by bin width and area
+    normedprobability, thinbincount = normalize_by_bin_width(r, bins, entries)
+    _report_thin_bins(thinbincount, thresh, verbose)
+    if normedprobability.ndim == 1:
+        normedprobability = list(normedprobability)
+    return normedprobability, map_to_bins
+
+"""
+HistogramAccumulator counts data into fixed bins a chunk at a time, for data
+that doesn't fit in memory (e.g. a memory-mapped array of billions of dwell
+times) or that arrives in pieces. Counts match histc/nonlinearhistc on all of
+the data at once. Accumulators over the same bins can be merged, so pieces
+can be counted in separate processes and combined afterwards.
+
+example usage:
+
+onbins = np.logspace(-3, 2, 60)
+acc = HistogramAccumulator(onbins)
+acc.add(np.load("ontimes.npy", mmap_mode='r'))
+onprobs = acc.nonlinear()
+
+partials = pool.map(count_one_file, files)   # each returns a HistogramAccumulator
+onprobs = sum(partials[1:], partials[0]).nonlinear()
+"""
+class HistogramAccumulator:
+    def __init__(self, bins, n_datasets=None):
+        self.bins = np.asarray(bins, dtype=np.float64)
+        shape = (len(self.bins),) if n_datasets is None else (n_datasets, len(self.bins))
+        self.counts = np.zeros(shape)   # weighted counts, laid out like histc's r
+        self.entries = np.zeros(shape)  # number of samples per bin, for the thin-bin check
+        self.total = 0                  # samples seen, per dataset
+
+    # X is 1D, or 2D with one dataset per row (then n_datasets must match).
+    def add(self, X, weights=None, chunk_size=CHUNK_SIZE):
+        X = np.asarray(X)
+        if X.shape[:-1] != self.counts.shape[:-1]:
+            raise ValueError(f"expected data of shape {self.counts.shape[:-1] + ('n',)}, got {X.shape}")
+        if weights is not None and np.shape(weights) != X.shape:
+            raise ValueError("weights must have the same shape as the data")
+        nbins = len(self.bins)
+        step = max(1, chunk_size // max(1, int(np.prod(X.shape[:-1]))))
+        for start in range(0, X.shape[-1], step):
+            map_to_bins = np.digitize(X[..., start:start + step], self.bins)
+            entries = _bin_counts(map_to_bins, nbins)
+            self.entries += entries
+            if weights is None:
+                self.counts += entries
+            else:
+                self.counts += _bin_counts(map_to_bins, nbins, weights[..., start:start + step])
+        self.total += X.shape[-1]
+        return self
+
+    def merge(self, other):
+        if not np.array_equal(self.bins, other.bins) or self.counts.shape != other.counts.shape:
+            raise ValueError("can only merge histograms with the same bins and number of datasets")
+        self.counts += other.counts
+        self.entries += other.entries
+        self.total += other.total
+        return self
+
+    def __add__(self, other):
+        merged = HistogramAccumulator(self.bins, None if self.counts.ndim == 1 else len(self.counts))
+        return merged.merge(self).merge(other)
+
+    # The same normalized probabilities nonlinearhistc gives for all the data added so far.
+    def nonlinear(self, thresh=3, verbose=False):
+        if verbose:
+            print(self.counts)
+        normedprobability, thinbincount = normalize_by_bin_width(self.counts, self.bins, self.entries)
+        _report_thin_bins(thinbincount, thresh, verbose)
+        return normedprobability
+
+"""
+QuantileSketch is a streaming, mergeable approximation of the distribution
+of a dataset (a KLL sketch). It keeps a few thousand samples however much
+data goes in, and its CDF is off by no more than about `eps` in probability
+(e.g. eps=0.01 means the fraction below any x is within roughly 1%). Like
+HistogramAccumulator it reads arrays a chunk at a time, and sketches of
+parts of the data, e.g. from separate processes, can be merged.
+
+example usage:
+
+sketch = QuantileSketch(eps=0.005)
+for path in files:
+    sketch.add(np.load(path, mmap_mode='r'))
+times, one_minus_cdf = sketch.curve()    # like CDF(alltimes), but approximate
+plt.loglog(times, one_minus_cdf)
+"""
+class QuantileSketch:
+    def __init__(self, eps=0.01, seed=None):
+        self.eps = eps
+        self.k = max(8, int(np.ceil(2.0 / eps))) # items kept in the top level
+        self.levels = [np.empty(0)]              # an item at level h stands for 2**h samples
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, h):
+        # Lower levels hold geometrically fewer items than the top one.
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - h))))
+
+    def _compress(self):
+        # Any level over capacity is sorted and every other item (starting at a
+        # random one of the first two) moves up a level, at twice the weight.
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) <= self._capacity(h):
+                h += 1
+                continue
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            even = len(level) - len(level) % 2
+            promoted = np.sort(level[:even])[self._rng.integers(2)::2]
+            self.levels[h] = level[even:]
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h = 0 # a new top level shrinks the capacity of the ones below it
+
+    # NaNs are skipped.
+    def add(self, X, chunk_size=CHUNK_SIZE):
+        X = np.asarray(X).reshape(-1)
+        for start in range(0, len(X), chunk_size):
+            chunk = np.asarray(X[start:start + chunk_size], dtype=np.float64)
+            chunk = chunk[~np.isnan(chunk)]
+            if len(chunk) == 0:
+                continue
+            self.n += len(chunk)
+            self.min = min(self.min, chunk.min())
+            self.max = max(self.max, chunk.max())
+            self.levels[0] = np.concatenate([self.levels[0], chunk])
+            self._compress()
+        return self
+
+    def merge(self, other):
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def __add__(self, other):
+        merged = QuantileSketch(min(self.eps, other.eps))
+        return merged.merge(self).merge(other)
+
+    def _weighted(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0**h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        return values[order], weights[order]
+
+    # The approximate fraction of the data <= x, for each x.
+    def cdf(self, x):
+        values, weights = self._weighted()
+        below = np.concatenate([[0.0], np.cumsum(weights)])
+        return below[np.searchsorted(values, x, side='right')] / self.n
+
+    # Approximate quantiles (q in [0, 1]); q=0 and q=1 give the exact min and max.
+    def quantile(self, q):
+        values, weights = self._weighted()
+        q = np.asarray(q, dtype=np.float64)
+        position = np.searchsorted(np.cumsum(weights), q * self.n, side='left')
+        result = values[np.minimum(position, len(values) - 1)]
+        return np.where(q <= 0, self.min, np.where(q >= 1, self.max, result))
+
+    # Approximate CDF curve in the form CDF() returns it: values ascending,
+    # and for each the fraction of the data at or above it (1-CDF). With
+    # `points`, the curve is sampled at that many evenly spaced quantiles.
+    def curve(self, points=None):
+        if points is None:
+            values, weights = self._weighted()
+            below = np.cumsum(weights) - weights
+        else:
+            probabilities = np.linspace(0, 1, points)
+            values = self.quantile(probabilities)
+            below = probabilities * self.n
+        return values, 1 - below / self.n
@@ -0,0 +1,320 @@
+"""
+Live data for HamiltonPlotter.
+
+A LiveSource follows a growing CSV/TSV file (like `tail -f`) or reads lines
+from a local socket on a background thread, and hands over blocks of parsed
+rows through a queue. The GUI keeps the newest rows in a RingBuffer and can
+keep a straight-line fit up to date with RunningLineFit, without ever
+re-reading or re-fitting the whole history.
+
+example usage:
+
+source = open_source("instrument_log.tsv")   # or "localhost:5555", "unix:/tmp/daq.sock"
+source.start()
+...
+buffer = RingBuffer(source.columns, capacity=100000)
+while not source.blocks.empty():
+    buffer.append(source.blocks.get())
+"""
+
+import io
+import os
+import queue
+import socket
+import threading
+
+import numpy as np
+import pandas as pd
+
+import plotter_engine as engine
+
+
+class RingBuffer:
+    """
+    The newest `capacity` rows of a table of floats.
+
+    Every row is written twice, `capacity` rows apart, so the rows currently
+    held are always one contiguous slice of the storage and view() never has
+    to copy. Each column of the view is contiguous too (Fortran order).
+    """
+    def __init__(self, columns, capacity):
+        self.columns = list(columns)
+        self.capacity = int(capacity)
+        if self.capacity < 1:
+            raise ValueError("Ring buffer capacity must be at least 1.")
+        self._data = np.full((2 * self.capacity, len(self.columns)), np.nan, order='F')
+        self._end = 0     # where the next row goes, in [0, capacity)
+        self.count = 0    # rows currently held
+        self.total = 0    # rows ever appended
+
+    def __len__(self):
+        return self.count
+
+    def view(self):
+        """The rows held, oldest first, as a (count, n_columns) view into the buffer."""
+        stop = self._end + self.capacity
+        return self._data[stop - self.count:stop]
+
+    def append(self, rows):
+        """
+        Adds a (n, n_columns) block of rows and returns a copy of the rows
+        that no longer fit, oldest first (possibly some of `rows` itself).
+        """
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(self.columns))
+        n = len(rows)
+        n_evicted = max(0, self.count + n - self.capacity)
+        held = min(n_evicted, self.count)
+        evicted = np.concatenate([self.view()[:held], rows[:n_evicted - held]])
+
+        rows = rows[-self.capacity:]
+        positions = (self._end + np.arange(len(rows))) % self.capacity
+        self._data[positions] = rows
+        self._data[positions + self.capacity] = rows
+        self._end = (self._end + len(rows)) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+        self.total += n
+        return evicted
+
+
+class RunningLineFit:
+    """
+    Straight-line fits of several Y columns against one X column, kept up
+    to date from sufficient statistics: add() the rows that arrive and
+    remove() the rows that leave, and result() is always the fit of what is
+    currently held. Weighting follows engine.batch_linear_fit: columns with
+    an uncertainty column are weighted by 1/sigma**2, and fall back to
+    unweighted (with a note saying so) while any of the rows held has a zero
+    uncertainty. An `x_err_col` leaves the columns without an uncertainty
+    unweighted, as in batch_linear_fit; effective-variance weights depend on
+    the slope, which sums can't follow, so X uncertainties together with Y
+    ones raise ValueError (see follows()).
+
+    Sums are taken about a fixed origin (the first rows seen) so that adding
+    and removing millions of rows does not lose precision.
+    """
+    def __init__(self, columns, x_col, y_cols, y_err_cols=None, x_err_col=None):
+        y_err_cols = y_err_cols or {}
+        if not self.follows(y_cols, y_err_cols, x_err_col):
+            raise ValueError("A running fit can't be weighted by X uncertainties.")
+        index = {col: i for i, col in enumerate(columns)}
+        self.y_cols = list(y_cols)
+        self._x = index[x_col]
+        self._y = [index[col] for col in self.y_cols]
+        self._err = [None if y_err_cols.get(col) is None else index[y_err_cols[col]] for col in self.y_cols]
+        self.weighted = np.array([e is not None for e in self._err])
+        self._notes = ['' if e is not None or x_err_col is None else engine.NO_Y_UNCERTAINTY for e in self._err]
+        k = len(self.y_cols)
+        # Unweighted and weighted: sums S, Sx, Sy, Sxx, Sxy, the sum of y**2 and the point count.
+        self._sums = np.zeros((2, 5, k))
+        self._syy = np.zeros((2, k))
+        self._n = np.zeros((2, k), dtype=np.int64)
+        self._zeros = np.zeros(k, dtype=np.int64)   # rows held with a zero uncertainty
+        self._origin = None
+
+    @staticmethod
+    def follows(y_cols, y_err_cols=None, x_err_col=None):
+        """True if a running fit can keep these fits as batch_linear_fit would make them."""
+        return x_err_col is None or not any((y_err_cols or {}).get(col) for col in y_cols)
+
+    def _accumulate(self, rows, sign):
+        if len(rows) == 0:
+            return
+        if self._origin is None:
+            with np.errstate(invalid='ignore'):
+                self._origin = (np.nan_to_num(np.nanmean(rows[:, self._x])),
+                                np.nan_to_num(np.nanmean(rows[:, self._y], axis=0)))
+        x0, y0 = self._origin
+        x = rows[:, self._x] - x0
+        Y = rows[:, self._y] - y0[None, :]
+        valid = ~np.isnan(Y) & ~np.isnan(x)[:, None]
+        x = np.where(np.isnan(x), 0.0, x)
+        Y = np.where(valid, Y, 0.0)
+        W = valid.astype(float)
+        self._add_sums(0, x, Y, W, valid, sign)
+
+        if self.weighted.any():
+            # As in batch_linear_fit: rows with no uncertainty are left out, and zeros are counted.
+            usable = valid.copy()
+            for i, e in enumerate(self._err):
+                if e is None:
+                    continue
+                var = rows[:, e]**2
+                usable[:, i] &= ~np.isnan(var)
+                zero = usable[:, i] & ~(var > 0)
+                self._zeros[i] += int(sign) * zero.sum()
+                with np.errstate(divide='ignore'):
+                    W[:, i] = np.where(usable[:, i] & ~zero, 1.0 / var, 0.0)
+            self._add_sums(1, x, Y, W, usable, sign)
+
+    def _add_sums(self, which, x, Y, W, used, sign):
+        self._sums[which] += sign * engine._fit_sums(x, Y, W)
+        self._syy[which] += sign * (W * Y * Y).sum(axis=0)
+        self._n[which] += int(sign) * used.sum(axis=0)
+
+    def add(self, rows):
+        """Includes a block of rows (laid out like the ring buffer) in the fit."""
+        self._accumulate(np.asarray(rows, dtype=np.float64), 1.0)
+
+    def remove(self, rows):
+        """Takes back rows that were added earlier, e.g. rows evicted from the ring buffer."""
+        self._accumulate(np.asarray(rows, dtype=np.float64), -1.0)
+
+    def result(self, x_min, x_max):
+        """The current fits as an engine.BatchFit; x_min/x_max set where the lines are drawn."""
+        x0, y0 = self._origin if self._origin is not None else (0.0, np.zeros(len(self.y_cols)))
+        weighted = self.weighted & (self._zeros == 0)
+        notes = [engine.ZERO_UNCERTAINTY if w and zeros else note
+                 for w, zeros, note in zip(self.weighted, self._zeros, self._notes)]
+        sums = np.where(weighted[None, :], self._sums[1], self._sums[0])
+        syy = np.where(weighted, self._syy[1], self._syy[0])
+        n = np.where(weighted, self._n[1], self._n[0])
+        S, Sx, Sy, Sxx, Sxy = sums
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope, intercept, _ = engine._solve_line(sums)
+            # Residual sum of squares straight from the sums (all about the origin).
+            chi2 = (syy - 2 * intercept * Sy - 2 * slope * Sxy
+                    + intercept**2 * S + 2 * intercept * slope * Sx + slope**2 * Sxx)
+            total = syy - Sy**2 / S
+        k = len(self.y_cols)
+        return engine.fit_from_sums(self.y_cols, sums, np.maximum(chi2, 0.0), total, n, weighted,
+                                    np.full(k, x_min), np.full(k, x_max), x0=x0, y0=y0, notes=notes)
+
+
+def parse_rows(data, columns, separator):
+    """Numeric rows from complete lines of bytes; anything that is not a number becomes NaN."""
+    data = engine.drop_comment_lines(data)
+    if not data.strip():
+        return np.empty((0, len(columns)))
+    frame = pd.read_csv(io.BytesIO(data), sep=separator, header=None, names=columns, index_col=False,
+                        encoding_errors='replace')
+    return frame.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+class LiveSource(threading.Thread):
+    """
+    Reads data in the background. The first non-comment line is the header
+    (comma-separated if it has a comma, tab-separated otherwise); once it
+    has arrived `columns` is set. After that, every batch of complete lines
+    is parsed and put on `blocks` as a (n, n_columns) float array. If
+    reading fails, `error` is set and the thread ends.
+    """
+    def __init__(self, poll_interval=0.05):
+        super().__init__(daemon=True)
+        self.poll_interval = poll_interval
+        self.blocks = queue.Queue()
+        self.columns = None
+        self.header = None        # an empty DataFrame with the columns, once known
+        self.separator = None
+        self.error = None
+        self.finished = False
+        self._stop_event = threading.Event()
+        self._pending = b''
+        self._skip_header = False # the source restarted; its header line is already known
+
+    def stop(self):
+        self._stop_event.set()
+
+    def read(self):
+        """Returns newly available bytes, or b'' if there is nothing yet."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set() and not self.finished:
+                data = self.read()
+                if data:
+                    self._feed(data)
+                else:
+                    self._stop_event.wait(self.poll_interval)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.close()
+
+    def restart(self):
+        """Forgets any partial line and expects the header again (the source started over)."""
+        self._pending = b''
+        self._skip_header = self.columns is not None
+
+    def _feed(self, data):
+        data = self._pending + data
+        cut = data.rfind(b'\n') + 1
+        self._pending = data[cut:]
+        complete = engine.drop_comment_lines(data[:cut])
+
+        if self.columns is None or self._skip_header:
+            stripped = complete.lstrip()
+            if not stripped:
+                return
+            header, _, complete = stripped.partition(b'\n')
+            if self._skip_header:
+                self._skip_header = False
+            else:
+                header = header.decode('utf-8', errors='replace').rstrip('\r')
+                self.separator = ',' if ',' in header else '\t'
+                self.columns = [name.strip() for name in header.split(self.separator)]
+                self.header = pd.DataFrame(columns=self.columns)
+
+        rows = parse_rows(complete, self.columns, self.separator)
+        if len(rows):
+            self.blocks.put(rows)
+
+
+class FileTailer(LiveSource):
+    """Follows a file that an instrument keeps appending to, starting from its beginning."""
+    def __init__(self, path, chunk_bytes=1 << 20, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+        self._file = open(path, 'rb')
+
+    def read(self):
+        # A file that got shorter was truncated or replaced: start over.
+        if os.fstat(self._file.fileno()).st_size < self._file.tell():
+            self._file.seek(0)
+            self.restart()
+        return self._file.read(self.chunk_bytes)
+
+    def close(self):
+        self._file.close()
+
+
+class SocketSource(LiveSource):
+    """
+    Reads lines from a local TCP ("host:port") or Unix-domain ("unix:/path")
+    socket that an acquisition program writes to. Ends when the other side
+    closes the connection.
+    """
+    def __init__(self, address, **kwargs):
+        super().__init__(**kwargs)
+        if address.startswith('unix:'):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(address[len('unix:'):])
+        else:
+            host, _, port = address.rpartition(':')
+            self._socket = socket.create_connection((host or 'localhost', int(port)), timeout=5)
+        self._socket.settimeout(self.poll_interval)
+
+    def read(self):
+        try:
+            data = self._socket.recv(1 << 16)
+        except socket.timeout:
+            return b''
+        if not data:
+            self.finished = True
+        return data
+
+    def close(self):
+        self._socket.close()
+
+
+def open_source(spec, **kwargs):
+    """A FileTailer for an existing file path, otherwise a SocketSource for "host:port" or "unix:/path"."""
+    if os.path.exists(spec):
+        return FileTailer(spec, **kwargs)
+    if spec.startswith('unix:') or ':' in spec:
+        return SocketSource(spec, **kwargs)
+    raise FileNotFoundError(f"No such file, and not a host:port or unix:/path socket address: {spec}")
@@ -0,0 +1,132 @@
+"""
+Loading the trends.csv net-worth export from mint.com, as in the "Net worth
+plotter using Mint exported data" notebook, with whole-column operations
+instead of per-cell converters.
+
+load_trends reads one export. update_history merges a new export into a
+cached history file, so months that have dropped out of Mint's export are
+kept, and reloading an unchanged export is just reading the cache.
+
+example usage:
+
+df = load_trends('trends.csv')
+df = update_history('trends.csv', 'trends_history.pkl')   # keeps every month ever exported
+plt.plot(df['Dates'], df['Net'])
+"""
+
+import datetime
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+# Mint dates each month by its first day; the notebook moves it to near the
+# end of the month, when the balances were actually recorded.
+DATE_OFFSET = pd.Timedelta(days=27)
+
+# Mint's column names before 2022 (see the notebook); later exports are renamed to these.
+RENAMES = {'DATES': 'Dates', 'NET': 'Net'}
+
+
+def parse_currency(values):
+    """
+    Accounting-format amounts ("$1,234.56", "($99.00)", "-$5") to floats,
+    for a whole column at once. Parentheses mean negative. Anything that is
+    not an amount becomes NaN; numbers pass through unchanged.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return values.astype(np.float64)
+    text = values.astype('string').str.strip()
+    negative = text.str.startswith('(') & text.str.endswith(')')
+    cleaned = text.str.replace(r'[$,()\s]', '', regex=True)
+    amounts = pd.to_numeric(cleaned, errors='coerce').astype(np.float64)
+    return amounts.where(~negative.fillna(False).astype(bool), -amounts)
+
+
+def normalize_dates(values, offset=DATE_OFFSET):
+    """Parses a whole column of dates in one call and shifts them by `offset`."""
+    return pd.to_datetime(pd.Series(values), errors='coerce') + offset
+
+
+def drop_duplicate_dates(df):
+    """
+    Mint sometimes exports a month twice. Like the notebook, which drops the
+    row before each duplicate, this keeps the last row for each date.
+    """
+    return df[~df['Dates'].duplicated(keep='last')].reset_index(drop=True)
+
+
+def clip_future(df, now=None):
+    """
+    Mint exports the current month too, dated in the future; like the
+    notebook, date the last row now instead if it is in the future.
+    Returns a copy.
+    """
+    now = pd.Timestamp(now if now is not None else datetime.datetime.now())
+    df = df.copy()
+    if len(df) and df.at[df.index[-1], 'Dates'] > now:
+        df.at[df.index[-1], 'Dates'] = now
+    return df
+
+
+def _normalize(raw):
+    """The parsed columns of a raw (all-string) export, in the notebook's layout, before deduplication."""
+    raw = raw.rename(columns=RENAMES)
+    df = pd.DataFrame({'Dates': normalize_dates(raw['Dates'])})
+    for col in raw.columns:
+        if col != 'Dates':
+            df[col] = parse_currency(raw[col])
+    if 'Debts' in df:
+        # In 2022 Mint started exporting debts as negative; flip them back to the way they've always been.
+        df['Debts'] = -df['Debts']
+    return df.dropna(subset=['Dates'])
+
+
+def read_export(path):
+    """One trends.csv, parsed and deduplicated, but with the current month's future date left alone."""
+    raw = pd.read_csv(path, dtype=str, keep_default_na=False)
+    return drop_duplicate_dates(_normalize(raw))
+
+
+def load_trends(path, now=None):
+    """
+    The notebook's DataFrame for one trends.csv: Dates, Assets, Debts (as
+    positive amounts), Net and any other columns, one row per month.
+    """
+    return clip_future(read_export(path), now)
+
+
+def update_history(path, history_path, now=None):
+    """
+    Merges the export at `path` into the history saved at `history_path`
+    and returns the result (like load_trends). Months in both take the
+    export's numbers, since Mint revises recent months; months only in the
+    history are kept. When the export hasn't changed since the last merge
+    (same size and modification time) the history is returned without
+    parsing anything.
+    """
+    stat = os.stat(path)
+    source = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    history = None
+    try:
+        with open(history_path, 'rb') as f:
+            saved = pickle.load(f)
+        history = saved['history']
+        if saved['source'] == source:
+            return clip_future(history, now)
+    except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+        pass
+
+    export = read_export(path)
+    if history is not None:
+        export = pd.concat([history, export], ignore_index=True)
+        export = export[~export['Dates'].duplicated(keep='last')].sort_values('Dates', kind='stable')
+        export = export.reset_index(drop=True)
+
+    tmp_path = history_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'source': source, 'history': export}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, history_path)
+    return clip_future(export, now)
@@ -1,78 +1,166 @@
-"""
-My heatmap functions similarly to seaborn.heatmap but it makes a plot with
-numeric axes.
-"""
-import matplotlib.pyplot as plt 
-from mpl_toolkits.axes_grid1.anchored_artists import AnchoredSizeBar
-
-
-
-# Create a listwrap that wraps around the list 
-# This is what I need for pcolormesh.
-def listwrap(currentlist):
-    # Ideally the dimensions of X and Y should be one greater than those of C; 
-    # if the dimensions are the same, then the last row and column of C will be ignored.
-    listwrap = [0] * (len(currentlist)+1)
-    for i in range(len(currentlist)):
-        try:
-            listwrap[i+1] = ((currentlist[i]+currentlist[i+1])/2)
-        except IndexError:
-            pass
-    topstep = listwrap[2]-listwrap[1]
-    listwrap[0]=listwrap[1]-topstep
-    botstep = listwrap[-2]-listwrap[-3]
-    listwrap[-1]=listwrap[-2]+botstep
-    return listwrap
-
-# df is a pandas dataframe
-# myheatmap is supposed to work almost exactly like seaborn heatmap. 
-# the 'rocket' cmap is the same as the default seaborn heatmap.
-# kwargs go to pcolormesh().
-def myheatmap(df, colorbarlabel=None, cmap = 'magma', 
-              draw_scalebar = False,
-              scalebarargs={'size':10, 
-                            'label':'10 μm', 
-                            'loc':'upper right', 
-                            'pad':.3, 
-                            'color':'k', 
-                            'frameon':False, 
-                            'size_vertical':0.6},
-              return_cbar = False,
-              draw_cbar = True,
-              cbarargs={'drawedges':False},
-              **kwargs):
-    plt.pcolormesh( listwrap(df.columns),listwrap(df.index), df, cmap=cmap, **kwargs)
-    plt.xlabel(df.columns.name)
-    plt.ylabel(df.index.name)
-    ax = plt.gca()
-	# Choose aesthetics similar to seaborn heatmap. In particular, no frames.
-	
-    ax.set_frame_on(False)
-    
-    if draw_scalebar:
-        ax.axis('equal');
-        
-        plt.xlabel('')
-        plt.ylabel('')
-        topx = df.columns.max()
-        boty = df.index.min()
-        plt.yticks([]) # remove y ticks
-        plt.xticks([])
-    
-        scalebar = AnchoredSizeBar(ax.transData,
-                            bbox_to_anchor=(topx,boty), bbox_transform=ax.transData,
-                            **scalebarargs)
-
-        ax.add_artist(scalebar)
-    
-    if draw_cbar:
-        cbar = plt.colorbar(**cbarargs)
-        cbar.outline.set_visible(False)
-        if colorbarlabel:
-            cbar.set_label(colorbarlabel)
-        if return_cbar:
-            return ax, cbar
-        else:
-            return ax
-    else:
-        return ax # cannot return colorbar if it's not drawn
+"""
+My heatmap functions similarly to seaborn.heatmap but it makes a plot with
+numeric axes.
+"""
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt 
+import matplotlib.dates as mdates
+from mpl_toolkits.axes_grid1.anchored_artists import AnchoredSizeBar
+
+# pcolormesh options that imshow has no equivalent for; passing any of them
+# keeps the heatmap on the mesh.
+MESH_ONLY_KWARGS = {'edgecolors', 'edgecolor', 'ec', 'linewidth', 'linewidths', 'lw',
+                    'shading', 'antialiased', 'antialiaseds', 'snap'}
+
+
+# Create a listwrap that wraps around the list 
+# This is what I need for pcolormesh.
+# Works on numbers and on dates/times; for anything else (say category
+# names) use positions 0, 1, 2, ... instead, as axis_positions does.
+def listwrap(currentlist):
+    # Ideally the dimensions of X and Y should be one greater than those of C; 
+    # if the dimensions are the same, then the last row and column of C will be ignored.
+    values = np.asarray(currentlist)
+    if len(values) < 3:
+        # Too short to take the outer steps from the midpoints: pad by half a step
+        # (for a single value, a step of 1, 1 day for dates or 1 second for durations).
+        if len(values) == 2:
+            step = values[1] - values[0]
+        elif np.issubdtype(values.dtype, np.datetime64):
+            step = np.timedelta64(24, 'h')   # even, so half a step is exact
+        elif np.issubdtype(values.dtype, np.timedelta64):
+            step = np.timedelta64(1000, 'ms')
+        else:
+            step = 1
+        return np.concatenate([values[:1] - step / 2, values + step / 2])
+    midpoints = values[:-1] + (values[1:] - values[:-1]) / 2
+    topstep = midpoints[1] - midpoints[0]
+    botstep = midpoints[-1] - midpoints[-2]
+    return np.concatenate([midpoints[:1] - topstep, midpoints, midpoints[-1:] + botstep])
+
+# The coordinates to draw an axis' cells at, and the tick labels they need
+# if the axis isn't numeric (None if it is).
+# Numbers stay as they are, dates become datetime64 and anything else
+# (strings, categories) is placed at 0, 1, 2, ... and labelled.
+def axis_positions(index):
+    index = pd.Index(index)
+    if isinstance(index.dtype, pd.DatetimeTZDtype):
+        return index.tz_localize(None).to_numpy(), None
+    if pd.api.types.is_datetime64_dtype(index.dtype) or pd.api.types.is_timedelta64_dtype(index.dtype):
+        return index.to_numpy(), None
+    if pd.api.types.is_numeric_dtype(index.dtype) and not pd.api.types.is_bool_dtype(index.dtype):
+        return index.to_numpy(dtype=float), None
+    return np.arange(len(index), dtype=float), [str(label) for label in index]
+
+# Cell edges as plain floats (dates as matplotlib date numbers), and whether
+# they are evenly spaced to within `tolerance` of a cell, so that the
+# cells can be drawn as the pixels of one image.
+def _uniform_edges(edges, tolerance=0.01):
+    if np.issubdtype(edges.dtype, np.datetime64):
+        edges = mdates.date2num(edges)
+    elif np.issubdtype(edges.dtype, np.timedelta64):
+        edges = edges / np.timedelta64(1, 's')
+    edges = np.asarray(edges, dtype=float)
+    step = (edges[-1] - edges[0]) / (len(edges) - 1)
+    if step == 0 or not np.all(np.isfinite(edges)):
+        return edges, False
+    even = edges[0] + step * np.arange(len(edges))
+    return edges, bool(np.max(np.abs(edges - even)) <= tolerance * abs(step))
+
+# Draws the heatmap of df into ax (any Axes, with or without pyplot) and
+# returns the image or mesh, for a colorbar. myheatmap without the pyplot
+# state, colorbar and scale bar; the arguments are the same.
+def draw_heatmap(ax, df, cmap = 'magma', method = 'auto', **kwargs):
+    x, xlabels = axis_positions(df.columns)
+    y, ylabels = axis_positions(df.index)
+    xedges = listwrap(x)
+    yedges = listwrap(y)
+    C = df.to_numpy()
+
+    if method == 'auto':
+        use_image = not MESH_ONLY_KWARGS.intersection(kwargs)
+    else:
+        use_image = method == 'imshow'
+    if use_image:
+        xflat, xeven = _uniform_edges(xedges)
+        yflat, yeven = _uniform_edges(yedges)
+        use_image = (xeven and yeven) or method == 'imshow'
+
+    if use_image:
+        # Like pcolormesh, put the first row/column at the first index/column
+        # value; flipping decreasing axes keeps them from being drawn inverted.
+        if xflat[-1] < xflat[0]:
+            xflat, C = xflat[::-1], C[:, ::-1]
+        if yflat[-1] < yflat[0]:
+            yflat, C = yflat[::-1], C[::-1]
+        mappable = ax.imshow(C, cmap=cmap, origin='lower', aspect='auto', interpolation='nearest',
+                             extent=(xflat[0], xflat[-1], yflat[0], yflat[-1]), **kwargs)
+        if np.issubdtype(x.dtype, np.datetime64):
+            ax.xaxis_date()
+        if np.issubdtype(y.dtype, np.datetime64):
+            ax.yaxis_date()
+    else:
+        mappable = ax.pcolormesh(xedges, yedges, C, cmap=cmap, **kwargs)
+    if xlabels is not None:
+        ax.set_xticks(x, xlabels)
+    if ylabels is not None:
+        ax.set_yticks(y, ylabels)
+    ax.set_xlabel(df.columns.name)
+    ax.set_ylabel(df.index.name)
+	# Choose aesthetics similar to seaborn heatmap. In particular, no frames.
+	
+    ax.set_frame_on(False)
+    return mappable
+
+# df is a pandas dataframe
+# myheatmap is supposed to work almost exactly like seaborn heatmap. 
+# the 'rocket' cmap is the same as the default seaborn heatmap.
+# kwargs go to pcolormesh(), or imshow() when the grid is regular.
+# method='auto' draws evenly spaced df.columns and df.index as a single image
+# (much faster, and lighter, than one mesh quad per cell for big maps) and
+# anything irregular with pcolormesh; 'imshow' or 'pcolormesh' forces one.
+def myheatmap(df, colorbarlabel=None, cmap = 'magma', 
+              draw_scalebar = False,
+              scalebarargs={'size':10, 
+                            'label':'10 μm', 
+                            'loc':'upper right', 
+                            'pad':.3, 
+                            'color':'k', 
+                            'frameon':False, 
+                            'size_vertical':0.6},
+              return_cbar = False,
+              draw_cbar = True,
+              cbarargs={'drawedges':False},
+              method = 'auto',
+              **kwargs):
+    ax = plt.gca()
+    plt.sci(draw_heatmap(ax, df, cmap=cmap, method=method, **kwargs))
+    
+    if draw_scalebar:
+        ax.axis('equal');
+        
+        plt.xlabel('')
+        plt.ylabel('')
+        topx = df.columns.max()
+        boty = df.index.min()
+        plt.yticks([]) # remove y ticks
+        plt.xticks([])
+    
+        scalebar = AnchoredSizeBar(ax.transData,
+                            bbox_to_anchor=(topx,boty), bbox_transform=ax.transData,
+                            **scalebarargs)
+
+        ax.add_artist(scalebar)
+    
+    if draw_cbar:
+        cbar = plt.colorbar(**cbarargs)
+        cbar.outline.set_visible(False)
+        if colorbarlabel:
+            cbar.set_label(colorbarlabel)
+        if return_cbar:
+            return ax, cbar
+        else:
+            return ax
+    else:
+        return ax # cannot return colorbar if it's not drawn
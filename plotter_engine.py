@@ -0,0 +1,1072 @@
+"""
+Tk-free plotting and fitting engine behind HamiltonPlotter.
+
+Everything in here works on plain pandas/numpy data and a Matplotlib Axes,
+so the same parse -> coerce -> errorbar -> fit steps can be used by the GUI,
+by batch scripts, or on a machine with no display at all.
+"""
+
+import io
+import mmap
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from matplotlib import rcParams
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba
+from matplotlib.container import ErrorbarContainer
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+
+
+def _linregress():
+    """
+    scipy.stats.linregress, or None if scipy is not available. Scipy is
+    needed for detailed linear regression stats; scipy.stats takes about a
+    second to import, so that happens the first time a fit asks for it.
+    """
+    global _linregress_function
+    if _linregress_function is False:
+        try:
+            from scipy.stats import linregress
+        except ImportError:
+            linregress = None
+        _linregress_function = linregress
+    return _linregress_function
+
+
+_linregress_function = False   # not imported yet
+
+
+# Result of a linear fit. x_min/x_max are the range of the fitted data,
+# which is where the fit line gets drawn. reduced_chi2 is only meaningful
+# for fits weighted by uncertainties.
+LinearFit = namedtuple('LinearFit', ['slope', 'intercept', 'slope_stderr', 'intercept_stderr',
+                                     'r_squared', 'n', 'x_min', 'x_max', 'reduced_chi2', 'weighted', 'note'],
+                       defaults=[np.nan, False, ''])
+
+
+# A whole line that is a comment: optional blanks, then '#'.
+_COMMENT_LINE = re.compile(rb'^[ \t\r\f\v]*#[^\n]*(?:\n|\Z)', re.MULTILINE)
+_NOT_BLANK = re.compile(rb'\S')
+
+# Rows parsed per chunk when loading; progress and cancellation are checked between chunks.
+LOAD_CHUNK_ROWS = 50000
+
+
+class LoadCancelled(Exception):
+    """Raised inside a load when its cancel event has been set."""
+
+
+def drop_comment_lines(data):
+    """`data` (bytes) without its comment lines."""
+    return _COMMENT_LINE.sub(b'', data)
+
+
+def _content_segments(buf):
+    """(start, end) byte ranges of `buf` that are not comment lines, found with one regex scan."""
+    segments = []
+    start = 0
+    for match in _COMMENT_LINE.finditer(buf):
+        if match.start() > start:
+            segments.append((start, match.start()))
+        start = match.end()
+    if start < len(buf):
+        segments.append((start, len(buf)))
+    return segments
+
+
+class _SegmentReader(io.RawIOBase):
+    """
+    A read-only binary file over selected byte ranges of a buffer (bytes or
+    mmap), so comment lines can be skipped without copying the data.
+    """
+    def __init__(self, buf, segments):
+        super().__init__()
+        self._buf = buf
+        self._segments = segments
+        self._index = 0
+        self._pos = segments[0][0] if segments else 0
+        self.consumed = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._index < len(self._segments):
+            start, end = self._segments[self._index]
+            self._pos = max(self._pos, start)
+            if self._pos < end:
+                n = min(len(b), end - self._pos)
+                b[:n] = self._buf[self._pos:self._pos + n]
+                self._pos += n
+                self.consumed += n
+                return n
+            self._index += 1
+        return 0
+
+
+def parse_buffer(buf, encoding='utf-8', chunk_rows=LOAD_CHUNK_ROWS, progress=None, cancel_event=None):
+    """
+    Parses spreadsheet-style bytes (CSV or tab-separated, with a header row)
+    into a DataFrame, in chunks of `chunk_rows` rows. `buf` can be bytes or
+    an mmap. Comment lines starting with '#' and all-blank rows are dropped.
+
+    `progress` is called with the fraction of the data parsed so far after
+    every chunk, and setting `cancel_event` (a threading.Event) stops the
+    load with LoadCancelled. Raises ValueError if there is nothing to plot.
+    """
+    if _NOT_BLANK.search(buf) is None:
+        raise ValueError("Input data is empty.")
+
+    segments = _content_segments(buf)
+    total = sum(end - start for start, end in segments) or 1
+    has_comma = any(buf.find(b',', start, end) >= 0 for start, end in segments)
+    separator = ',' if has_comma else '\t'
+
+    reader = _SegmentReader(buf, segments)
+    chunks = []
+    with io.BufferedReader(reader) as data_io:
+        for chunk in pd.read_csv(data_io, sep=separator, encoding=encoding, encoding_errors='replace',
+                                 chunksize=chunk_rows):
+            chunks.append(chunk)
+            if cancel_event is not None and cancel_event.is_set():
+                raise LoadCancelled()
+            if progress is not None:
+                progress(min(reader.consumed / total, 1.0))
+
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    df = df.dropna(how='all')
+
+    if df.empty:
+        raise ValueError("Parsed data is empty.")
+    return df
+
+
+def parse_data(data_string, **kwargs):
+    """
+    Parses spreadsheet-style text (CSV or tab-separated, with a header row)
+    into a DataFrame. Comment lines starting with '#' and all-blank rows are
+    dropped. Raises ValueError if there is nothing left to plot.
+    Keyword arguments go to parse_buffer.
+    """
+    if not data_string.strip():
+        raise ValueError("Input data is empty.")
+    return parse_buffer(data_string.encode('utf-8'), **kwargs)
+
+
+def load_file(path, encoding='utf-8', **kwargs):
+    """
+    Reads a CSV or tab-separated file from disk with the same rules as
+    parse_data. The file is memory-mapped rather than read into a string.
+    Keyword arguments go to parse_buffer.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("Input data is empty.")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return parse_buffer(buf, encoding=encoding, **kwargs)
+
+
+def numeric_column(df, col):
+    """Column `col` of `df` as numbers; anything that is not a number becomes NaN."""
+    return pd.to_numeric(df[col], errors='coerce')
+
+
+def cell_number(text):
+    """The number in a cell typed as `text`, read the way numeric_column reads one, or NaN."""
+    text = text.strip()
+    if not text:
+        return np.nan
+    return float(pd.to_numeric(text, errors='coerce'))
+
+
+def set_cell(df, row, j, text):
+    """
+    Puts `text`, typed into the data grid, into row `row` of column `j` (both
+    by position) of `df`, in place, and returns it as a number (NaN if it is
+    not one) for NumericCache.set_value. A numeric column stores it as a
+    number, and is widened to float (or to text, for something that isn't a
+    number) first if it has to be; only that column is ever copied.
+    """
+    number = cell_number(text)
+    column = df.iloc[:, j]
+    if pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+        if np.isnan(number) and text.strip():
+            df.isetitem(j, column.astype(object))
+            value = text
+        elif pd.api.types.is_integer_dtype(column.dtype) and not (np.isfinite(number) and number.is_integer()):
+            df.isetitem(j, column.astype(np.float64))
+            value = number
+        else:
+            value = number
+    else:
+        value = text if text.strip() else np.nan
+    df.iat[row, j] = value
+    return number
+
+
+def cell_texts(values):
+    """
+    Rows of cells (a 2D array or lists) as the text the data grid shows:
+    floats to 10 significant digits, and nothing for missing values.
+    """
+    return [["" if pd.isna(v) else f"{v:.10g}" if isinstance(v, float) else str(v) for v in row] for row in values]
+
+
+class NumericCache:
+    """
+    The numbers in a DataFrame, coerced once so plotting and fitting never
+    call pd.to_numeric again. Each column is a contiguous, read-only float64
+    array (non-numbers are NaN) with a matching validity mask, and the rows
+    where both columns of an X/Y pair are valid are worked out once per pair.
+
+    Build a new cache whenever the data is reloaded. The only change made in
+    place is set_value, for one edited cell.
+
+    Computed columns (derived_columns.DerivedColumns) can be attached; they
+    are then handed out by values(), valid() and block() like the cached
+    columns, but only worked out when first asked for.
+    """
+    def __init__(self, df, columns=None):
+        self.df = df
+        columns = list(df.columns if columns is None else dict.fromkeys(columns))
+        self._index = {col: i for i, col in enumerate(columns)}
+
+        # Fortran order keeps every column contiguous in memory.
+        self._values = np.empty((len(df), len(columns)), dtype=np.float64, order='F')
+        for i, col in enumerate(columns):
+            self._values[:, i] = numeric_column(df, col).to_numpy(dtype=np.float64, na_value=np.nan)
+        self._valid = ~np.isnan(self._values)
+        self._values.setflags(write=False)
+        self._valid.setflags(write=False)
+
+        self._derived = None
+        self._pair_masks = {}
+        self._selected = {}
+
+    @classmethod
+    def from_block(cls, columns, values):
+        """
+        Wraps an existing 2D float64 array (one column per entry of `columns`)
+        without copying it, e.g. the contents of a live ring buffer.
+        """
+        cache = cls.__new__(cls)
+        cache.df = None
+        cache._index = {col: i for i, col in enumerate(columns)}
+        cache._values = values.view()
+        cache._valid = ~np.isnan(values)
+        cache._values.setflags(write=False)
+        cache._valid.setflags(write=False)
+        cache._derived = None
+        cache._pair_masks = {}
+        cache._selected = {}
+        return cache
+
+    def attach(self, derived):
+        """Makes the computed columns of `derived` available from this cache's data."""
+        self._derived = derived
+        derived.source = self
+        derived.clear()
+
+    def __contains__(self, col):
+        return col in self._index or self._derived is not None and col in self._derived
+
+    @property
+    def columns(self):
+        """The cached columns, in order (not the computed ones)."""
+        return list(self._index)
+
+    def __len__(self):
+        return self._values.shape[0]
+
+    def values(self, col):
+        """All of column `col` as float64, NaN where it is not a number."""
+        if col not in self._index and self._derived is not None:
+            return self._derived.values(col)
+        return self._values[:, self._index[col]]
+
+    def valid(self, col):
+        """True for the rows of `col` that are numbers."""
+        if col not in self._index and self._derived is not None:
+            return self._derived.valid(col)
+        return self._valid[:, self._index[col]]
+
+    def block(self, cols, rows=slice(None)):
+        """
+        Columns `cols` over `rows` as one 2D array. This is a view, not a
+        copy, when the columns are next to each other in the data.
+        """
+        if any(col not in self._index for col in cols):
+            return np.column_stack([self.values(col)[rows] for col in cols])
+        idx = [self._index[col] for col in cols]
+        if idx and idx == list(range(idx[0], idx[0] + len(idx))):
+            return self._values[rows, idx[0]:idx[0] + len(idx)]
+        return self._values[rows][:, idx]
+
+    def iter_columns(self, cols):
+        """Columns `cols` one at a time, e.g. to write them out without stacking them into one array."""
+        return (self.values(col) for col in cols)
+
+    def set_value(self, col, row, value):
+        """
+        Changes one cell, for an edit made in the data grid. Only the cached
+        masks and selections that involve `col`, and the computed columns
+        that depend on it, are dropped. Returns the columns whose values
+        changed: `col` and those computed columns.
+        """
+        j = self._index[col]
+        for array, new in ((self._values, value), (self._valid, not np.isnan(value))):
+            array.setflags(write=True)
+            try:
+                array[row, j] = new
+            finally:
+                array.setflags(write=False)
+        return self._forget_changes(col)
+
+    def _forget_changes(self, col):
+        """
+        Drops the masks, selections and computed columns worked out from
+        `col`. Returns `col` and the computed columns that depend on it.
+        """
+        changed = [col] + (self._derived.invalidate(col) if self._derived is not None else [])
+        stale = set(changed)
+        self._pair_masks = {key: mask for key, mask in self._pair_masks.items() if stale.isdisjoint(key)}
+        self._selected = {key: selected for key, selected in self._selected.items() if stale.isdisjoint(key)}
+        return changed
+
+    def pair_mask(self, x_col, y_col):
+        """Rows where both `x_col` and `y_col` are numbers, or None if that is every row."""
+        key = (x_col, y_col)
+        if key not in self._pair_masks:
+            mask = self.valid(x_col) & self.valid(y_col)
+            self._pair_masks[key] = None if mask.all() else mask
+        return self._pair_masks[key]
+
+    def select(self, col, x_col, y_col):
+        """
+        Column `col` restricted to the rows valid for the (x_col, y_col) pair.
+        Cached, so asking again returns the very same array.
+        """
+        key = (col, x_col, y_col)
+        if key not in self._selected:
+            mask = self.pair_mask(x_col, y_col)
+            selected = self.values(col) if mask is None else self.values(col)[mask]
+            selected.setflags(write=False)
+            self._selected[key] = selected
+        return self._selected[key]
+
+
+class LazyNumericCache(NumericCache):
+    """
+    A NumericCache over a file that can be read a column at a time
+    (columnar_files.open_columns). A column is read the first time it is
+    asked for, memory-mapped where the format allows, and kept; the rest of
+    the file is never read, so only the columns plotted or fitted take up
+    memory. block() reads just the rows asked for of columns not kept, so
+    the data grid can show any part of the file.
+    """
+    def __init__(self, source):
+        self.df = None
+        self.source = source
+        self._index = {col: i for i, col in enumerate(source.columns)}
+        self._columns = {}          # col -> read-only float64 array, once read
+        self._writable = set()      # columns whose memory may be written (owned, or a copy-on-write map)
+        self._valid_columns = {}
+        self._derived = None
+        self._pair_masks = {}
+        self._selected = {}
+
+    def __len__(self):
+        return self.source.rows
+
+    def _column(self, col):
+        if col not in self._columns:
+            if col not in self._index:
+                raise KeyError(col)
+            values = self.source.read(col)
+            if values.flags.writeable:
+                self._writable.add(col)
+            values.setflags(write=False)
+            self._columns[col] = values
+        return self._columns[col]
+
+    def values(self, col):
+        """All of column `col` as float64, NaN where it is not a number. Read from the file once."""
+        if col not in self._index and self._derived is not None:
+            return self._derived.values(col)
+        return self._column(col)
+
+    def valid(self, col):
+        """True for the rows of `col` that are numbers."""
+        if col not in self._index and self._derived is not None:
+            return self._derived.valid(col)
+        if col not in self._valid_columns:
+            valid = ~np.isnan(self._column(col))
+            valid.setflags(write=False)
+            self._valid_columns[col] = valid
+        return self._valid_columns[col]
+
+    def block(self, cols, rows=slice(None)):
+        """Columns `cols` over `rows` as one 2D array (a copy). Columns not yet read are read for `rows` only."""
+        if not cols:
+            n = len(range(len(self))[rows]) if isinstance(rows, slice) else len(np.arange(len(self))[rows])
+            return np.empty((n, 0))
+        return np.column_stack([self._peek(col, rows) for col in cols])
+
+    def _peek(self, col, rows):
+        if col in self._columns or col not in self._index or not isinstance(rows, slice):
+            return self.values(col)[rows]
+        return self.source.read(col, rows)
+
+    def iter_columns(self, cols):
+        """Columns `cols` one at a time. Columns not yet read are read for this only, and not kept."""
+        return (self._peek(col, slice(None)) for col in cols)
+
+    def set_value(self, col, row, value):
+        """Changes one cell of column `col`, which is read first if it hasn't been. The file is never changed."""
+        values = self._column(col)
+        if col not in self._writable:   # e.g. straight out of an Arrow buffer
+            values = self._columns[col] = values.copy()
+            self._writable.add(col)
+        values.setflags(write=True)
+        values[row] = value
+        values.setflags(write=False)
+        self._valid_columns.pop(col, None)
+        return self._forget_changes(col)
+
+
+def _numeric(data, columns):
+    """`data` as a NumericCache, building a small one over `columns` if it is a DataFrame."""
+    if isinstance(data, NumericCache):
+        return data
+    return NumericCache(data, [c for c in columns if c is not None])
+
+
+def prepare_series(data, x_col, y_cols, x_err_col=None, y_err_cols=None):
+    """
+    Returns {y_col: (x, y, x_err, y_err)} as numpy arrays, keeping only rows
+    where both X and Y are numbers. `data` is a NumericCache (the arrays then
+    come straight from it, without copies) or a DataFrame. `y_err_cols` maps
+    a Y column to its uncertainty column; missing entries and None mean no
+    error bars (the array is None).
+    """
+    y_err_cols = y_err_cols or {}
+    numeric = _numeric(data, [x_col, x_err_col, *y_cols, *y_err_cols.values()])
+
+    series = {}
+    for y_col in y_cols:
+        y_err_col = y_err_cols.get(y_col)
+        x_err_data = None if x_err_col is None else numeric.select(x_err_col, x_col, y_col)
+        y_err_data = None if y_err_col is None else numeric.select(y_err_col, x_col, y_col)
+        series[y_col] = (numeric.select(x_col, x_col, y_col), numeric.select(y_col, x_col, y_col),
+                         x_err_data, y_err_data)
+    return series
+
+
+def decimate_indices(x, y, xlim, ylim, width_px, height_px, cell_px=3):
+    """
+    Indices of the points worth drawing when (x, y) is shown in a window of
+    width_px by height_px pixels covering xlim and ylim.
+
+    For every pixel column the lowest and the highest point are kept, so the
+    min/max envelope of the series is exact. On top of that one point is kept
+    for every occupied cell_px by cell_px block, so isolated outliers and the
+    shape of scattered clouds survive. However long x is, the result has at
+    most 2*width_px + (width_px/cell_px)*(height_px/cell_px) points, in their
+    original order. Points outside xlim are dropped.
+    """
+    x0, x1 = xlim
+    y0, y1 = ylim
+    in_view = np.flatnonzero((x >= x0) & (x <= x1))
+    if x1 <= x0 or len(in_view) == 0:
+        return in_view
+    xv = x[in_view]
+    yv = y[in_view]
+    pos = np.arange(len(xv))
+    width_px = max(int(width_px), 1)
+    col = np.minimum(((xv - x0) * (width_px / (x1 - x0))).astype(np.intp), width_px - 1)
+
+    # Envelope: one lowest and one highest point per pixel column.
+    # (Fancy assignment with repeated indices keeps one of them, which is all we need.)
+    col_min = np.full(width_px, np.inf)
+    col_max = np.full(width_px, -np.inf)
+    np.minimum.at(col_min, col, yv)
+    np.maximum.at(col_max, col, yv)
+    lowest = np.full(width_px, -1)
+    highest = np.full(width_px, -1)
+    is_min = yv == col_min[col]
+    is_max = yv == col_max[col]
+    lowest[col[is_min]] = pos[is_min]
+    highest[col[is_max]] = pos[is_max]
+
+    # Outliers and scatter: one point per occupied block of pixels.
+    n_cols = -(-width_px // cell_px)
+    n_rows = max(1, -(-int(height_px) // cell_px))
+    if y1 > y0:
+        row = np.clip(((yv - y0) * (n_rows / (y1 - y0))).astype(np.intp), 0, n_rows - 1)
+    else:
+        row = np.zeros(len(yv), dtype=np.intp)
+    representative = np.full(n_cols * n_rows, -1)
+    representative[(col // cell_px) * n_rows + row] = pos
+
+    keep = np.concatenate([lowest, highest, representative])
+    keep = np.unique(keep[keep >= 0])
+    return in_view[keep]
+
+
+def data_view(ax, series, margin=0.05):
+    """
+    The (xlim, ylim, width_px, height_px) view that autoscaling would show
+    for `series`, for decimating before anything has been drawn.
+    """
+    xs = [x for x, _, _, _ in series.values() if len(x)]
+    ys = [y for _, y, _, _ in series.values() if len(y)]
+    if not xs:
+        return None
+    x0, x1 = min(x.min() for x in xs), max(x.max() for x in xs)
+    y0, y1 = min(y.min() for y in ys), max(y.max() for y in ys)
+    dx, dy = (x1 - x0) * margin, (y1 - y0) * margin
+    bbox = ax.get_window_extent()
+    return (x0 - dx, x1 + dx), (y0 - dy, y1 + dy), bbox.width, bbox.height
+
+
+# Series longer than this are decimated to screen resolution when a view is given.
+DECIMATE_THRESHOLD = 20000
+
+
+def thin_series(arrays, view, threshold=DECIMATE_THRESHOLD):
+    """
+    Applies decimate_indices to one (x, y, x_err, y_err) entry of
+    prepare_series when `view` is given and the series is longer than
+    `threshold`; otherwise returns it unchanged.
+    """
+    x, y, x_err, y_err = arrays
+    if view is None or len(x) <= threshold:
+        return arrays
+    keep = decimate_indices(x, y, *view)
+    return (x[keep], y[keep],
+            None if x_err is None else x_err[keep],
+            None if y_err is None else y_err[keep])
+
+
+def thin_line(x, y, view, threshold=DECIMATE_THRESHOLD):
+    """
+    thin_series for a line drawn over a series, such as a smoothed one:
+    the same points are kept, and where y is NaN the first NaN of each run
+    is kept too, so the line still breaks there. Returns (x, y).
+    """
+    if view is None or len(x) <= threshold:
+        return x, y
+    gap = np.isnan(y)
+    if not gap.any():
+        keep = decimate_indices(x, y, *view)
+    else:
+        finite = np.flatnonzero(~gap)
+        starts = np.flatnonzero(gap & ~np.concatenate([[False], gap[:-1]]))
+        (x0, x1), _, _, _ = view
+        starts = starts[(x[starts] >= x0) & (x[starts] <= x1)]
+        keep = np.union1d(finite[decimate_indices(x[finite], y[finite], *view)], starts)
+    return x[keep], y[keep]
+
+
+def _interleave(*columns):
+    """Flattens columns a, b, c, ... into a0, b0, c0, a1, b1, c1, ...: one polyline piece per row."""
+    return np.column_stack(columns).ravel()
+
+
+class ErrorbarBatch:
+    """
+    Error-bar series that look like Axes.errorbar's but are drawn in batches:
+    all series of one color share four artists (their markers, error bars,
+    X caps and Y caps), so the number of artists is set by the colors in
+    use (at most 40 with the default color cycle) rather than by the number
+    of series. Markers and caps use Agg's fast path for repeated markers,
+    and the bars of a batch are one NaN-separated line.
+
+    Series are added, replaced and dropped by Y column with set, discard and
+    keep; update() then rebuilds the batches once for all the changes.
+    legend_handle gives each series a legend entry drawn like errorbar's.
+    """
+    def __init__(self, ax, capsize=4, alpha=0.8):
+        self.ax = ax
+        self.capsize = capsize
+        self.alpha = alpha
+        self._series = {}    # y_col -> (x, y, x_err, y_err, rgba), in drawing order
+        self._layers = {}    # rgba -> (bars, x caps, y caps, markers) Line2Ds
+        self._handles = {}
+
+    @property
+    def artists(self):
+        return [artist for layer in self._layers.values() for artist in layer]
+
+    def __contains__(self, y_col):
+        return y_col in self._series
+
+    def __iter__(self):
+        return iter(self._series)
+
+    def __len__(self):
+        return len(self._series)
+
+    def set(self, y_col, x, y, x_err=None, y_err=None, color=None):
+        """Adds series `y_col`, or replaces its data (and its error bars). Takes effect on update()."""
+        if color is None:
+            cycle = rcParams['axes.prop_cycle'].by_key()['color']
+            color = cycle[len(self._series) % len(cycle)]
+        self._series[y_col] = (x, y, x_err, y_err, to_rgba(color, self.alpha))
+
+    def discard(self, y_col):
+        self._series.pop(y_col, None)
+
+    def keep(self, y_cols):
+        """Keeps only the series in `y_cols`, drawn in that order."""
+        self._series = {y_col: self._series[y_col] for y_col in y_cols if y_col in self._series}
+
+    def _layer(self, rgba):
+        if rgba not in self._layers:
+            mew = rcParams['lines.markeredgewidth']
+            layer = (Line2D([], [], color=rgba, label='_nolegend_'),
+                     Line2D([], [], color=rgba, linestyle='none', marker='|', markersize=2 * self.capsize,
+                            markeredgewidth=mew, label='_nolegend_'),
+                     Line2D([], [], color=rgba, linestyle='none', marker='_', markersize=2 * self.capsize,
+                            markeredgewidth=mew, label='_nolegend_'),
+                     Line2D([], [], color=rgba, linestyle='none', marker='o', label='_nolegend_'))
+            for line in layer:
+                self.ax.add_line(line)
+            self._layers[rgba] = layer
+        return self._layers[rgba]
+
+    def update(self):
+        """Rebuilds the batches from the current series, with one concatenation per artist."""
+        groups = {}
+        for x, y, x_err, y_err, rgba in self._series.values():
+            groups.setdefault(rgba, []).append((x, y, x_err, y_err))
+        for rgba in [rgba for rgba in self._layers if rgba not in groups]:
+            for line in self._layers.pop(rgba):
+                line.remove()
+
+        nan = np.nan
+        for rgba, series in groups.items():
+            bars, x_caps, y_caps, markers = self._layer(rgba)
+            parts = {'bars': [], 'x_caps': [], 'y_caps': []}
+            for x, y, x_err, y_err in series:
+                gap = np.full(len(x), nan)
+                if x_err is not None:
+                    lo, hi = x - x_err, x + x_err
+                    parts['bars'].append((_interleave(lo, hi, gap), _interleave(y, y, gap)))
+                    parts['x_caps'].append((np.concatenate([lo, hi]), np.concatenate([y, y])))
+                if y_err is not None:
+                    lo, hi = y - y_err, y + y_err
+                    parts['bars'].append((_interleave(x, x, gap), _interleave(lo, hi, gap)))
+                    parts['y_caps'].append((np.concatenate([x, x]), np.concatenate([lo, hi])))
+            markers.set_data(np.concatenate([x for x, *_ in series]), np.concatenate([y for _, y, *_ in series]))
+            for line, pieces in ((bars, parts['bars']), (x_caps, parts['x_caps']), (y_caps, parts['y_caps'])):
+                if pieces:
+                    line.set_data(np.concatenate([px for px, _ in pieces]), np.concatenate([py for _, py in pieces]))
+                else:
+                    line.set_data([], [])
+        self.ax.stale = True
+
+    def legend_handle(self, y_col):
+        """A stand-in ErrorbarContainer for series `y_col`, for Axes.legend; it is not drawn on the axes."""
+        x, y, x_err, y_err, rgba = self._series[y_col]
+        key = (rgba, x_err is not None, y_err is not None)
+        if self._handles.get(y_col, (None,))[0] != key:
+            line = Line2D([], [], marker='o', linestyle='none', color=rgba)
+            caps = (Line2D([], [], linestyle='none', color=rgba, markersize=2 * self.capsize),)
+            bars = tuple(LineCollection([], colors=[rgba]) for _ in range((x_err is not None) + (y_err is not None)))
+            handle = ErrorbarContainer((line, caps, bars), has_xerr=x_err is not None, has_yerr=y_err is not None,
+                                       label=y_col)
+            self._handles[y_col] = (key, handle)
+        return self._handles[y_col][1]
+
+    def remove(self):
+        for line in self.artists:
+            line.remove()
+        self._layers = {}
+
+
+def draw_series_batched(ax, series, view=None, colors=None, threshold=DECIMATE_THRESHOLD):
+    """
+    Draws one errorbar series per entry of `series` (as returned by
+    prepare_series) into an ErrorbarBatch, which it returns;
+    batch.legend_handle(y_col) gives the legend entries.
+
+    If `view` is given as (xlim, ylim, width_px, height_px), series longer
+    than `threshold` are thinned with decimate_indices first. `colors` maps a
+    Y column to the color to reuse, so a series keeps its color when it is
+    redrawn.
+    """
+    colors = colors or {}
+    batch = ErrorbarBatch(ax)
+    for y_col, arrays in series.items():
+        batch.set(y_col, *thin_series(arrays, view, threshold), color=colors.get(y_col))
+    batch.update()
+    return batch
+
+
+def plot_errorbars(ax, data, x_col, y_cols, x_err_col=None, y_err_cols=None, decimate=False):
+    """
+    Draws one errorbar series per column in `y_cols` against `x_col`, taking
+    the numbers from `data` (a NumericCache or a DataFrame).
+    `y_err_cols` maps a Y column to its uncertainty column; missing entries
+    and None mean no error bars. Rows where X or Y is not a number are skipped.
+    With `decimate`, long series are thinned to what the axes can show.
+    Returns the ErrorbarBatch they are drawn in.
+    """
+    series = prepare_series(data, x_col, y_cols, x_err_col, y_err_cols)
+    view = data_view(ax, series) if decimate else None
+    return draw_series_batched(ax, series, view)
+
+
+def style_axes(ax):
+    """Large tick labels and a dashed grid, independent of what is plotted."""
+    ax.tick_params(axis='both', which='major', labelsize=20)
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+
+
+def format_axes(ax, title, xlabel, ylabel, handles=None):
+    """
+    Applies the HamiltonPlotter look: large labels, legend and a dashed grid.
+    `handles` are the legend entries, if not the labelled artists on the axes.
+    """
+    ax.set_title(title, fontsize=20)
+    ax.set_xlabel(xlabel, fontsize=20)
+    ax.set_ylabel(ylabel, fontsize=20)
+
+    style_axes(ax)
+    if handles is None:
+        ax.legend()
+    else:
+        ax.legend(handles, [handle.get_label() for handle in handles])
+
+
+def linear_fit(data, x_col, y_col):
+    """
+    Ordinary least-squares fit of `y_col` against `x_col` using every row
+    where both are numbers. `data` is a NumericCache or a DataFrame.
+    Raises ValueError with fewer than two points.
+    """
+    linregress = _linregress()
+    if linregress is None:
+        raise ImportError("The 'scipy' library is required for detailed linear fitting.")
+
+    numeric = _numeric(data, [x_col, y_col])
+    x_clean = numeric.select(x_col, x_col, y_col)
+    y_clean = numeric.select(y_col, x_col, y_col)
+
+    if len(x_clean) < 2:
+        raise ValueError("Need at least two data points to perform a linear fit.")
+
+    # Perform linear regression using scipy to get detailed stats
+    res = linregress(x_clean, y_clean)
+    return LinearFit(slope=res.slope, intercept=res.intercept,
+                     slope_stderr=res.stderr, intercept_stderr=res.intercept_stderr,
+                     r_squared=res.rvalue**2, n=len(x_clean),
+                     x_min=x_clean.min(), x_max=x_clean.max())
+
+
+class BatchFit(namedtuple('BatchFit', ['y_cols', 'slope', 'intercept', 'covariance', 'slope_stderr',
+                                         'intercept_stderr', 'r_squared', 'reduced_chi2', 'n',
+                                         'weighted', 'x_min', 'x_max', 'note'], defaults=[None])):
+    """
+    Straight-line fits of several Y columns against one X column, as
+    parallel arrays in the order of `y_cols`. `covariance` has shape
+    (len(y_cols), 2, 2) for (slope, intercept). `note` says, for each
+    column, why a fit that was asked to be weighted is not ('' if it is).
+    """
+    __slots__ = ()
+
+    def fit(self, y_col):
+        """The LinearFit for one of the fitted columns."""
+        i = self.y_cols.index(y_col)
+        return LinearFit(slope=self.slope[i], intercept=self.intercept[i],
+                         slope_stderr=self.slope_stderr[i], intercept_stderr=self.intercept_stderr[i],
+                         r_squared=self.r_squared[i], n=int(self.n[i]),
+                         x_min=self.x_min[i], x_max=self.x_max[i],
+                         reduced_chi2=self.reduced_chi2[i], weighted=bool(self.weighted[i]),
+                         note='' if self.note is None else str(self.note[i]))
+
+
+# Why a fit that was asked to be weighted is not (BatchFit.note).
+NO_Y_UNCERTAINTY = "no Y uncertainty, and X uncertainty alone would treat Y as exact"
+ZERO_UNCERTAINTY = "some uncertainties are zero"
+
+
+def _fit_sums(x, Y, W):
+    """Weighted sums S, Sx, Sy, Sxx, Sxy for every column of Y at once (invalid entries have W = 0)."""
+    WY = W * Y
+    return np.stack([W.sum(axis=0), x @ W, WY.sum(axis=0), (x * x) @ W, x @ WY])
+
+
+def _solve_line(sums):
+    S, Sx, Sy, Sxx, Sxy = sums
+    delta = S * Sxx - Sx**2
+    slope = (S * Sxy - Sx * Sy) / delta
+    intercept = (Sxx * Sy - Sx * Sxy) / delta
+    return slope, intercept, delta
+
+
+def batch_linear_fit(data, x_col, y_cols, x_err_col=None, y_err_cols=None, iterations=2, chunk_size=2**20):
+    """
+    Fits y = slope*x + intercept for every column in `y_cols` together, as
+    a few vectorized passes over the data rather than one fit per column.
+    `data` is a NumericCache or a DataFrame.
+
+    Columns with an uncertainty column in `y_err_cols` are weighted
+    least-squares fits with weights 1/(sigma_y**2 + (slope*sigma_x)**2),
+    sigma_x coming from `x_err_col` if it is given (the effective variance
+    method, refined `iterations` times from the unweighted slope). Their
+    covariance comes from the stated uncertainties and reduced_chi2 says how
+    well the line agrees with them. Other columns are ordinary least squares
+    with the same stderr and R^2 as scipy.stats.linregress, and reduced_chi2
+    is NaN: X uncertainties alone don't weight a fit, since that would treat
+    Y as exact. A column with a zero uncertainty in it is fitted unweighted
+    too. Either way the fit's `note` says why. Rows are processed about
+    `chunk_size` values at a time, so memory stays bounded for long, wide
+    data. Returns a BatchFit.
+    """
+    y_cols = list(y_cols)
+    y_err_cols = y_err_cols or {}
+    err_cols = [y_err_cols.get(col) for col in y_cols]
+    numeric = _numeric(data, [x_col, x_err_col, *y_cols, *err_cols])
+    n_rows, k = len(numeric), len(y_cols)
+    chunk_rows = max(1, chunk_size // max(k, 1))
+
+    x_all = numeric.values(x_col)
+    x0 = np.nanmean(x_all) if n_rows and not np.isnan(x_all).all() else 0.0 # centre x for accuracy
+    weighted = np.array([e is not None for e in err_cols], dtype=bool)
+    notes = ['' if e is not None or x_err_col is None else NO_Y_UNCERTAINTY for e in err_cols]
+
+    def chunks(with_errors):
+        """(x - x0, Y, valid, sigma_y**2, sigma_x**2) for consecutive blocks of rows."""
+        for start in range(0, n_rows, chunk_rows):
+            rows = slice(start, start + chunk_rows)
+            x = x_all[rows] - x0
+            Y = numeric.block(y_cols, rows)
+            valid = ~np.isnan(Y) & ~np.isnan(x)[:, None]
+            var_y = var_x = None
+            if with_errors:
+                zeros = np.zeros(len(x))
+                var_y = np.column_stack([zeros if e is None else numeric.values(e)[rows]**2 for e in err_cols])
+                var_x = zeros if x_err_col is None else numeric.values(x_err_col)[rows]**2
+            yield np.where(np.isnan(x), 0.0, x), np.where(valid, Y, 0.0), valid, var_y, var_x
+
+    def weights(valid, var_y, var_x, slope, use_weights):
+        """Per-entry weights and which entries have a usable uncertainty."""
+        var = var_y + (slope**2)[None, :] * var_x[:, None]
+        usable = valid & ~np.isnan(var)
+        W = np.where(use_weights[None, :], np.where(usable, 1.0 / var, 0.0), valid)
+        return W, usable, var
+
+    empty = np.zeros((5, k))
+    use_weights = weighted.copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Pass 1: ordinary least squares for every column (and the starting slope for weighting).
+        sums = empty.copy()
+        for x, Y, valid, _, _ in chunks(False):
+            sums += _fit_sums(x, Y, valid.astype(float))
+        slope, intercept, delta = _solve_line(sums)
+        unweighted_sums = sums
+
+        # Weighted passes, dropping columns with zero or missing uncertainties back to OLS.
+        if use_weights.any():
+            for _ in range(max(1, iterations)):
+                sums = empty.copy()
+                bad = np.zeros(k, dtype=bool)
+                for x, Y, valid, var_y, var_x in chunks(True):
+                    W, usable, var = weights(valid, var_y, var_x, slope, use_weights)
+                    bad |= (usable & ~(var > 0) & use_weights[None, :]).any(axis=0)
+                    sums += _fit_sums(x, Y, W)
+                for i in np.flatnonzero(bad & use_weights):
+                    notes[i] = ZERO_UNCERTAINTY
+                use_weights &= ~bad
+                sums = np.where(use_weights[None, :], sums, unweighted_sums)
+                slope, intercept, delta = _solve_line(sums)
+
+        # Last pass: chi-squared, total sum of squares, point counts and x range.
+        S, Sx, Sy, Sxx, Sxy = sums
+        y_mean = Sy / S
+        chi2 = np.zeros(k)
+        total = np.zeros(k)
+        n = np.zeros(k, dtype=np.int64)
+        x_min = np.full(k, np.inf)
+        x_max = np.full(k, -np.inf)
+        for x, Y, valid, var_y, var_x in chunks(use_weights.any()):
+            if use_weights.any():
+                W, usable, _ = weights(valid, var_y, var_x, slope, use_weights)
+                used = np.where(use_weights[None, :], usable, valid)
+            else:
+                W, used = valid.astype(float), valid
+            chi2 += (W * (Y - intercept[None, :] - slope[None, :] * x[:, None])**2).sum(axis=0)
+            total += (W * (Y - y_mean[None, :])**2).sum(axis=0)
+            n += used.sum(axis=0)
+            x_min = np.minimum(x_min, np.where(used, x[:, None], np.inf).min(axis=0, initial=np.inf))
+            x_max = np.maximum(x_max, np.where(used, x[:, None], -np.inf).max(axis=0, initial=-np.inf))
+
+    return fit_from_sums(y_cols, sums, chi2, total, n, use_weights, x_min + x0, x_max + x0, x0=x0, notes=notes)
+
+
+def fit_from_sums(y_cols, sums, chi2, total, n, weighted, x_min, x_max, x0=0.0, y0=None, notes=None):
+    """
+    Turns accumulated fit statistics into a BatchFit. `sums` holds
+    (S, Sx, Sy, Sxx, Sxy) per column, taken with x measured from `x0` and y
+    from `y0`; `chi2` and `total` are the weighted residual and total sums
+    of squares, `n` the number of points and `notes` the BatchFit notes
+    (none by default). For weighted columns the
+    covariance comes from the weights; otherwise it is scaled by the scatter
+    of the points, as scipy.stats.linregress does.
+    """
+    y0 = np.zeros(len(y_cols)) if y0 is None else y0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        S, Sx, Sy, Sxx, Sxy = sums
+        slope, intercept, delta = _solve_line(sums)
+        dof = n - 2
+        reduced_chi2 = chi2 / dof
+        scale = np.where(weighted, 1.0, reduced_chi2)
+        var_slope = S / delta * scale
+        var_icpt = Sxx / delta * scale
+        cov_si = -Sx / delta * scale
+
+        # Undo the shift of the origin to (x0, y0).
+        intercept = intercept + y0 - slope * x0
+        var_icpt = var_icpt + x0**2 * var_slope - 2 * x0 * cov_si
+        cov_si = cov_si - x0 * var_slope
+
+        covariance = np.empty((len(y_cols), 2, 2))
+        covariance[:, 0, 0] = var_slope
+        covariance[:, 1, 1] = var_icpt
+        covariance[:, 0, 1] = covariance[:, 1, 0] = cov_si
+        return BatchFit(y_cols=list(y_cols), slope=slope, intercept=intercept, covariance=covariance,
+                        slope_stderr=np.sqrt(var_slope), intercept_stderr=np.sqrt(var_icpt),
+                        r_squared=1 - chi2 / total, reduced_chi2=np.where(weighted, reduced_chi2, np.nan),
+                        n=n, weighted=np.asarray(weighted, dtype=bool), x_min=x_min, x_max=x_max,
+                        note=list(notes) if notes is not None else [''] * len(y_cols))
+
+
+def format_fit_parameter(value, uncertainty):
+    """
+    Formats a value and its uncertainty according to scientific best practices.
+    - The uncertainty is rounded to two significant figures.
+    - The value is rounded to the same decimal place as the uncertainty.
+    - Switches to scientific notation for very large or small numbers.
+    """
+    if uncertainty is None or uncertainty <= 0 or not np.isfinite(uncertainty):
+        return f"{value:.4g} ± {uncertainty:.2g}"
+
+    # Determine the number of decimal places from the uncertainty
+    exponent = np.floor(np.log10(np.abs(uncertainty)))
+    decimal_places = int(-exponent + 1) # For 2 significant figures in uncertainty
+
+    # Use scientific notation if the value is very large or small
+    value_exponent = np.floor(np.log10(np.abs(value))) if value != 0 else 0
+    if value_exponent < -3 or value_exponent > 4:
+        # Format in scientific notation
+        norm_value = value / (10**value_exponent)
+        norm_uncertainty = uncertainty / (10**value_exponent)
+
+        norm_exponent = np.floor(np.log10(np.abs(norm_uncertainty)))
+        norm_decimal_places = int(-norm_exponent + 1)
+
+        val_str = f"{norm_value:.{norm_decimal_places}f}"
+        err_str = f"{norm_uncertainty:.{norm_decimal_places}f}"
+
+        return f"({val_str} ± {err_str})e{int(value_exponent)}"
+
+    # Use fixed-point notation for "normal" sized numbers
+    if decimal_places >= 0:
+        return f"{value:.{decimal_places}f} ± {uncertainty:.{decimal_places}f}"
+    else: # Handle rounding for numbers > 10 (decimal_places is negative)
+        rounded_value = round(value, decimal_places)
+        rounded_uncertainty = round(uncertainty, decimal_places)
+        return f"{rounded_value:.0f} ± {rounded_uncertainty:.0f}"
+
+
+def fit_label(y_col, fit):
+    """The legend text for a fit line."""
+    slope_str = format_fit_parameter(fit.slope, fit.slope_stderr)
+    intercept_str = format_fit_parameter(fit.intercept, fit.intercept_stderr)
+    label = (
+        f"Fit for '{y_col}'\n"
+        f"y = ({slope_str})x + ({intercept_str})\n"
+        f"$R^2$ = {fit.r_squared:.4f}"
+    )
+    if fit.weighted:
+        label += f"\n$\\chi^2_\\nu$ = {fit.reduced_chi2:.3g}"
+    elif fit.note:
+        label += f"\nUnweighted: {fit.note}"
+    return label
+
+
+def plot_fit(ax, y_col, fit, legend=True, color='red', label=True):
+    """Draws the fit line across the range of the fitted data and returns it."""
+    x_fit = np.linspace(fit.x_min, fit.x_max, 100)
+    y_fit = fit.slope * x_fit + fit.intercept
+    line, = ax.plot(x_fit, y_fit, color=color, label=fit_label(y_col, fit) if label else '_nolegend_')
+    if legend:
+        ax.legend()
+    return line
+
+
+def plot_smoothed(ax, x, y_smooth, color=None):
+    """Draws a smoothed version of a series as a line over its points, without a legend entry."""
+    line, = ax.plot(x, y_smooth, color=color, linewidth=2, label='_nolegend_')
+    return line
+
+
+def update_fit_line(line, y_col, fit, label=True):
+    """Moves a line made by plot_fit to a new fit, keeping its legend entry (if any) in step."""
+    x_fit = np.linspace(fit.x_min, fit.x_max, 100)
+    line.set_data(x_fit, fit.slope * x_fit + fit.intercept)
+    if label:
+        line.set_label(fit_label(y_col, fit))
+
+
+def new_figure(figsize=(12, 8), dpi=100):
+    """
+    A Figure that is not attached to pyplot or any GUI backend, so it is safe
+    to create in worker processes and is freed as soon as it goes out of scope.
+    """
+    fig = Figure(figsize=figsize, dpi=dpi, facecolor='#f0f0f0')
+    ax = fig.add_subplot()
+    return fig, ax
+
+
+def render(df, x_col, y_cols, x_err_col=None, y_err_cols=None,
+           title="", xlabel=None, ylabel=None, fit=False, decimate=True, fig=None, ax=None):
+    """
+    Plots `y_cols` against `x_col` exactly as the GUI would and optionally
+    adds a linear fit for each Y column (weighted by its uncertainties, see
+    batch_linear_fit). Returns (fig, fits) where `fits` maps each Y column
+    to a LinearFit, or to the exception that stopped it.
+    """
+    if fig is None:
+        fig, ax = new_figure()
+
+    # Coerce the columns involved once for both the plot and the fits.
+    y_err_cols = y_err_cols or {}
+    numeric = _numeric(df, [x_col, x_err_col, *y_cols, *y_err_cols.values()])
+    errorbars = plot_errorbars(ax, numeric, x_col, y_cols, x_err_col, y_err_cols, decimate=decimate)
+    handles = [errorbars.legend_handle(y_col) for y_col in y_cols]
+    format_axes(ax, title,
+                x_col if xlabel is None else xlabel,
+                ", ".join(y_cols) if ylabel is None else ylabel, handles=handles)
+
+    fits = {}
+    if fit:
+        # One batched fit for all columns, weighted by their uncertainty columns.
+        batch = batch_linear_fit(numeric, x_col, y_cols, x_err_col, y_err_cols)
+        for y_col, n in zip(y_cols, batch.n):
+            if n < 2:
+                fits[y_col] = ValueError("Need at least two data points to perform a linear fit.")
+                continue
+            fits[y_col] = batch.fit(y_col)
+            handles.append(plot_fit(ax, y_col, fits[y_col], legend=False))
+        ax.legend(handles, [handle.get_label() for handle in handles])
+
+    fig.tight_layout()
+    return fig, fits
@@ -0,0 +1,161 @@
+"""
+HamiltonPlotter project files: the loaded data, already coerced to numbers,
+together with what was plotted (axes, uncertainty columns, labels and
+options) and the last linear fits, so a session can be reopened exactly
+without pasting or parsing anything again.
+
+A project file is one binary file:
+
+    8 bytes    b'HPLOTPRJ'
+    8 bytes    length of the JSON header, little-endian
+    header     UTF-8 JSON: columns, rows, plot state and fit results
+    padding    to a multiple of 64 bytes
+    data       float64, one column after another (Fortran order), NaN
+               where a value was not a number
+
+The data is memory-mapped when the file is opened, so opening takes the same
+time however large the data is, and only the parts that get plotted are read.
+
+example usage:
+
+save_project("run12.hplot", numeric.columns, numeric.iter_columns(numeric.columns),
+             state={'x_col': 'Time (s)', 'y_cols': ['Position (m)']}, fits=('Time (s)', batch))
+project = open_project("run12.hplot")
+numeric = NumericCache.from_block(project.columns, project.values)
+"""
+
+import itertools
+import json
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from plotter_engine import BatchFit
+
+MAGIC = b'HPLOTPRJ'
+VERSION = 1
+PROJECT_SUFFIX = '.hplot'
+_ALIGN = 64
+_PREFIX = struct.Struct('<8sQ')
+
+
+class ProjectFileError(ValueError):
+    """The file is not a HamiltonPlotter project, or is damaged."""
+
+
+class Project(namedtuple('Project', ['columns', 'values', 'state', 'fits'])):
+    """
+    An opened project. `values` is a (rows, columns) float64 memory map,
+    copy-on-write, so cells edited afterwards change only what is in memory
+    and never the file; `state` is the dict given to save_project; `fits` is
+    (x_col, BatchFit) or None.
+    """
+    __slots__ = ()
+
+    @property
+    def header(self):
+        """An empty DataFrame with the project's columns, standing in for the parsed data."""
+        return pd.DataFrame(columns=self.columns)
+
+
+def _fits_to_json(fits):
+    if fits is None:
+        return None
+    x_col, batch = fits
+    fields = {name: np.asarray(value).tolist() for name, value in batch._asdict().items() if name != 'y_cols'}
+    return {'x_col': x_col, 'y_cols': list(batch.y_cols), **fields}
+
+
+def _fits_from_json(data):
+    if data is None:
+        return None
+    data = dict(data)
+    x_col = data.pop('x_col')
+    y_cols = data.pop('y_cols')
+    arrays = {name: np.asarray(value) for name, value in data.items()}
+    arrays['weighted'] = arrays['weighted'].astype(bool)
+    return x_col, BatchFit(y_cols=y_cols, **arrays)
+
+
+def save_project(path, columns, values, state=None, fits=None):
+    """
+    Writes a project file. `values` is a (rows, len(columns)) array of
+    numbers, e.g. NumericCache.block(columns), or the columns one at a time
+    (any iterable of equally long 1D arrays, e.g.
+    NumericCache.iter_columns(columns)), so a wide file never has to be in
+    memory all at once; `state` is any JSON-friendly dict (the plot
+    settings); `fits` is (x_col, BatchFit) or None. The file is written next
+    to `path` and then moved into place, so an existing project is never
+    left half-written.
+    """
+    columns = [str(col) for col in columns]
+    if isinstance(values, np.ndarray):
+        if values.ndim != 2 or values.shape[1] != len(columns):
+            raise ValueError(f"expected {len(columns)} columns of data, got an array of shape {values.shape}")
+        rows = values.shape[0]
+        # values.T has the columns as its rows, so this goes through them without copying a Fortran-ordered array.
+        values = values.T
+    else:
+        values = iter(values)
+        first = next(values, None)
+        rows = 0 if first is None else len(first)
+        if first is not None:
+            values = itertools.chain([first], values)
+
+    header = json.dumps({'version': VERSION, 'columns': columns, 'rows': rows,
+                         'dtype': '<f8', 'order': 'F', 'state': state or {},
+                         'fits': _fits_to_json(fits)}).encode('utf-8')
+    offset = -(-(_PREFIX.size + len(header)) // _ALIGN) * _ALIGN
+
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_PREFIX.pack(MAGIC, len(header)))
+            f.write(header)
+            f.write(b' ' * (offset - _PREFIX.size - len(header)))
+            written = 0
+            for column in values:
+                column = np.asarray(column, dtype='<f8')
+                if column.shape != (rows,):
+                    raise ValueError(f"column {written + 1} has shape {column.shape}, expected ({rows},)")
+                column.tofile(f)
+                written += 1
+            if written != len(columns):
+                raise ValueError(f"expected {len(columns)} columns of data, got {written}")
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def open_project(path):
+    """Reads a project's header and memory-maps its data. Returns a Project."""
+    with open(path, 'rb') as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            raise ProjectFileError(f"{path} is not a HamiltonPlotter project")
+        magic, header_size = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ProjectFileError(f"{path} is not a HamiltonPlotter project")
+        try:
+            header = json.loads(f.read(header_size).decode('utf-8'))
+        except ValueError as e:
+            raise ProjectFileError(f"{path} has a damaged header: {e}") from None
+    if header.get('version', 0) > VERSION:
+        raise ProjectFileError(f"{path} was saved by a newer version of HamiltonPlotter")
+
+    columns = header['columns']
+    shape = (header['rows'], len(columns))
+    offset = -(-(_PREFIX.size + header_size) // _ALIGN) * _ALIGN
+    expected = offset + shape[0] * shape[1] * 8
+    if os.path.getsize(path) < expected:
+        raise ProjectFileError(f"{path} is truncated")
+    if shape[0] == 0 or shape[1] == 0:
+        values = np.empty(shape, order='F')   # mmap can't map zero bytes
+    else:
+        values = np.memmap(path, dtype=header['dtype'], mode='c', offset=offset, shape=shape, order=header['order'])
+    return Project(columns, values, header['state'], _fits_from_json(header['fits']))
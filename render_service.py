@@ -0,0 +1,484 @@
+"""
+Local HTTP service that renders HamiltonPlotter plots and linear fits, for
+scripts and report builders that ask for the same plots over and over.
+
+The data is parsed, plotted and fitted by the same engine as the GUI and
+batch_plotter.py, in worker processes that have Matplotlib imported and a
+few Agg figures already made, so a request doesn't pay for either. Results
+are cached by a hash of the data and the options, so asking again for a plot
+(or fit) already made is answered from memory, and identical requests that
+arrive together are rendered once.
+
+Endpoints (options go in the query string, the data is the request body,
+CSV or tab-separated with a header row, as pasted into the GUI):
+
+    POST /render   the plot as an image: png (default), svg, pdf or jpg
+    POST /fit      the linear fits as JSON
+    GET  /metrics  requests, cache hits, latency percentiles and throughput, as JSON
+    GET  /health   "ok"
+
+Options: x, y (repeat for several), xerr, yerr ("Y column=Uncertainty
+column", repeat as needed), title, xlabel, ylabel, fit=1, format, dpi,
+width and height (inches), decimate=0. As in batch_plotter.py, x defaults
+to the first column and y to the second.
+
+example usage:
+
+python render_service.py --port 8765 --workers 4
+
+curl --data-binary @run12.txt -o run12.png \
+    "http://localhost:8765/render?x=Time%20(s)&y=Position%20(m)&fit=1"
+curl --data-binary @run12.txt "http://localhost:8765/fit?x=Time%20(s)&y=Position%20(m)"
+curl http://localhost:8765/metrics
+"""
+
+import matplotlib
+matplotlib.use('Agg') # must happen before anything imports pyplot
+
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import plotter_engine as engine
+from batch_plotter import parse_error_pairs
+
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_MB = 256
+DEFAULT_MAX_BODY_MB = 200
+
+IMAGE_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml', 'pdf': 'application/pdf', 'jpg': 'image/jpeg'}
+DEFAULT_SIZE = (12.0, 8.0)
+DEFAULT_DPI = 100
+MAX_DPI = 600
+MAX_INCHES = 50
+
+# Figures kept ready in each worker, one per (width, height, dpi) asked for.
+FIGURES_PER_WORKER = 4
+
+# Requests the latency percentiles are taken over, and the span throughput is measured over.
+LATENCY_WINDOW = 1000
+THROUGHPUT_SECONDS = 60
+
+FIT_FIELDS = ['slope', 'slope_stderr', 'intercept', 'intercept_stderr', 'r_squared', 'reduced_chi2', 'weighted', 'note', 'n']
+
+
+class RequestError(ValueError):
+    """A request the service can't serve: bad options, or data it can't plot."""
+
+
+# --- Options ---------------------------------------------------------------------------------------------------
+
+def _flag(value):
+    return value.lower() not in ('', '0', 'false', 'no', 'off')
+
+
+def _number(query, name, default, kind, upper):
+    text = query.get(name, [None])[-1]
+    if text is None:
+        return default
+    try:
+        value = kind(text)
+    except ValueError:
+        raise RequestError(f"{name} must be a number, got {text!r}") from None
+    if not 0 < value <= upper:
+        raise RequestError(f"{name} must be between 0 and {upper}, got {text!r}")
+    return value
+
+
+def parse_options(kind, query):
+    """
+    The options of a /render or /fit request from its parsed query string,
+    normalized so that requests meaning the same thing get the same cache
+    key. Only what affects the result is kept, so e.g. retitling a plot
+    doesn't throw away the cached fits of the same data.
+    """
+    def one(name):
+        return query.get(name, [None])[-1] or None
+
+    try:
+        yerr = parse_error_pairs(query.get('yerr'))
+    except argparse.ArgumentTypeError as e:
+        raise RequestError(str(e)) from None
+    options = {'x': one('x'), 'y': query.get('y') or None, 'xerr': one('xerr'),
+               'yerr': dict(sorted(yerr.items()))}
+    if kind == 'fit':
+        return options
+
+    image_format = (one('format') or 'png').lower()
+    if image_format not in IMAGE_TYPES:
+        raise RequestError(f"format must be one of {', '.join(IMAGE_TYPES)}, got {image_format!r}")
+    options.update(title=query.get('title', [''])[-1], xlabel=one('xlabel'), ylabel=one('ylabel'),
+                   fit=_flag(query.get('fit', ['0'])[-1]), decimate=_flag(query.get('decimate', ['1'])[-1]),
+                   format=image_format,
+                   dpi=_number(query, 'dpi', DEFAULT_DPI, int, MAX_DPI),
+                   size=(_number(query, 'width', DEFAULT_SIZE[0], float, MAX_INCHES),
+                         _number(query, 'height', DEFAULT_SIZE[1], float, MAX_INCHES)))
+    return options
+
+
+def cache_key(kind, data, options):
+    """A hash of the endpoint, the options and the data: equal keys mean equal results."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([kind, options], sort_keys=True).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(data)
+    return digest.hexdigest()
+
+
+# --- Worker processes ------------------------------------------------------------------------------------------
+
+_figures = OrderedDict()   # (width, height, dpi) -> (fig, ax), in this worker
+
+
+def _figure(size, dpi):
+    """A ready Figure of this size from the worker's pool, made (and the oldest dropped) if there isn't one."""
+    key = (*size, dpi)
+    entry = _figures.pop(key, None)
+    if entry is None:
+        if len(_figures) >= FIGURES_PER_WORKER:
+            _figures.popitem(last=False)
+        fig, ax = engine.new_figure(size, dpi)
+        FigureCanvasAgg(fig)
+        entry = fig, ax
+    _figures[key] = entry
+    return entry
+
+
+def _warm_worker(size, dpi):
+    """
+    Runs once in each worker process: makes the default figure and renders
+    a small plot with a fit on it, so that the first real request finds the
+    fonts, text layout and PNG writer already loaded.
+    """
+    data = b"x,y\n0,1\n1,2.1\n2,2.9\n3,4.2\n"
+    render_task('render', data, {'x': None, 'y': None, 'xerr': None, 'yerr': {}, 'title': "warm-up",
+                                 'xlabel': None, 'ylabel': None, 'fit': True, 'decimate': True,
+                                 'format': 'png', 'dpi': dpi, 'size': size})
+
+
+def _ready():
+    return os.getpid()
+
+
+def _columns(df, options):
+    columns = df.columns.tolist()
+    x_col = options['x'] or columns[0]
+    y_cols = options['y'] or columns[1:2]
+    if not y_cols:
+        raise RequestError("the data has only one column, so there is nothing to plot against it")
+    missing = [c for c in [x_col, options['xerr'], *y_cols, *options['yerr'].values()]
+               if c is not None and c not in columns]
+    if missing:
+        raise RequestError(f"column(s) not found: {', '.join(missing)}")
+    return x_col, y_cols
+
+
+def _json_number(value):
+    value = value.item() if isinstance(value, np.generic) else value
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+
+def render_task(kind, data, options):
+    """
+    Parses `data` and makes the result of one request: the image bytes for
+    'render', or the fits as JSON bytes for 'fit'. Returns (payload,
+    seconds it took). Runs in a worker process.
+    """
+    start = time.perf_counter()
+    df = engine.parse_buffer(data)
+    x_col, y_cols = _columns(df, options)
+
+    if kind == 'fit':
+        batch = engine.batch_linear_fit(df, x_col, y_cols, options['xerr'], options['yerr'])
+        fits = {}
+        for y_col, n in zip(y_cols, batch.n):
+            if n < 2:
+                fits[y_col] = {'error': "Need at least two data points to perform a linear fit."}
+            else:
+                fit = batch.fit(y_col)
+                fits[y_col] = {name: _json_number(getattr(fit, name)) for name in FIT_FIELDS}
+        payload = json.dumps({'x_column': x_col, 'fits': fits}).encode('utf-8')
+        return payload, time.perf_counter() - start
+
+    fig, ax = _figure(options['size'], options['dpi'])
+    try:
+        engine.render(df, x_col, y_cols, options['xerr'], options['yerr'],
+                      title=options['title'], xlabel=options['xlabel'], ylabel=options['ylabel'],
+                      fit=options['fit'], decimate=options['decimate'], fig=fig, ax=ax)
+        buf = io.BytesIO()
+        fig.savefig(buf, format=options['format'], dpi=options['dpi'])
+    finally:
+        # Leave the figure empty for the next request (and let go of this one's data).
+        ax.clear()
+    return buf.getvalue(), time.perf_counter() - start
+
+
+# --- Service ---------------------------------------------------------------------------------------------------
+
+class ResultCache:
+    """Rendered results by cache key, least recently used first out once they pass `max_bytes`."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._items.get(key)
+            if payload is not None:
+                self._items.move_to_end(key)
+            return payload
+
+    def put(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = payload
+            self.size += len(payload)
+            while self.size > self.max_bytes:
+                _, dropped = self._items.popitem(last=False)
+                self.size -= len(dropped)
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    p50, p90, p99 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 90, 99]) * 1e3
+    return {'p50_ms': round(p50, 3), 'p90_ms': round(p90, 3), 'p99_ms': round(p99, 3),
+            'max_ms': round(max(values) * 1e3, 3)}
+
+
+class Metrics:
+    """Counts and timings of the requests served, for /metrics."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.started = time.time()
+        self.counts = Counter()
+        self._latency = {}      # endpoint -> recent request latencies (s)
+        self._compute = {}      # endpoint -> recent worker times of cache misses (s)
+        self._finished = deque()
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, outcome, seconds, compute_seconds=None):
+        """`outcome` is 'hit', 'miss', 'shared' (joined an identical request in progress) or 'error'."""
+        now = time.monotonic()
+        with self._lock:
+            self.counts['requests'] += 1
+            self.counts[f'{endpoint} {outcome}'] += 1
+            self._latency.setdefault(endpoint, deque(maxlen=self._window)).append(seconds)
+            if compute_seconds is not None:
+                self._compute.setdefault(endpoint, deque(maxlen=self._window)).append(compute_seconds)
+            self._finished.append(now)
+            while self._finished and self._finished[0] < now - THROUGHPUT_SECONDS:
+                self._finished.popleft()
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            recent = sum(1 for t in self._finished if t >= now - THROUGHPUT_SECONDS)
+            uptime = time.time() - self.started
+            endpoints = {}
+            for endpoint, latencies in self._latency.items():
+                counts = {outcome: self.counts[f'{endpoint} {outcome}'] for outcome in ('hit', 'miss', 'shared', 'error')}
+                served = counts['hit'] + counts['miss'] + counts['shared']
+                endpoints[endpoint] = {**counts,
+                                       'hit_rate': round((counts['hit'] + counts['shared']) / served, 4) if served else None,
+                                       'latency': _percentiles(latencies),
+                                       'compute': _percentiles(self._compute.get(endpoint, ()))}
+            return {'uptime_s': round(uptime, 1), 'requests': self.counts['requests'],
+                    'throughput_per_s': round(recent / min(THROUGHPUT_SECONDS, max(uptime, 1e-9)), 3),
+                    'endpoints': endpoints}
+
+
+class RenderService:
+    """
+    The worker pool, the result cache and the metrics. result() is safe to
+    call from many threads at once.
+    """
+
+    def __init__(self, workers=None, cache_bytes=DEFAULT_CACHE_MB * 2**20, size=DEFAULT_SIZE, dpi=DEFAULT_DPI):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker, initargs=(size, dpi))
+        self.cache = ResultCache(cache_bytes)
+        self.metrics = Metrics()
+        self._pending = {}     # key -> Future of a result being made
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Starts every worker and waits until they have all warmed up."""
+        futures = [self.executor.submit(_ready) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def result(self, kind, data, options, key=None):
+        """
+        The payload for a request, as (payload, outcome, compute seconds or
+        None). From the cache if it is there; otherwise made by a worker,
+        once, however many threads ask for it at the same time.
+        """
+        key = key or cache_key(kind, data, options)
+        payload = self.cache.get(key)
+        if payload is not None:
+            return payload, 'hit', None
+
+        with self._lock:
+            future = self._pending.get(key)
+            shared = future is not None
+            if not shared:
+                future = self.executor.submit(render_task, kind, data, options)
+                self._pending[key] = future
+        try:
+            payload, seconds = future.result()
+        finally:
+            with self._lock:
+                if self._pending.get(key) is future:
+                    del self._pending[key]
+        if shared:
+            return payload, 'shared', None
+        self.cache.put(key, payload)
+        return payload, 'miss', seconds
+
+    def stats(self):
+        stats = self.metrics.snapshot()
+        stats.update(workers=self.workers, cache_entries=len(self.cache),
+                     cache_mb=round(self.cache.size / 2**20, 3), cache_limit_mb=round(self.cache.max_bytes / 2**20, 3))
+        return stats
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    server_version = "HamiltonPlotterRender/1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload, content_type, headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status, value):
+        self._send(status, json.dumps(value).encode('utf-8'), 'application/json')
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/metrics':
+            self._send_json(200, self.service.stats())
+        elif path == '/health':
+            self._send(200, b'ok', 'text/plain')
+        else:
+            self._send_json(404, {'error': f"no such endpoint: {path}"})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        kind = url.path.strip('/')
+        if kind not in ('render', 'fit'):
+            self._send_json(404, {'error': f"no such endpoint: {url.path}"})
+            return
+
+        length = self.headers.get('Content-Length', '')
+        if not length.isdigit():
+            self._send_json(411, {'error': "send the data as the request body, with a Content-Length"})
+            return
+        if int(length) > self.server.max_body:
+            self._send_json(413, {'error': f"the data is larger than {self.server.max_body // 2**20} MB"})
+            self.close_connection = True
+            return
+        data = self.rfile.read(int(length))
+
+        try:
+            options = parse_options(kind, parse_qs(url.query, keep_blank_values=True))
+            key = cache_key(kind, data, options)
+            etag = f'"{key}"'
+            if self.headers.get('If-None-Match') == etag and self.service.cache.get(key) is not None:
+                self.service.metrics.record(kind, 'hit', time.perf_counter() - start)
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            payload, outcome, compute = self.service.result(kind, data, options, key)
+        except (RequestError, KeyError, ValueError) as e:
+            # Bad options, or data that can't be parsed or plotted.
+            self.service.metrics.record(kind, 'error', time.perf_counter() - start)
+            self._send_json(400, {'error': f"{type(e).__name__}: {e}" if not isinstance(e, RequestError) else str(e)})
+            return
+        except Exception as e:
+            self.service.metrics.record(kind, 'error', time.perf_counter() - start)
+            self._send_json(500, {'error': f"{type(e).__name__}: {e}"})
+            return
+
+        content_type = 'application/json' if kind == 'fit' else IMAGE_TYPES[options['format']]
+        timing = f"render;dur={compute * 1e3:.1f}" if compute is not None else f"cache;desc={outcome}"
+        self._send(200, payload, content_type,
+                   [('ETag', etag), ('X-Cache', outcome), ('Server-Timing', timing)])
+        self.service.metrics.record(kind, outcome, time.perf_counter() - start, compute)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve HamiltonPlotter plots and linear fits over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: this machine only).")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU).")
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_CACHE_MB,
+                        help=f"Memory for cached results (default: {DEFAULT_CACHE_MB} MB).")
+    parser.add_argument('--max-body-mb', type=float, default=DEFAULT_MAX_BODY_MB,
+                        help=f"Largest data accepted (default: {DEFAULT_MAX_BODY_MB} MB).")
+    parser.add_argument('--quiet', action='store_true', help="Don't log every request.")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    service = RenderService(workers=args.workers, cache_bytes=int(args.cache_mb * 2**20))
+    service.warm_up()
+    server = ThreadingHTTPServer((args.host, args.port), RenderHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.quiet = args.quiet
+    server.max_body = int(args.max_body_mb * 2**20)
+    print(f"Serving on http://{args.host}:{server.server_port} "
+          f"({service.workers} worker(s) ready in {time.perf_counter() - start:.1f} s)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
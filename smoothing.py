@@ -0,0 +1,170 @@
+"""
+Smoothing for spectra and other evenly sampled series.
+
+Every function takes a 1D series or a 2D stack (e.g. many spectra x
+wavelengths) and smooths along `axis` (default: the last) for all of them
+in one go. Edges are handled properly rather than padded with zeros or
+left out: the moving average and Gaussian average over the points that
+exist near an edge, and Savitzky-Golay fits its polynomial to the first
+and last windows. The moving average and Gaussian also skip NaNs.
+
+example usage:
+
+spectra = np.vstack([bright, dim])              # 2 x n_wavelengths
+smoothed = moving_average(spectra, 6)           # like rolling(6, center=True).mean(), but with edges
+smoothed = savgol(spectra, 11, polyorder=3)
+smoothed = smooth(spectra, 'Gaussian', 6)       # window = FWHM in points
+"""
+
+import numpy as np
+
+SMOOTHING_METHODS = ('Moving average', 'Savitzky-Golay', 'Gaussian')
+
+
+def _last_axis(Y, axis):
+    return np.moveaxis(np.asarray(Y, dtype=np.float64), axis, -1)
+
+
+def moving_average(Y, window, axis=-1, edges='shrink'):
+    """
+    Centered moving average over `window` points, from cumulative sums, so
+    it takes the same time for any window. Windows line up with pandas'
+    rolling(window, center=True). NaNs are left out of the average.
+
+    With edges='shrink' the first and last points average over the part of
+    the window that exists; with edges='nan' they (and any window with a NaN
+    in it) are NaN, exactly as rolling(window, center=True).mean() gives.
+    """
+    window = int(window)
+    if window < 1:
+        raise ValueError("window must be at least 1")
+    Y = _last_axis(Y, axis)
+    n = Y.shape[-1]
+    valid = ~np.isnan(Y)
+    # Sums are taken relative to each series' mean so long cumulative sums keep their precision.
+    with np.errstate(invalid='ignore'):
+        offset = np.where(valid.any(axis=-1, keepdims=True),
+                          np.nanmean(np.where(valid, Y, 0), axis=-1, keepdims=True), 0.0)
+    zeros = np.zeros(Y.shape[:-1] + (1,))
+    sums = np.concatenate([zeros, np.cumsum(np.where(valid, Y - offset, 0.0), axis=-1)], axis=-1)
+    counts = np.concatenate([zeros, np.cumsum(valid, axis=-1)], axis=-1)
+
+    i = np.arange(n)
+    lo = np.clip(i - window // 2, 0, n)
+    hi = np.clip(i + (window - 1) // 2 + 1, 0, n)
+    total = sums[..., hi] - sums[..., lo]
+    count = counts[..., hi] - counts[..., lo]
+    minimum = window if edges == 'nan' else 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = np.where(count >= minimum, total / count + offset, np.nan)
+    return np.moveaxis(out, -1, axis)
+
+
+# Kernels longer than this are applied through the FFT rather than a pass per tap.
+DIRECT_TAPS = 10
+
+
+def _correlate(Yp, kernel, n):
+    """
+    sum_j kernel[j] * Yp[..., i + j] for i < n. A short kernel takes one
+    vectorized pass per tap (O(n * taps)); a longer one is applied through
+    FFTs of blocks a few kernels long (overlap-add), O(n log taps). Memory
+    is O(n) either way, and a NaN makes every window it is in NaN.
+    """
+    taps = len(kernel)
+    if taps <= DIRECT_TAPS:
+        out = np.zeros(Yp.shape[:-1] + (n,))
+        for j, weight in enumerate(kernel):
+            out += weight * Yp[..., j:j + n]
+        return out
+
+    Yp = Yp[..., :n + taps - 1]
+    missing = np.isnan(Yp)
+    has_missing = missing.any()
+    Yp = np.where(missing, 0.0, Yp)
+    # Blocks of `step` points, each convolved whole in an FFT of `size`.
+    size = 1 << (4 * taps - 1).bit_length()
+    step = size - taps + 1
+    n_blocks = -(-Yp.shape[-1] // step)
+    blocks = np.zeros(Yp.shape[:-1] + (n_blocks * step,))
+    blocks[..., :Yp.shape[-1]] = Yp
+    blocks = blocks.reshape(Yp.shape[:-1] + (n_blocks, step))
+    pieces = np.fft.irfft(np.fft.rfft(blocks, size, axis=-1) * np.fft.rfft(kernel[::-1], size), size, axis=-1)
+    # Each block's convolution runs taps - 1 points into the next block: add those on.
+    full = pieces[..., :step].copy()
+    full[..., 1:, :taps - 1] += pieces[..., :-1, step:]
+    out = full.reshape(Yp.shape[:-1] + (n_blocks * step,))[..., taps - 1:taps - 1 + n]
+    if has_missing:
+        counts = np.concatenate([np.zeros(Yp.shape[:-1] + (1,)), np.cumsum(missing, axis=-1)], axis=-1)
+        out[counts[..., taps:taps + n] > counts[..., :n]] = np.nan
+    return out
+
+
+def gaussian(Y, sigma, axis=-1, truncate=4.0):
+    """
+    Gaussian-weighted average with standard deviation `sigma` points,
+    cut off at `truncate` sigmas. Near the edges and around NaNs the
+    weights of the points that exist are renormalized, so edges aren't
+    pulled toward zero.
+    """
+    if sigma <= 0:
+        raise ValueError("sigma must be positive")
+    Y = _last_axis(Y, axis)
+    n = Y.shape[-1]
+    radius = max(int(truncate * sigma + 0.5), 1)
+    t = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (t / sigma)**2)
+
+    valid = ~np.isnan(Y)
+    pad = [(0, 0)] * (Y.ndim - 1) + [(radius, radius)]
+    weighted = _correlate(np.pad(np.where(valid, Y, 0.0), pad), kernel, n)
+    weights = _correlate(np.pad(valid.astype(np.float64), pad), kernel, n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Any point in reach weighs at least kernel[0]; less than that is no point at all (or FFT rounding).
+        out = np.where(weights > kernel[0] / 2, weighted / weights, np.nan)
+    return np.moveaxis(out, -1, axis)
+
+
+def savgol(Y, window, polyorder=2, axis=-1):
+    """
+    Savitzky-Golay smoothing: each point becomes the value at its center of
+    a least-squares polynomial of degree `polyorder` through the `window`
+    (odd) points around it. The first and last window//2 points come from
+    the polynomials fitted to the first and last full windows (scipy's
+    mode='interp'). A NaN spreads to the windows containing it.
+    """
+    window = int(window)
+    if window % 2 == 0 or window < 1:
+        raise ValueError("Savitzky-Golay window must be a positive odd number")
+    if polyorder >= window:
+        raise ValueError("polyorder must be less than the window")
+    Y = _last_axis(Y, axis)
+    n = Y.shape[-1]
+    if n < window:
+        raise ValueError(f"Savitzky-Golay window ({window}) is longer than the data ({n})")
+    m = window // 2
+    A = np.vander(np.arange(-m, m + 1), polyorder + 1, increasing=True)
+    fit = np.linalg.pinv(A)   # polynomial coefficients from the points of a window
+
+    out = np.empty(Y.shape)
+    out[..., m:n - m] = _correlate(Y, fit[0], n - 2 * m)
+    out[..., :m] = (Y[..., :window] @ fit.T) @ A[:m].T
+    out[..., n - m:] = (Y[..., n - window:] @ fit.T) @ A[m + 1:].T
+    return np.moveaxis(out, -1, axis)
+
+
+def smooth(Y, method, window, axis=-1):
+    """
+    Smooths with one of SMOOTHING_METHODS, `window` points wide: the
+    averaging window, the Savitzky-Golay window (made odd if it isn't;
+    quadratic polynomials), or the full width at half maximum of the
+    Gaussian.
+    """
+    if method == 'Moving average':
+        return moving_average(Y, window, axis=axis)
+    if method == 'Savitzky-Golay':
+        window = int(window) | 1
+        return savgol(Y, window, polyorder=min(2, window - 1), axis=axis)
+    if method == 'Gaussian':
+        return gaussian(Y, window / (2 * np.sqrt(2 * np.log(2))), axis=axis)
+    raise ValueError(f"unknown smoothing method {method!r}; choose from {', '.join(SMOOTHING_METHODS)}")
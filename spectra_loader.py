@@ -0,0 +1,210 @@
+"""
+Bulk loading of OceanOptics spectrometer exports (.txt, tab-separated, with
+a text header), as read one at a time in the "plot with smoothing" notebook
+with pd.read_csv(file, header=12, sep='\\t').
+
+load_directory parses every file of a directory in parallel into one
+wavelength x file array, plus a table of the header fields of each file.
+The result is cached on local disk as memory-mapped .npy files, keyed by
+each file's name, size and modification time. Loading the directory again
+only parses the files that changed, and opens instantly when none did.
+
+example usage:
+
+spectra = load_directory(datafolder, pattern="FG_Subt2_*.txt")
+bright = spectra.spectrum("FG_Subt2_15-48-07-784.txt")
+df = spectra.to_frame()                    # wavelength index, one column per file
+spectra.metadata['Integration Time (usec)']
+"""
+
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Where caches go unless load_directory is told otherwise: local disk, since
+# the data itself usually sits on a network share.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'hamiltonplotter', 'spectra')
+
+_HEADER_FIELD = re.compile(r'^\s*([^:]+?)\s*:\s*(.*?)\s*$')
+
+
+def read_spectrum(path, header=12):
+    """
+    One OceanOptics export: returns (wavelengths, intensities, metadata).
+    Lines before the data that look like "Name: value" become the metadata
+    dict. The data is read as in the notebook, so `header` is the line that
+    read_csv treats as the column header; rows without numbers (such as the
+    ">>>>>End Processed Spectral Data<<<<<" trailer) are dropped.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    metadata = {}
+    for line in raw.split(b'\n', header + 1)[:header + 1]:
+        match = _HEADER_FIELD.match(line.decode('utf-8', errors='replace'))
+        if match:
+            metadata[match.group(1)] = match.group(2)
+
+    data = pd.read_csv(io.BytesIO(raw), header=header, sep='\t', index_col=False,
+                       names=["Wavelength (nm)", "Intensity"], usecols=[0, 1], encoding_errors='replace')
+    wavelengths = pd.to_numeric(data["Wavelength (nm)"], errors='coerce').to_numpy(dtype=np.float64)
+    intensities = pd.to_numeric(data["Intensity"], errors='coerce').to_numpy(dtype=np.float64)
+    keep = ~np.isnan(wavelengths)
+    return wavelengths[keep], intensities[keep], metadata
+
+
+def _read_spectrum_star(args):
+    path, header = args
+    try:
+        return read_spectrum(path, header)
+    except Exception as e:
+        return e
+
+
+class SpectraSet(namedtuple('SpectraSet', ['wavelengths', 'intensities', 'files', 'metadata'])):
+    """
+    Spectra of a directory. `intensities` is a (n_wavelengths, n_files)
+    array, memory-mapped from the cache, with one column per entry of
+    `files`; `metadata` has one row per file (its size, modification time
+    and header fields). Files whose wavelengths differ from the first
+    file's are interpolated onto them (NaN outside their range), and
+    flagged in metadata['resampled'].
+    """
+    __slots__ = ()
+
+    def spectrum(self, name):
+        """The intensities of one file, by file name."""
+        return self.intensities[:, self.files.index(name)]
+
+    def to_frame(self):
+        """A DataFrame like the notebook's, with a wavelength index and one column per file."""
+        return pd.DataFrame(self.intensities, index=pd.Index(self.wavelengths, name="Wavelength (nm)"),
+                            columns=self.files)
+
+
+def _list_files(directory, pattern):
+    """{name: (size, mtime_ns)} for the files in `directory` matching the glob `pattern`."""
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and fnmatch.fnmatch(entry.name, pattern):
+                stat = entry.stat()
+                files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return dict(sorted(files.items()))
+
+
+def _parse_all(paths, header, jobs):
+    tasks = [(path, header) for path in paths]
+    if jobs == 1 or len(tasks) <= 1:
+        return list(map(_read_spectrum_star, tasks))
+    workers = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        return list(executor.map(_read_spectrum_star, tasks, chunksize=chunksize))
+
+
+def load_directory(directory, pattern='*.txt', header=12, cache_dir=DEFAULT_CACHE_DIR, jobs=None, errors='raise'):
+    """
+    Loads every file in `directory` matching `pattern` into a SpectraSet,
+    parsing only files that are new or changed since the last call (all of
+    them the first time) in `jobs` worker processes (default: one per CPU).
+    Files that can't be parsed raise, or with errors='skip' are left out.
+    cache_dir=None keeps everything in memory and caches nothing.
+    """
+    listing = _list_files(directory, pattern)
+    if not listing:
+        raise FileNotFoundError(f"No files matching {pattern!r} in {directory}")
+
+    cache_path = None
+    cached = None
+    if cache_dir is not None:
+        key = json.dumps([os.path.abspath(directory), pattern, header])
+        cache_path = os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest()[:16])
+        cached = _open_cache(cache_path)
+
+    # Reuse the columns of files that haven't changed.
+    reused = {}
+    wavelengths = None
+    if cached is not None:
+        old, old_index = cached
+        wavelengths = old.wavelengths
+        for i, name in enumerate(old.files):
+            if name in listing and tuple(old_index[name]) == listing[name]:
+                reused[name] = i
+        if len(reused) == len(listing) == len(old.files):
+            return old
+
+    to_parse = [name for name in listing if name not in reused]
+    parsed = dict(zip(to_parse, _parse_all([os.path.join(directory, name) for name in to_parse], header, jobs)))
+    failed = [name for name, result in parsed.items() if isinstance(result, Exception)]
+    if failed and errors != 'skip':
+        raise ValueError(f"Could not parse {failed[0]}: {parsed[failed[0]]}")
+    files = [name for name in listing if name not in failed]
+    if not files:
+        raise ValueError(f"None of the files matching {pattern!r} in {directory} could be parsed")
+    if wavelengths is None:
+        wavelengths = parsed[files[0]][0]
+
+    shape = (len(wavelengths), len(files))
+    if cache_path is None:
+        intensities = np.empty(shape, order='F')
+    else:
+        os.makedirs(cache_path, exist_ok=True)
+        # Without an index the cache counts as missing, should this be interrupted.
+        if os.path.exists(os.path.join(cache_path, 'index.json')):
+            os.remove(os.path.join(cache_path, 'index.json'))
+        # Build the new array next to the old one; it replaces it only once complete.
+        intensities = np.lib.format.open_memmap(os.path.join(cache_path, 'intensities.tmp.npy'), mode='w+',
+                                                dtype=np.float64, shape=shape, fortran_order=True)
+    rows = []
+    for j, name in enumerate(files):
+        size, mtime_ns = listing[name]
+        if name in reused:
+            i = reused[name]
+            intensities[:, j] = old.intensities[:, i]
+            rows.append(old.metadata.iloc[i].to_dict())
+            continue
+        wl, values, header_fields = parsed[name]
+        resampled = len(wl) != len(wavelengths) or not np.array_equal(wl, wavelengths)
+        if resampled:
+            order = np.argsort(wl)
+            values = np.interp(wavelengths, wl[order], values[order], left=np.nan, right=np.nan)
+        intensities[:, j] = values
+        rows.append({'size': size, 'mtime_ns': mtime_ns, 'resampled': resampled, **header_fields})
+    metadata = pd.DataFrame(rows, index=pd.Index(files, name='file'))
+
+    if cache_path is None:
+        return SpectraSet(wavelengths, intensities, files, metadata)
+    intensities.flush()
+    # Let go of the old memory map too, so it can be replaced (Windows won't otherwise).
+    intensities = old = cached = None
+    np.save(os.path.join(cache_path, 'wavelengths.npy'), wavelengths)
+    os.replace(os.path.join(cache_path, 'intensities.tmp.npy'), os.path.join(cache_path, 'intensities.npy'))
+    metadata.reset_index().to_json(os.path.join(cache_path, 'metadata.json'), orient='records')
+    with open(os.path.join(cache_path, 'index.json'), 'w') as f:
+        json.dump({name: listing[name] for name in files}, f)
+    return _open_cache(cache_path)[0]
+
+
+def _open_cache(cache_path):
+    """The cached SpectraSet and its {file: (size, mtime_ns)} index, or None if there is no usable cache."""
+    try:
+        with open(os.path.join(cache_path, 'index.json')) as f:
+            index = json.load(f)
+        wavelengths = np.load(os.path.join(cache_path, 'wavelengths.npy'))
+        intensities = np.load(os.path.join(cache_path, 'intensities.npy'), mmap_mode='r')
+        metadata = pd.read_json(os.path.join(cache_path, 'metadata.json'), orient='records',
+                                dtype=False, convert_dates=False).set_index('file')
+    except (OSError, ValueError, KeyError):
+        return None
+    files = list(metadata.index)
+    if list(index) != files or intensities.shape != (len(wavelengths), len(files)):
+        return None
+    return SpectraSet(wavelengths, intensities, files, metadata), index
@@ -0,0 +1,188 @@
+"""
+Timing of the stages of HamiltonPlotter's actions (Load Data, Generate Plot,
+Perform Linear Fit): how long parsing, numeric coercion, artist creation,
+tight_layout, canvas.draw and so on took, for the status bar and for a
+trace of the whole session that chrome://tracing or https://ui.perfetto.dev
+can open.
+
+An action is started with StageTimer.action(name) and its stages are timed
+with `with timer.stage(name):` on the same thread while the action is
+current, or with `with action.stage(name):` from any thread (e.g. the load
+worker). Stages may nest; the action's summary lists the outermost ones.
+
+A StageTimer made with enabled=False hands out shared do-nothing objects,
+so the hooks cost one method call each and record nothing. Timing is on
+unless the environment variable HAMILTONPLOTTER_TIMING is 0.
+
+example usage:
+
+timer = StageTimer()
+with timer.action("Plot") as action:
+    with timer.stage("prepare series"):
+        ...
+    with timer.stage("canvas.draw"):
+        ...
+print(action.summary())       # Plot 182 ms: prepare series 3 ms, canvas.draw 150 ms
+timer.save_trace("session.json")
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+ENABLED = os.environ.get('HAMILTONPLOTTER_TIMING', '1') != '0'
+
+# Trace events kept; the oldest are dropped first, so a long live session stays bounded.
+MAX_EVENTS = 200000
+
+
+class _NullStage:
+    """The stage and action handed out while timing is off: does nothing, records nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def stage(self, name, **args):
+        return self
+
+    def finish(self):
+        return None
+
+    def summary(self):
+        return ""
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('timer', 'name', 'args', 'action', 'start')
+
+    def __init__(self, timer, name, args, action):
+        self.timer = timer
+        self.name = name
+        self.args = args
+        self.action = action
+
+    def __enter__(self):
+        if self.action is not None:
+            self.action._depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        category = 'stage'
+        if self.action is not None:
+            self.action._depth -= 1
+            if self.action._depth == 0:
+                self.action.stages.append((self.name, end - self.start))
+            category = self.action.name
+        self.timer._record(self.name, category, self.start, end, self.args)
+        return False
+
+
+class Action:
+    """One press of a button: its own span in the trace, and the stages that made it up."""
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.stages = []     # (name, seconds) of the outermost stages, in order
+        self._depth = 0
+
+    def stage(self, name, **args):
+        """Times a stage of this action, from any thread."""
+        return _Stage(self.timer, name, args, self)
+
+    def __enter__(self):
+        local = self.timer._local
+        if not hasattr(local, 'actions'):
+            local.actions = []
+        local.actions.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.timer._local.actions.remove(self)
+        self.finish()
+        return False
+
+    def finish(self):
+        """Ends the action (once) and records its span; returns its duration in seconds."""
+        if self.end is None:
+            self.end = time.perf_counter()
+            self.timer._record(self.name, 'action', self.start, self.end,
+                               {name: round(seconds * 1e3, 3) for name, seconds in self.stages})
+        return self.end - self.start
+
+    def summary(self):
+        """e.g. "Plot 182 ms: prepare series 3 ms, artists 24 ms, canvas.draw 150 ms"."""
+        total = (self.end or time.perf_counter()) - self.start
+        stages = ", ".join(f"{name} {format_duration(seconds)}" for name, seconds in self.stages)
+        return f"{self.name} {format_duration(total)}" + (f": {stages}" if stages else "")
+
+
+def format_duration(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.0f} ms"
+    return f"{seconds * 1e6:.0f} µs"
+
+
+class StageTimer:
+    """Hands out actions and stages, and keeps every timed span as a Chrome trace event."""
+
+    def __init__(self, enabled=None, max_events=MAX_EVENTS):
+        self.enabled = ENABLED if enabled is None else enabled
+        self._origin = time.perf_counter()
+        self._events = deque(maxlen=max_events)
+        self._threads = {}
+        self._local = threading.local()
+
+    def action(self, name):
+        """Starts an action. Use it as a context manager, or call finish() when it is done."""
+        if not self.enabled:
+            return NULL_STAGE
+        return Action(self, name)
+
+    def stage(self, name, **args):
+        """
+        Times a stage of the action current on this thread, or a stage on
+        its own if there is none. Keyword arguments end up in the trace.
+        """
+        if not self.enabled:
+            return NULL_STAGE
+        actions = getattr(self._local, 'actions', None)
+        return _Stage(self, name, args, actions[-1] if actions else None)
+
+    def _record(self, name, category, start, end, args):
+        thread = threading.current_thread()
+        self._threads[thread.ident] = thread.name
+        event = {'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': thread.ident,
+                 'ts': round((start - self._origin) * 1e6, 1), 'dur': round((end - start) * 1e6, 1)}
+        if args:
+            event['args'] = args
+        self._events.append(event)
+
+    def trace(self):
+        """The session so far in the Chrome trace event format, as a dict ready for json.dump."""
+        pid = os.getpid()
+        names = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in list(self._threads.items())]
+        return {'traceEvents': names + list(self._events), 'displayTimeUnit': 'ms'}
+
+    def save_trace(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.trace(), f)
+
+    def clear(self):
+        self._events.clear()
@@ -0,0 +1,37 @@
+"""Regression tests for derived_columns: run with python -m pytest."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from derived_columns import DerivedColumns, ExpressionError, UNCERTAINTY_SUFFIX
+from plotter_engine import NumericCache
+
+
+def _attached():
+    numeric = NumericCache(pd.DataFrame({'x': [1.0, 2.0, 4.0], 'dx': [0.1, 0.1, 0.2]}))
+    derived = DerivedColumns()
+    numeric.attach(derived)
+    return numeric, derived
+
+
+@pytest.mark.parametrize('expression, errors', [
+    ('v2 + 1', None),
+    ('`v2` * x', None),
+    ('x', {'x': 'v2' + UNCERTAINTY_SUFFIX}),
+])
+def test_first_definition_cannot_use_itself(expression, errors):
+    numeric, derived = _attached()
+    with pytest.raises(ExpressionError):
+        derived.define('v2', expression, errors)
+    assert 'v2' not in derived
+    assert derived.columns() == []
+
+
+def test_cycle_through_another_column_is_rejected():
+    numeric, derived = _attached()
+    derived.define('a', 'x + 1')
+    derived.define('b', 'a * 2')
+    with pytest.raises(ExpressionError):
+        derived.define('a', 'b - 1')
+    np.testing.assert_allclose(numeric.values('b'), [4.0, 6.0, 10.0])